@@ -0,0 +1,178 @@
+"""
+背离扫描模块
+把“股价下跌而PE-TTM上涨”这类条件表示为对齐序列上的布尔掩码，
+用向量化的游程编码找出连续满足条件的时间段，可一次扫描所有有估值数据的产品
+"""
+import sqlite3
+import numpy as np
+import pandas as pd
+from typing import List, Optional
+from common.constants import DB_PATH
+
+PERIOD_COLUMNS = [
+    'symbol', 'start_idx', 'end_idx', 'start_date', 'end_date', 'duration_days',
+    'start_price', 'end_price', 'start_signal', 'end_signal', 'price_change_pct', 'signal_change_pct'
+]
+
+
+def find_runs(mask: np.ndarray):
+    """
+    找出布尔数组中所有连续为True的游程
+
+    Args:
+        mask: 一维布尔数组
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: (每个游程的起始位置, 每个游程的长度)
+    """
+    padded = np.concatenate(([0], np.asarray(mask, dtype=np.int8), [0]))
+    edges = np.diff(padded)
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    return starts, ends - starts
+
+
+def direction_mask(values: np.ndarray, direction: int, group_start: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    逐日变化方向的布尔掩码，第i个元素表示第i天相对第i-1天是否按指定方向变化
+
+    Args:
+        values: 一维数值数组
+        direction: 1 表示上涨，-1 表示下跌
+        group_start: 每个产品第一行为True的布尔数组，这些行没有前一天，掩码为False
+
+    Returns:
+        np.ndarray: 与 values 等长的布尔数组
+    """
+    change = np.concatenate(([0.0], np.diff(values)))
+    mask = np.sign(change) == direction
+    mask[0] = False
+    if group_start is not None:
+        mask &= ~group_start
+    return mask
+
+
+def scan_divergence(panel: pd.DataFrame, price_col: str = 'close', signal_col: str = 'pe_ttm',
+                    min_days: int = 7, price_direction: int = -1, signal_direction: int = 1) -> pd.DataFrame:
+    """
+    在一个或多个产品的数据上一次性扫描背离时间段
+
+    某天满足条件是指当天相对前一天价格按 price_direction 变化且信号按 signal_direction 变化，
+    连续满足条件的若干天加上它们之前的一天构成一个时间段，时间段包含的天数不少于 min_days 时保留。
+
+    Args:
+        panel: 长格式数据，包含 symbol、trade_date、price_col、signal_col 列，
+            没有 symbol 列时视为单个产品
+        price_col: 价格列名
+        signal_col: 信号列名，如 pe_ttm
+        min_days: 时间段的最小天数
+        price_direction: 价格变化方向，1 表示上涨，-1 表示下跌
+        signal_direction: 信号变化方向，1 表示上涨，-1 表示下跌
+
+    Returns:
+        DataFrame: 每行一个时间段，列见 PERIOD_COLUMNS；start_idx/end_idx 为按 symbol、trade_date 排序后的行号
+    """
+    if 'symbol' not in panel.columns:
+        panel = panel.assign(symbol='')
+    panel = panel.sort_values(['symbol', 'trade_date'], kind='stable').reset_index(drop=True)
+
+    symbols = panel['symbol'].to_numpy()
+    group_start = np.concatenate(([True], symbols[1:] != symbols[:-1]))
+    prices = panel[price_col].to_numpy(dtype=float)
+    signals = panel[signal_col].to_numpy(dtype=float)
+
+    condition = (direction_mask(prices, price_direction, group_start)
+                 & direction_mask(signals, signal_direction, group_start))
+
+    # 每个产品的第一行条件恒为False，因此游程不会跨越产品
+    run_starts, run_lengths = find_runs(condition)
+    keep = run_lengths + 1 >= min_days
+    start_idx = run_starts[keep] - 1
+    end_idx = run_starts[keep] + run_lengths[keep] - 1
+
+    dates = panel['trade_date'].to_numpy()
+    return pd.DataFrame({
+        'symbol': symbols[start_idx],
+        'start_idx': start_idx,
+        'end_idx': end_idx,
+        'start_date': dates[start_idx],
+        'end_date': dates[end_idx],
+        'duration_days': end_idx - start_idx + 1,
+        'start_price': prices[start_idx],
+        'end_price': prices[end_idx],
+        'start_signal': signals[start_idx],
+        'end_signal': signals[end_idx],
+        'price_change_pct': (prices[end_idx] / prices[start_idx] - 1) * 100,
+        'signal_change_pct': (signals[end_idx] / signals[start_idx] - 1) * 100,
+    }, columns=PERIOD_COLUMNS)
+
+
+def scan_series_pair(price: pd.Series, signal: pd.Series, min_days: int = 7,
+                     price_direction: int = -1, signal_direction: int = 1) -> pd.DataFrame:
+    """
+    在任意两条以日期为索引的序列上扫描背离时间段，两条序列按共同日期对齐
+
+    Args:
+        price: 第一条序列（如收盘价）
+        signal: 第二条序列（如PE-TTM、另一个产品的收盘价）
+        其余参数同 scan_divergence
+
+    Returns:
+        DataFrame: 同 scan_divergence
+    """
+    aligned = pd.concat({'close': price, 'signal': signal}, axis=1, join='inner').dropna()
+    aligned = aligned.rename_axis('trade_date').reset_index()
+    return scan_divergence(aligned, 'close', 'signal', min_days, price_direction, signal_direction)
+
+
+def load_valuation_panel(symbols: Optional[List[str]] = None, start_date: Optional[str] = None,
+                         end_date: Optional[str] = None, db_path: str = DB_PATH) -> pd.DataFrame:
+    """
+    从数据库加载有估值数据的产品的收盘价和PE-TTM
+
+    Args:
+        symbols: 产品代码列表，默认为所有有PE-TTM数据的产品
+        start_date: 开始日期，格式为 'YYYY-MM-DD'，默认不限
+        end_date: 结束日期，格式为 'YYYY-MM-DD'，默认不限
+        db_path: 数据库路径
+
+    Returns:
+        DataFrame: 长格式数据，列为 symbol、trade_date、close、pe_ttm
+    """
+    query = """
+    SELECT symbol, trade_date, close, pe_ttm
+    FROM stock_price
+    WHERE pe_ttm IS NOT NULL
+        AND close IS NOT NULL
+    """
+    params = []
+    if symbols:
+        query += f" AND symbol IN ({','.join(['?'] * len(symbols))})"
+        params += list(symbols)
+    if start_date:
+        query += " AND trade_date >= ?"
+        params.append(start_date)
+    if end_date:
+        query += " AND trade_date <= ?"
+        params.append(end_date)
+    query += " ORDER BY symbol, trade_date"
+
+    conn = sqlite3.connect(db_path)
+    try:
+        panel = pd.read_sql_query(query, conn, params=params)
+    finally:
+        conn.close()
+    panel['trade_date'] = pd.to_datetime(panel['trade_date'])
+    return panel
+
+
+def scan_all_valuation_symbols(min_days: int = 7, price_direction: int = -1, signal_direction: int = 1,
+                               db_path: str = DB_PATH) -> pd.DataFrame:
+    """
+    一次扫描所有有PE-TTM数据的产品中价格与PE-TTM背离的时间段
+
+    Returns:
+        DataFrame: 同 scan_divergence
+    """
+    panel = load_valuation_panel(db_path=db_path)
+    return scan_divergence(panel, 'close', 'pe_ttm', min_days, price_direction, signal_direction)
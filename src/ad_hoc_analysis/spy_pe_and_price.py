@@ -4,6 +4,7 @@ import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
 from matplotlib.dates import MonthLocator, DateFormatter  # Add this import
+from data_manager.pe_ttm_rank_manager import load_pe_ttm_ranks
 
 # 连接数据库
 conn = sqlite3.connect('trade_data.db')  # 请替换为您的数据库文件路径
@@ -34,6 +35,13 @@ df['trade_date'] = pd.to_datetime(df['trade_date'])
 print(f"数据行数: {len(df)}")
 print(f"时间范围: {df['trade_date'].min()} 到 {df['trade_date'].max()}")
 
+# 读取已保存的PE-TTM百分位（由 pe_ttm_rank_manager 增量维护），不在脚本中重新计算
+pe_rank_all = load_pe_ttm_ranks('SPY', None, db_path='trade_data.db')
+pe_rank_10y = load_pe_ttm_ranks('SPY', 10, db_path='trade_data.db')
+df['pe_rank_all'] = df['trade_date'].map(pe_rank_all)
+df['pe_rank_10y'] = df['trade_date'].map(pe_rank_10y)
+print(f"最新PE-TTM百分位: 全部历史 {df['pe_rank_all'].iloc[-1]:.2%}, 最近10年 {df['pe_rank_10y'].iloc[-1]:.2%}")
+
 # 创建双轴图表
 fig, ax1 = plt.subplots(figsize=(14, 8))
 
@@ -57,7 +65,9 @@ line2 = ax2.plot(df['trade_date'], df['pe_ttm'], color=color2, linewidth=2, labe
 ax2.tick_params(axis='y', labelcolor=color2)
 
 # 设置标题
-plt.title(f'SPY股价与PE-TTM走势对比图 ({START_DATE} - {END_DATE})', fontsize=16, pad=20)
+plt.title(f'SPY股价与PE-TTM走势对比图 ({START_DATE} - {END_DATE})\n'
+          f'最新PE-TTM百分位: 全部历史 {df["pe_rank_all"].iloc[-1]:.2%}, 最近10年 {df["pe_rank_10y"].iloc[-1]:.2%}',
+          fontsize=16, pad=20)
 
 # 添加图例
 lines1, labels1 = ax1.get_legend_handles_labels()
@@ -3,6 +3,7 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import numpy as np
 from datetime import datetime, timedelta
+from ad_hoc_analysis.divergence_scanner import scan_divergence
 
 # 连接数据库
 conn = sqlite3.connect('trade_data.db')  # 请替换为您的数据库文件路径
@@ -39,80 +40,23 @@ def find_divergent_periods(df, min_days=7):
     返回:
     符合条件的时间段列表
     """
-    
-    # 计算移动平均来平滑数据（可选，避免单日波动的影响）
-    window = 3  # 3日移动平均
-    df['close_ma'] = df['close'].rolling(window=window, center=True).mean()
-    df['pe_ttm_ma'] = df['pe_ttm'].rolling(window=window, center=True).mean()
-    
-    # 使用原始数据或平滑数据
-    price_col = 'close'  # 或 'close_ma'
-    pe_col = 'pe_ttm'    # 或 'pe_ttm_ma'
+    periods = scan_divergence(df, price_col='close', signal_col='pe_ttm', min_days=min_days,
+                              price_direction=-1, signal_direction=1)
     
     divergent_periods = []
-    current_period_start = None
-    current_period_data = []
-    
-    for i in range(1, len(df)):
-        prev_price = df.iloc[i-1][price_col]
-        curr_price = df.iloc[i][price_col]
-        prev_pe = df.iloc[i-1][pe_col]
-        curr_pe = df.iloc[i][pe_col]
-        
-        # 检查是否满足条件：股价下跌且PE-TTM上涨
-        price_down = curr_price < prev_price
-        pe_up = curr_pe > prev_pe
-        
-        if price_down and pe_up:
-            if current_period_start is None:
-                current_period_start = i - 1
-                current_period_data = [i - 1, i]
-            else:
-                current_period_data.append(i)
-        else:
-            # 如果当前不满足条件，检查之前的连续期间是否足够长
-            if current_period_start is not None:
-                period_length = len(current_period_data)
-                if period_length >= min_days:
-                    start_idx = current_period_data[0]
-                    end_idx = current_period_data[-1]
-                    
-                    period_info = {
-                        'start_date': df.iloc[start_idx]['trade_date'],
-                        'end_date': df.iloc[end_idx]['trade_date'],
-                        'duration_days': period_length,
-                        'start_price': df.iloc[start_idx][price_col],
-                        'end_price': df.iloc[end_idx][price_col],
-                        'start_pe': df.iloc[start_idx][pe_col],
-                        'end_pe': df.iloc[end_idx][pe_col],
-                        'price_change_pct': ((df.iloc[end_idx][price_col] - df.iloc[start_idx][price_col]) / df.iloc[start_idx][price_col]) * 100,
-                        'pe_change_pct': ((df.iloc[end_idx][pe_col] - df.iloc[start_idx][pe_col]) / df.iloc[start_idx][pe_col]) * 100,
-                        'data_indices': current_period_data
-                    }
-                    divergent_periods.append(period_info)
-                
-                # 重置
-                current_period_start = None
-                current_period_data = []
-    
-    # 检查最后一个期间
-    if current_period_start is not None and len(current_period_data) >= min_days:
-        start_idx = current_period_data[0]
-        end_idx = current_period_data[-1]
-        
-        period_info = {
-            'start_date': df.iloc[start_idx]['trade_date'],
-            'end_date': df.iloc[end_idx]['trade_date'],
-            'duration_days': len(current_period_data),
-            'start_price': df.iloc[start_idx][price_col],
-            'end_price': df.iloc[end_idx][price_col],
-            'start_pe': df.iloc[start_idx][pe_col],
-            'end_pe': df.iloc[end_idx][pe_col],
-            'price_change_pct': ((df.iloc[end_idx][price_col] - df.iloc[start_idx][price_col]) / df.iloc[start_idx][price_col]) * 100,
-            'pe_change_pct': ((df.iloc[end_idx][pe_col] - df.iloc[start_idx][pe_col]) / df.iloc[start_idx][pe_col]) * 100,
-            'data_indices': current_period_data
-        }
-        divergent_periods.append(period_info)
+    for period in periods.itertuples(index=False):
+        divergent_periods.append({
+            'start_date': pd.Timestamp(period.start_date),
+            'end_date': pd.Timestamp(period.end_date),
+            'duration_days': int(period.duration_days),
+            'start_price': period.start_price,
+            'end_price': period.end_price,
+            'start_pe': period.start_signal,
+            'end_pe': period.end_signal,
+            'price_change_pct': period.price_change_pct,
+            'pe_change_pct': period.signal_change_pct,
+            'data_indices': list(range(period.start_idx, period.end_idx + 1))
+        })
     
     return divergent_periods
 
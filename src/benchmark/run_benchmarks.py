@@ -0,0 +1,303 @@
+"""
+基准测试脚本
+在合成行情数据库上测量主要热点路径的耗时，结果写入JSON文件，并与保存的基线比较以发现性能退化
+
+测试项：
+- DataLoader.load_portfolio_data：4个资产的组合和全部资产
+- PortfolioBacktest.run_backtest：三种再平衡策略（含数据加载）
+- PortfolioAnalyzer：收益率、全部指标、最大回撤、滚动指标
+- ReturnIndex.window_returns：一次计算100万个5年区间的收益率
+- DrawdownIndex.max_drawdowns：同样100万个区间的最大回撤
+- 行情入库：insert_stock_price_rows / insert_fund_nav_rows 写入一个空数据库
+
+使用方法：
+    # 生成数据库并运行，结果保存为基线
+    python -m benchmark.run_benchmarks --assets 40 --years 20 --save-baseline
+    # 之后的运行与基线比较，中位数耗时超过基线 (1+tolerance) 倍时以退出码1结束
+    python -m benchmark.run_benchmarks --assets 40 --years 20 --tolerance 0.2
+"""
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Callable, Dict, Optional
+import numpy as np
+import pandas as pd
+
+BENCHMARK_DIR = os.path.dirname(__file__)
+DEFAULT_BASELINE = os.path.join(BENCHMARK_DIR, 'baseline.json')
+
+# 回测使用的组合，与 portfolio/experiments/rebalance_strategies.yaml 相同
+BACKTEST_PORTFOLIO = {'SPY': 0.2, '090010': 0.2, '518880': 0.2, '070009': 0.4}
+BACKTEST_STRATEGIES = {
+    'NO_REBALANCE': {},
+    'ANNUAL_REBALANCE': {},
+    'DRIFT_REBALANCE': {'drift_threshold': 0.2},
+}
+
+# 入库测试每次写入的行数
+INGESTION_ROWS = 5000
+
+# 累计收益指数测试的区间数量
+WINDOW_QUERIES = 1_000_000
+
+
+def time_call(func: Callable, repeat: int, setup: Optional[Callable] = None) -> Dict:
+    """
+    重复执行 func 并统计耗时
+
+    Args:
+        func: 被测函数，接收 setup 的返回值（没有 setup 时不接收参数）
+        repeat: 重复次数
+        setup: 每次执行前调用的准备函数，不计入耗时
+
+    Returns:
+        Dict: 包含 repeat、min、median、mean（秒）
+    """
+    timings = []
+    for _ in range(repeat):
+        args = (setup(),) if setup else ()
+        start = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - start)
+    return {
+        'repeat': repeat,
+        'min': min(timings),
+        'median': statistics.median(timings),
+        'mean': statistics.fmean(timings),
+    }
+
+
+def _db_stats(db_path: str) -> Dict:
+    conn = sqlite3.connect(db_path)
+    try:
+        stock_rows, stock_symbols = conn.execute('SELECT COUNT(*), COUNT(DISTINCT symbol) FROM stock_price').fetchone()
+        fund_rows, fund_symbols = conn.execute('SELECT COUNT(*), COUNT(DISTINCT fund_code) FROM fund_nav').fetchone()
+        start_date, end_date = conn.execute('SELECT MIN(date), MAX(date) FROM unified_price_view').fetchone()
+        symbols = [row[0] for row in conn.execute('SELECT DISTINCT symbol FROM unified_price_view ORDER BY symbol')]
+    finally:
+        conn.close()
+    return {
+        'assets': stock_symbols + fund_symbols,
+        'stock_price_rows': stock_rows,
+        'fund_nav_rows': fund_rows,
+        'start_date': start_date,
+        'end_date': end_date,
+        'symbols': symbols,
+    }
+
+
+def _ingestion_frames(rng: np.random.Generator):
+    dates = pd.bdate_range('2000-01-03', periods=INGESTION_ROWS)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, INGESTION_ROWS)))
+    hist_df = pd.DataFrame({
+        '日期': dates.strftime('%Y-%m-%d'),
+        '开盘': close, '收盘': close, '最高': close, '最低': close,
+        '成交量': rng.integers(100000, 10000000, INGESTION_ROWS),
+        '成交额': close * 1e6, '振幅': 0.0, '涨跌幅': 0.0, '涨跌额': 0.0, '换手率': 0.0,
+    })
+    fund_nav_df = pd.DataFrame({'净值日期': dates.date, '累计净值': close})
+    return hist_df, fund_nav_df
+
+
+def run_benchmarks(db_path: str, repeat: int = 5) -> Dict:
+    """
+    在指定数据库上运行全部基准测试
+
+    Args:
+        db_path: 行情数据库路径
+        repeat: 每个测试的重复次数
+
+    Returns:
+        Dict: 包含 meta（环境和数据规模）与 results（每个测试的耗时统计）
+    """
+    from benchmark.synthetic_db import load_schema
+    from data_manager.market_data_manager import insert_stock_price_rows, insert_fund_nav_rows
+    from portfolio.data_loader import DataLoader
+    from portfolio.portfolio_backtest import PortfolioBacktest
+    from portfolio.portfolio_analyzer import PortfolioAnalyzer
+    from data_manager.return_index_manager import ReturnIndex, update_return_index
+    from data_manager.range_index import DrawdownIndex
+
+    stats = _db_stats(db_path)
+    all_symbols = stats.pop('symbols')
+    loader = DataLoader(db_path)
+    start_date, end_date = stats['start_date'], stats['end_date']
+    results = {}
+
+    # 数据加载
+    portfolio_symbols = list(BACKTEST_PORTFOLIO)
+    results['load_portfolio_data[portfolio]'] = time_call(
+        lambda: loader.load_portfolio_data(portfolio_symbols, start_date, end_date), repeat)
+    results['load_portfolio_data[all_assets]'] = time_call(
+        lambda: loader.load_portfolio_data(all_symbols, start_date, end_date), repeat)
+
+    # 回测
+    backtest_results = None
+    for strategy, extra in BACKTEST_STRATEGIES.items():
+        config = {
+            'target_percentage': BACKTEST_PORTFOLIO,
+            'start_date': start_date,
+            'end_date': end_date,
+            'initial_total_value': 100000,
+            'rebalance_strategy': strategy,
+            **extra,
+        }
+        results[f'run_backtest[{strategy}]'] = time_call(
+            lambda backtest: backtest.run_backtest(), repeat,
+            setup=lambda: PortfolioBacktest(config, DataLoader(db_path)))
+        if backtest_results is None:
+            backtest = PortfolioBacktest(config, DataLoader(db_path))
+            backtest.run_backtest()
+            backtest_results = backtest.get_results()
+
+    # 按月模拟的年度再平衡，与日线的 run_backtest[ANNUAL_REBALANCE] 对比
+    monthly_config = {**config, 'rebalance_strategy': 'ANNUAL_REBALANCE', 'frequency': 'M'}
+    results['run_backtest[ANNUAL_REBALANCE@M]'] = time_call(
+        lambda backtest: backtest.run_backtest(), repeat,
+        setup=lambda: PortfolioBacktest(monthly_config, DataLoader(db_path)))
+
+    # 分析
+    analyzer = PortfolioAnalyzer(backtest_results)
+    results['analyzer.calculate_portfolio_return'] = time_call(analyzer.calculate_portfolio_return, repeat)
+    results['analyzer.calculate_asset_return'] = time_call(analyzer.calculate_asset_return, repeat)
+    results['analyzer.compute_all_metrics'] = time_call(analyzer.compute_all_metrics, repeat)
+    results['analyzer.calculate_portfolio_max_drawdown'] = time_call(analyzer.calculate_portfolio_max_drawdown, repeat)
+    results['analyzer.calculate_rolling_metrics'] = time_call(analyzer.calculate_rolling_metrics, repeat)
+
+    # 累计收益指数：随机起点的5年区间
+    update_return_index(portfolio_symbols, db_path=db_path)
+    return_index = ReturnIndex(db_path)
+    window_days = pd.date_range(start_date, end_date).values
+    starts = np.random.default_rng(0).choice(window_days, WINDOW_QUERIES)
+    ends = starts + np.timedelta64(5 * 365, 'D')
+    results[f'return_index.window_returns[{WINDOW_QUERIES}]'] = time_call(
+        lambda: return_index.window_returns(portfolio_symbols[0], starts, ends), repeat)
+    drawdown_index = DrawdownIndex(db_path)
+    drawdown_index.max_drawdowns(portfolio_symbols[0], starts[:1], ends[:1])
+    results[f'drawdown_index.max_drawdowns[{WINDOW_QUERIES}]'] = time_call(
+        lambda: drawdown_index.max_drawdowns(portfolio_symbols[0], starts, ends), repeat)
+
+    # 入库：每次写入一个新建的空数据库
+    hist_df, fund_nav_df = _ingestion_frames(np.random.default_rng(0))
+    schema = load_schema()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        counter = iter(range(4 * repeat))
+
+        def empty_db():
+            conn = sqlite3.connect(os.path.join(tmp_dir, f'ingest_{next(counter)}.db'))
+            conn.executescript(schema)
+            return conn
+
+        def ingest(insert, frame):
+            def run(conn):
+                insert(conn.cursor(), 'BENCH', '基准测试', frame)
+                conn.commit()
+                conn.close()
+            return run
+
+        results[f'insert_stock_price_rows[{INGESTION_ROWS}]'] = time_call(
+            ingest(insert_stock_price_rows, hist_df), repeat, setup=empty_db)
+        results[f'insert_fund_nav_rows[{INGESTION_ROWS}]'] = time_call(
+            ingest(insert_fund_nav_rows, fund_nav_df), repeat, setup=empty_db)
+
+    return {
+        'meta': {
+            'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'machine': platform.machine(),
+            'cpu_count': os.cpu_count(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'db': stats,
+        },
+        'results': results,
+    }
+
+
+def compare_with_baseline(report: Dict, baseline: Dict, tolerance: float = 0.2) -> Dict:
+    """
+    比较本次结果与基线的中位数耗时
+
+    Args:
+        report: run_benchmarks 的结果
+        baseline: 基线结果，格式同 report
+        tolerance: 允许的变慢比例，超过 (1+tolerance) 倍视为退化
+
+    Returns:
+        Dict: 测试名到 {baseline, current, ratio, regressed} 的映射，只包含两边都有的测试
+    """
+    comparison = {}
+    for name, current in report['results'].items():
+        if name not in baseline.get('results', {}):
+            continue
+        base = baseline['results'][name]['median']
+        ratio = current['median'] / base if base > 0 else float('inf')
+        comparison[name] = {
+            'baseline': base,
+            'current': current['median'],
+            'ratio': ratio,
+            'regressed': ratio > 1 + tolerance,
+        }
+    return comparison
+
+
+def print_report(report: Dict, comparison: Optional[Dict] = None) -> None:
+    db = report['meta']['db']
+    print(f"数据规模：{db['assets']} 个资产，{db['start_date']} ~ {db['end_date']}，"
+          f"stock_price {db['stock_price_rows']} 行，fund_nav {db['fund_nav_rows']} 行")
+    print(f"{'测试项':<48}{'中位数(ms)':>12}{'基线(ms)':>12}{'比值':>8}")
+    for name, result in report['results'].items():
+        line = f"{name:<50}{result['median'] * 1000:>12.2f}"
+        if comparison and name in comparison:
+            item = comparison[name]
+            flag = '  退化' if item['regressed'] else ''
+            line += f"{item['baseline'] * 1000:>12.2f}{item['ratio']:>8.2f}{flag}"
+        print(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='运行基准测试')
+    parser.add_argument('--db', help='已有的行情数据库路径，不提供时生成合成数据库')
+    parser.add_argument('--assets', type=int, default=20, help='合成数据库的资产数量')
+    parser.add_argument('--years', type=int, default=20, help='合成数据库的历史年数')
+    parser.add_argument('--repeat', type=int, default=5, help='每个测试的重复次数')
+    parser.add_argument('--output', default='benchmark_results.json', help='结果输出路径')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='基线文件路径')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='允许的变慢比例')
+    parser.add_argument('--save-baseline', action='store_true', help='把本次结果保存为基线')
+    args = parser.parse_args()
+
+    db_path = args.db
+    if not db_path:
+        from benchmark.synthetic_db import generate_synthetic_db
+        db_path = os.path.join(tempfile.gettempdir(), f'synthetic_trade_data_{args.assets}x{args.years}.db')
+        generate_synthetic_db(db_path, args.assets, args.years)
+
+    report = run_benchmarks(db_path, args.repeat)
+
+    comparison = None
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            comparison = compare_with_baseline(report, json.load(f), args.tolerance)
+        report['comparison'] = comparison
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print_report(report, comparison)
+    print(f"结果已保存到 {args.output}")
+
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"基线已保存到 {args.baseline}")
+    elif comparison and any(item['regressed'] for item in comparison.values()):
+        print("存在性能退化")
+        sys.exit(1)
@@ -0,0 +1,163 @@
+"""
+合成行情数据库生成模块
+离线生成与 trade_data.db 结构相同的数据库，用于基准测试和评估硬件规模
+
+- 表结构直接取自 data_manager/schema.sql 的全部建表语句（不含修正真实数据的 UPDATE 语句）
+- 总是包含 TRADING_PRODUCTS 中的全部产品，使回测配置可以直接使用真实代码；
+  资产数量更多时再补充 SYN0001 形式的合成股票和基金
+- 美股按工作日交易，A股和基金随机剔除约3%的工作日模拟节假日，交易日历互不相同
+- SPY 附带PE-TTM序列，供估值相关的路径使用
+
+使用方法：
+    python -m benchmark.synthetic_db bench.db --assets 50 --years 20
+"""
+import argparse
+import os
+import sqlite3
+from typing import Dict, List
+import numpy as np
+import pandas as pd
+from common.trading_products import TRADING_PRODUCTS
+from data_manager.price_aggregate_manager import update_price_aggregates
+from data_manager.return_index_manager import update_return_index
+
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data_manager', 'schema.sql')
+
+# 合成数据的最后一个交易日，固定下来使每次生成的数据完全相同
+END_DATE = '2025-06-30'
+
+FUND_CATEGORIES = ('stock_fund', 'bond_fund', 'money_fund')
+
+
+def load_schema() -> str:
+    """读取 schema.sql 的全部建表、建索引和建视图语句，只去掉 '-- 更新错误数据' 之后修正真实数据的 UPDATE 语句"""
+    with open(SCHEMA_PATH, 'r', encoding='utf-8') as f:
+        lines = f.read().splitlines()
+    kept = []
+    in_data_fix = False
+    for line in lines:
+        if line.startswith('-- 更新错误数据'):
+            in_data_fix = True
+            continue
+        # 修正数据的语句块到空行为止
+        if in_data_fix and line.strip() and line.lstrip().upper().startswith('UPDATE'):
+            continue
+        in_data_fix = False
+        kept.append(line)
+    return '\n'.join(kept) + '\n'
+
+
+
+def build_universe(n_assets: int) -> List[Dict]:
+    """
+    生成资产列表，总是包含 TRADING_PRODUCTS 中的全部产品，不足 n_assets 时交替补充合成股票和基金
+
+    Returns:
+        List[Dict]: 每个资产包含 symbol、name、market、category
+    """
+    universe = [
+        {'symbol': symbol, 'name': info['name'], 'market': info['market'], 'category': info['category']}
+        for symbol, info in TRADING_PRODUCTS.items()
+    ]
+    for i in range(len(universe), n_assets):
+        is_fund = i % 2 == 1
+        universe.append({
+            'symbol': f"SYN{i:04d}",
+            'name': f"合成{'基金' if is_fund else '股票'}{i:04d}",
+            'market': 'CN' if is_fund or i % 4 == 0 else 'US',
+            'category': 'stock_fund' if is_fund else 'stock',
+        })
+    return universe
+
+
+def _trading_dates(all_dates: pd.DatetimeIndex, market: str, rng: np.random.Generator) -> pd.DatetimeIndex:
+    if market == 'US':
+        return all_dates
+    return all_dates[rng.random(len(all_dates)) > 0.03]
+
+
+def _price_path(n: int, category: str, rng: np.random.Generator) -> np.ndarray:
+    if category in ('bond_fund', 'money_fund'):
+        drift, vol = 0.00012, 0.001
+    else:
+        drift, vol = 0.0003, 0.013
+    return 100 * np.exp(np.cumsum(rng.normal(drift, vol, n)))
+
+
+def generate_synthetic_db(db_path: str, n_assets: int = 20, years: int = 20, seed: int = 0) -> Dict:
+    """
+    生成合成行情数据库，已存在的文件会被覆盖
+
+    Args:
+        db_path: 数据库路径
+        n_assets: 资产数量，少于 TRADING_PRODUCTS 中的产品数时按产品数生成
+        years: 每个资产的历史年数
+        seed: 随机数种子
+
+    Returns:
+        Dict: 生成结果统计，包含 assets、years、stock_price_rows、fund_nav_rows
+    """
+    if os.path.exists(db_path):
+        os.remove(db_path)
+
+    rng = np.random.default_rng(seed)
+    end = pd.Timestamp(END_DATE)
+    all_dates = pd.bdate_range(end - pd.DateOffset(years=years), end)
+
+    conn = sqlite3.connect(db_path)
+    universe = build_universe(n_assets)
+    stock_rows = fund_rows = 0
+    try:
+        conn.executescript(load_schema())
+        for asset in universe:
+            dates = _trading_dates(all_dates, asset['market'], rng)
+            closes = _price_path(len(dates), asset['category'], rng)
+            date_strings = dates.strftime('%Y-%m-%d')
+
+            if asset['category'] in FUND_CATEGORIES:
+                conn.executemany(
+                    'INSERT INTO fund_nav (fund_code, name, nav_date, nav) VALUES (?, ?, ?, ?)',
+                    [(asset['symbol'], asset['name'], d, round(float(c), 4)) for d, c in zip(date_strings, closes)]
+                )
+                fund_rows += len(dates)
+                continue
+
+            opens = closes * (1 + rng.normal(0, 0.003, len(dates)))
+            highs = np.maximum(opens, closes) * (1 + np.abs(rng.normal(0, 0.004, len(dates))))
+            lows = np.minimum(opens, closes) * (1 - np.abs(rng.normal(0, 0.004, len(dates))))
+            volumes = rng.integers(100000, 10000000, len(dates))
+            if asset['symbol'] == 'SPY':
+                pe_ttm = np.round(20 * np.exp(np.cumsum(rng.normal(0, 0.01, len(dates)))), 2)
+            else:
+                pe_ttm = [None] * len(dates)
+
+            conn.executemany('''
+                INSERT INTO stock_price (symbol, name, trade_date, open, close, high, low, volume, pe_ttm)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', [
+                (asset['symbol'], asset['name'], d, round(float(o), 3), round(float(c), 3),
+                 round(float(h), 3), round(float(l), 3), int(v), None if e is None else float(e))
+                for d, o, c, h, l, v, e in zip(date_strings, opens, closes, highs, lows, volumes, pe_ttm)
+            ])
+            stock_rows += len(dates)
+        conn.commit()
+    finally:
+        conn.close()
+
+    # 与入库流程相同，生成周线/月线聚合和累计收益指数
+    update_price_aggregates(db_path=db_path)
+    update_return_index(db_path=db_path)
+    return {'assets': len(universe), 'years': years, 'stock_price_rows': stock_rows, 'fund_nav_rows': fund_rows}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='生成合成行情数据库')
+    parser.add_argument('db_path', help='数据库路径')
+    parser.add_argument('--assets', type=int, default=20, help='资产数量')
+    parser.add_argument('--years', type=int, default=20, help='历史年数')
+    parser.add_argument('--seed', type=int, default=0, help='随机数种子')
+    args = parser.parse_args()
+
+    stats = generate_synthetic_db(args.db_path, args.assets, args.years, args.seed)
+    print(f"已生成 {args.db_path}：{stats['assets']} 个资产，{stats['years']} 年，"
+          f"stock_price {stats['stock_price_rows']} 行，fund_nav {stats['fund_nav_rows']} 行")
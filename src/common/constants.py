@@ -1,2 +1,11 @@
-DB_PATH = "D:\\my-trade\\trade_data.db"
-PROJECT_ROOT = "D:\\my-trade"
\ No newline at end of file
+import os
+
+# 可通过环境变量 MY_TRADE_DB_PATH 指定其他数据库，如基准测试生成的合成数据库
+DB_PATH = os.environ.get('MY_TRADE_DB_PATH', "D:\\my-trade\\trade_data.db")
+PROJECT_ROOT = "D:\\my-trade"
+
+# 分钟线数据目录（按产品、按月分区存储，见 data_manager/intraday_store.py），可通过环境变量 MY_TRADE_INTRADAY_DIR 指定
+INTRADAY_DIR = os.environ.get('MY_TRADE_INTRADAY_DIR', "D:\\my-trade\\intraday")
+
+# 回测结果库（见 portfolio/results_store.py），可通过环境变量 MY_TRADE_RESULTS_DB_PATH 指定
+RESULTS_DB_PATH = os.environ.get('MY_TRADE_RESULTS_DB_PATH', "D:\\my-trade\\backtest_results.db")
@@ -0,0 +1,195 @@
+"""
+性能剖析模块
+提供计时和内存区段（上下文管理器 profile_span 与装饰器 profiled），统计每个阶段的耗时、调用次数和内存峰值
+
+设置环境变量 MY_TRADE_PROFILE=1 后开启，进程退出时输出：
+- <输出路径>.json：每个调用栈路径的调用次数、总耗时、自身耗时和 tracemalloc 内存峰值
+- <输出路径>.folded：折叠调用栈格式（每行 "a;b;c 自身耗时微秒"），可直接交给 flamegraph.pl 或 speedscope
+输出路径由 MY_TRADE_PROFILE_OUTPUT 指定，默认为当前目录下的 my_trade_profile。
+tracemalloc 会使Python代码明显变慢，只关心耗时时可设置 MY_TRADE_PROFILE_MEMORY=0 关闭内存统计。
+
+未开启时 profiled 直接返回原函数，profile_span 返回共享的空上下文，不产生额外开销。
+环境变量需要在导入被剖析的模块之前设置；只统计当前进程，进程池中的子进程不会汇总进来。
+
+使用方法：
+    @profiled('DataLoader.load_portfolio_data')
+    def load_portfolio_data(...):
+        with profile_span('query'):
+            ...
+"""
+import atexit
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import nullcontext
+from typing import Callable, Dict, Optional, Tuple
+
+PROFILE_ENV = 'MY_TRADE_PROFILE'
+PROFILE_OUTPUT_ENV = 'MY_TRADE_PROFILE_OUTPUT'
+PROFILE_MEMORY_ENV = 'MY_TRADE_PROFILE_MEMORY'
+DEFAULT_OUTPUT = 'my_trade_profile'
+
+
+def _env_flag(name: str, default: str) -> bool:
+    return os.environ.get(name, default).strip().lower() not in ('', '0', 'false', 'no')
+
+
+_enabled = _env_flag(PROFILE_ENV, '')
+_track_memory = _enabled and _env_flag(PROFILE_MEMORY_ENV, '1')
+_null_span = nullcontext()
+_lock = threading.Lock()
+_local = threading.local()
+
+# 调用栈路径 -> [调用次数, 总耗时, 子区段耗时, 内存峰值]
+_stats: Dict[Tuple[str, ...], list] = {}
+
+
+def is_enabled() -> bool:
+    """是否开启了性能剖析"""
+    return _enabled
+
+
+class _Span:
+    __slots__ = ('name', 'path', 'start', 'start_memory', 'peak_memory', 'child_time')
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        stack = getattr(_local, 'stack', None)
+        if stack is None:
+            stack = _local.stack = []
+        parent = stack[-1] if stack else None
+        self.path = (parent.path if parent else ()) + (self.name,)
+
+        current, peak = tracemalloc.get_traced_memory() if _track_memory else (0, 0)
+        if parent:
+            # 进入子区段前记下父区段目前的峰值，再重置峰值单独统计子区段
+            parent.peak_memory = max(parent.peak_memory, peak)
+        if _track_memory:
+            tracemalloc.reset_peak()
+        self.start_memory = current
+        self.peak_memory = current
+        self.child_time = 0.0
+        stack.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.start
+        stack = _local.stack
+        stack.pop()
+        peak = max(self.peak_memory, tracemalloc.get_traced_memory()[1]) if _track_memory else 0
+        if stack:
+            parent = stack[-1]
+            parent.child_time += elapsed
+            parent.peak_memory = max(parent.peak_memory, peak)
+
+        with _lock:
+            record = _stats.setdefault(self.path, [0, 0.0, 0.0, 0])
+            record[0] += 1
+            record[1] += elapsed
+            record[2] += self.child_time
+            record[3] = max(record[3], peak - self.start_memory)
+        return False
+
+
+def profile_span(name: str):
+    """
+    计时和内存区段
+
+    Args:
+        name: 区段名称，嵌套的区段按调用栈路径分别统计
+
+    Returns:
+        上下文管理器，未开启剖析时为共享的空上下文
+    """
+    if not _enabled:
+        return _null_span
+    return _Span(name)
+
+
+def profiled(name: Optional[str] = None) -> Callable:
+    """
+    把整个函数作为一个区段统计的装饰器
+
+    Args:
+        name: 区段名称，默认为函数的 __qualname__
+
+    Returns:
+        装饰器，未开启剖析时原样返回被装饰的函数
+    """
+    def decorator(func: Callable) -> Callable:
+        if not _enabled:
+            return func
+        span_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with _Span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def get_profile() -> Dict:
+    """
+    汇总当前进程的剖析结果
+
+    Returns:
+        Dict: stages 为按总耗时降序排列的列表，每项包含 stack、name、calls、
+            wall_time、self_time（秒）和 peak_memory（字节，关闭内存统计时为0）
+    """
+    with _lock:
+        items = [(path, list(record)) for path, record in _stats.items()]
+    stages = [{
+        'stack': ';'.join(path),
+        'name': path[-1],
+        'calls': calls,
+        'wall_time': wall_time,
+        'self_time': max(wall_time - child_time, 0.0),
+        'peak_memory': peak_memory,
+    } for path, (calls, wall_time, child_time, peak_memory) in items]
+    stages.sort(key=lambda stage: stage['wall_time'], reverse=True)
+    return {'pid': os.getpid(), 'stages': stages}
+
+
+def reset_profile() -> None:
+    """清空已统计的结果"""
+    with _lock:
+        _stats.clear()
+
+
+def write_profile(output: Optional[str] = None) -> Optional[str]:
+    """
+    把剖析结果写入 JSON 和折叠调用栈文件
+
+    Args:
+        output: 输出路径（不含扩展名），默认为 MY_TRADE_PROFILE_OUTPUT 或 my_trade_profile
+
+    Returns:
+        str: JSON 文件路径，没有任何统计结果时不写文件并返回 None
+    """
+    profile = get_profile()
+    if not profile['stages']:
+        return None
+    output = output or os.environ.get(PROFILE_OUTPUT_ENV) or DEFAULT_OUTPUT
+
+    json_path = f"{output}.json"
+    with open(json_path, 'w', encoding='utf-8') as f:
+        json.dump(profile, f, ensure_ascii=False, indent=2)
+    with open(f"{output}.folded", 'w', encoding='utf-8') as f:
+        for stage in profile['stages']:
+            self_us = int(round(stage['self_time'] * 1e6))
+            if self_us > 0:
+                f.write(f"{stage['stack']} {self_us}\n")
+    return json_path
+
+
+if _enabled:
+    if _track_memory:
+        import tracemalloc
+        tracemalloc.start()
+    atexit.register(write_profile)
@@ -0,0 +1,322 @@
+"""
+可续传的入库任务模块
+把每个产品的历史数据按日期分块获取和写入，每块数据与检查点在同一个事务中提交，
+任务中断（进程崩溃、网络异常）后用 resume 命令从每个产品最后提交的日期继续，已写入的数据不会丢失也不会重复
+
+- ingestion_checkpoint 表：每个 (job_id, symbol) 一行，记录下一块的开始日期 next_start、任务的截止日期 target_end、
+  状态（pending/done/failed）、重试次数和最后的错误。截止日期在任务创建时确定，续传时不变
+- 获取数据出错时按指数退避加随机抖动重试：第 n 次重试前等待 [0, min(max_delay, base_delay * 2^n)] 内的随机秒数，
+  避免多个任务同时失败后同时重试；超过重试次数的产品标记为 failed，续传时从检查点继续重试
+- 场外基金的净值接口只能获取全部历史，获取一次后同样按日期分块写入
+
+使用方法：
+    # 新建任务，入库 TRADING_PRODUCTS 中的全部产品，每块1年
+    python -m data_manager.ingestion_job run --job-id init-2025 --chunk-days 365
+    # 只入库指定产品
+    python -m data_manager.ingestion_job run --job-id init-2025 SPY 518880
+    # 进程中断后继续
+    python -m data_manager.ingestion_job resume --job-id init-2025
+    # 查看任务进度
+    python -m data_manager.ingestion_job status --job-id init-2025
+"""
+import argparse
+import random
+import sqlite3
+import time
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, Iterable, Optional
+import pandas as pd
+from common.constants import DB_PATH
+from common.trading_products import TRADING_PRODUCTS
+from data_manager.market_data_manager import (
+    fetch_stock_price_history, fetch_fund_nav_history, insert_stock_price_rows, insert_fund_nav_rows
+)
+from data_manager.universe_manager import get_product_info, DEFAULT_EARLIEST_DATE, FUND_NAV_CATEGORIES
+
+DEFAULT_CHUNK_DAYS = 365
+DEFAULT_MAX_RETRIES = 5
+
+
+def init_checkpoint_table(conn: sqlite3.Connection) -> None:
+    """创建 ingestion_checkpoint 表（如不存在）"""
+    conn.executescript('''
+    CREATE TABLE IF NOT EXISTS ingestion_checkpoint (
+        job_id VARCHAR(50) NOT NULL,
+        symbol VARCHAR(20) NOT NULL,
+        next_start DATE NOT NULL,
+        target_end DATE NOT NULL,
+        status VARCHAR(10) NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        rows_inserted INTEGER NOT NULL DEFAULT 0,
+        last_error TEXT,
+        updated_at TIMESTAMP NOT NULL,
+        PRIMARY KEY (job_id, symbol)
+    );
+    ''')
+
+
+def retry_with_backoff(func: Callable, max_retries: int = DEFAULT_MAX_RETRIES, base_delay: float = 1.0,
+                       max_delay: float = 60.0, sleep: Callable[[float], None] = time.sleep):
+    """
+    调用 func，出错时按指数退避加随机抖动重试
+
+    Args:
+        func: 无参数的函数
+        max_retries: 最多重试次数，0 表示不重试
+        base_delay: 第一次重试前的最长等待秒数
+        max_delay: 每次等待的上限
+        sleep: 等待函数
+
+    Returns:
+        func 的返回值；重试次数用尽时抛出最后一次的异常
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            return func()
+        except Exception as e:
+            if attempt == max_retries:
+                raise
+            delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+            print(f"获取数据错误: {e}，{delay:.1f} 秒后第 {attempt + 1} 次重试")
+            sleep(delay)
+
+
+def _product_kind(product_info: Optional[Dict]) -> Optional[str]:
+    """产品写入的表：'fund'（fund_nav）、'stock'（stock_price），不支持时为 None"""
+    if not product_info:
+        return None
+    if product_info['market'] == 'CN' and product_info['category'] in FUND_NAV_CATEGORIES:
+        return 'fund'
+    if product_info['market'] == 'US' or (product_info['market'] == 'CN' and product_info['category'] in ('ETF', 'index')):
+        return 'stock'
+    return None
+
+
+def _last_date(conn: sqlite3.Connection, symbol: str, kind: str) -> Optional[str]:
+    if kind == 'fund':
+        return conn.execute('SELECT MAX(nav_date) FROM fund_nav WHERE fund_code = ?', (symbol,)).fetchone()[0]
+    return conn.execute('SELECT MAX(trade_date) FROM stock_price WHERE symbol = ?', (symbol,)).fetchone()[0]
+
+
+def _date_chunks(start: date, end: date, chunk_days: int) -> Iterable[tuple]:
+    while start <= end:
+        chunk_end = min(start + timedelta(days=chunk_days - 1), end)
+        yield start, chunk_end
+        start = chunk_end + timedelta(days=1)
+
+
+class IngestionJob:
+    def __init__(self, job_id: str, chunk_days: int = DEFAULT_CHUNK_DAYS, max_retries: int = DEFAULT_MAX_RETRIES,
+                 base_delay: float = 1.0, max_delay: float = 60.0, db_path: str = DB_PATH):
+        """
+        初始化入库任务
+
+        Args:
+            job_id: 任务标识，相同标识的任务共用检查点
+            chunk_days: 每块数据覆盖的自然日天数
+            max_retries: 每块数据获取出错时的最多重试次数
+            base_delay: 第一次重试前的最长等待秒数
+            max_delay: 每次重试前等待的上限
+            db_path: 数据库路径
+        """
+        self.job_id = job_id
+        self.chunk_days = chunk_days
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.db_path = db_path
+
+    def _retry(self, func: Callable):
+        return retry_with_backoff(func, self.max_retries, self.base_delay, self.max_delay)
+
+    def _advance(self, conn: sqlite3.Connection, symbol: str, chunk_end: date, rows: int) -> None:
+        """把检查点移到 chunk_end 的下一天，不提交事务，由调用方与这块数据一起提交"""
+        conn.execute('''
+            UPDATE ingestion_checkpoint
+            SET next_start = ?, rows_inserted = rows_inserted + ?, updated_at = ?
+            WHERE job_id = ? AND symbol = ?
+        ''', ((chunk_end + timedelta(days=1)).strftime('%Y-%m-%d'), rows,
+              datetime.now().strftime('%Y-%m-%d %H:%M:%S'), self.job_id, symbol))
+
+    def _finish(self, conn: sqlite3.Connection, symbol: str, error: Optional[str] = None) -> None:
+        """记录产品的最终状态并提交，出错时重试次数加1"""
+        conn.execute('''
+            UPDATE ingestion_checkpoint
+            SET status = ?, last_error = ?, attempts = attempts + ?, updated_at = ?
+            WHERE job_id = ? AND symbol = ?
+        ''', ('failed' if error else 'done', error, 1 if error else 0,
+              datetime.now().strftime('%Y-%m-%d %H:%M:%S'), self.job_id, symbol))
+        conn.commit()
+
+    def add_symbols(self, symbols: Iterable[str], target_end: Optional[date] = None) -> int:
+        """
+        把产品加入任务，已在任务中的产品保持原有检查点
+
+        每个产品的开始日期为数据库中已有数据的下一天，没有数据时为产品的最早日期。
+
+        Args:
+            symbols: 产品代码
+            target_end: 截止日期，默认为昨天（与 update_*_to_today 相同，不获取当天的数据）
+
+        Returns:
+            int: 新加入的产品数量
+        """
+        target_end = target_end or date.today() - timedelta(days=1)
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        conn = sqlite3.connect(self.db_path)
+        try:
+            init_checkpoint_table(conn)
+            existing = {row[0] for row in conn.execute(
+                'SELECT symbol FROM ingestion_checkpoint WHERE job_id = ?', (self.job_id,))}
+            rows = []
+            for symbol in symbols:
+                if symbol in existing:
+                    continue
+                product_info = get_product_info(symbol, self.db_path)
+                kind = _product_kind(product_info)
+                if kind is None:
+                    print(f"未找到 {symbol} 的配置信息或不支持的产品类型，跳过")
+                    continue
+                last_date = _last_date(conn, symbol, kind)
+                if last_date:
+                    start = datetime.strptime(last_date, '%Y-%m-%d').date() + timedelta(days=1)
+                else:
+                    start = datetime.strptime(product_info.get('earliest_date') or DEFAULT_EARLIEST_DATE, '%Y-%m-%d').date()
+                status = 'done' if start > target_end else 'pending'
+                rows.append((self.job_id, symbol, start.strftime('%Y-%m-%d'), target_end.strftime('%Y-%m-%d'),
+                             status, now))
+                existing.add(symbol)
+            conn.executemany('''
+                INSERT INTO ingestion_checkpoint (job_id, symbol, next_start, target_end, status, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', rows)
+            conn.commit()
+        finally:
+            conn.close()
+        return len(rows)
+
+    def _ingest_stock(self, conn: sqlite3.Connection, symbol: str, product_info: Dict, start: date, end: date) -> int:
+        rows_inserted = 0
+        for chunk_start, chunk_end in _date_chunks(start, end, self.chunk_days):
+            hist_df = self._retry(lambda: fetch_stock_price_history(symbol, product_info, chunk_start, chunk_end))
+            # 接口返回的日期范围可能超出请求的范围，只写入检查点之后的数据
+            dates = pd.to_datetime(hist_df['日期']).dt.date
+            hist_df = hist_df[(dates >= chunk_start) & (dates <= chunk_end)]
+            rows = insert_stock_price_rows(conn.cursor(), symbol, product_info['name'], hist_df, self.job_id)
+            self._advance(conn, symbol, chunk_end, rows)
+            conn.commit()
+            rows_inserted += rows
+            print(f"{symbol} {product_info['name']} 已写入 {chunk_start} 到 {chunk_end} 的 {rows} 行数据")
+        return rows_inserted
+
+    def _ingest_fund(self, conn: sqlite3.Connection, symbol: str, product_info: Dict, start: date, end: date) -> int:
+        fund_nav_df = self._retry(lambda: fetch_fund_nav_history(symbol))
+        rows_inserted = 0
+        for chunk_start, chunk_end in _date_chunks(start, end, self.chunk_days):
+            chunk = fund_nav_df[(fund_nav_df['净值日期'] >= chunk_start) & (fund_nav_df['净值日期'] <= chunk_end)]
+            rows = insert_fund_nav_rows(conn.cursor(), symbol, product_info['name'], chunk, self.job_id)
+            self._advance(conn, symbol, chunk_end, rows)
+            conn.commit()
+            rows_inserted += rows
+        print(f"{symbol} {product_info['name']} 已写入 {start} 到 {end} 的 {rows_inserted} 行净值数据")
+        return rows_inserted
+
+    def run(self) -> Dict[str, int]:
+        """
+        处理任务中全部未完成的产品（包括上次失败的产品），从各自的检查点继续
+
+        任务创建后其他写入方已写入的日期不会重复写入：开始日期取检查点与数据库中最后日期的下一天中较晚的一个。
+
+        Returns:
+            Dict[str, int]: 包含 done、failed 的产品数量和 rows（本次写入的行数）
+        """
+        from data_manager.price_aggregate_manager import update_price_aggregates
+        from data_manager.return_index_manager import update_return_index
+
+        conn = sqlite3.connect(self.db_path)
+        summary = {'done': 0, 'failed': 0, 'rows': 0}
+        try:
+            init_checkpoint_table(conn)
+            pending = conn.execute('''
+                SELECT symbol, next_start, target_end, rows_inserted FROM ingestion_checkpoint
+                WHERE job_id = ? AND status != 'done' ORDER BY symbol
+            ''', (self.job_id,)).fetchall()
+            print(f"任务 {self.job_id}：待处理 {len(pending)} 个产品")
+
+            for symbol, next_start, target_end, _ in pending:
+                product_info = get_product_info(symbol, self.db_path)
+                kind = _product_kind(product_info)
+                start = datetime.strptime(next_start, '%Y-%m-%d').date()
+                end = datetime.strptime(target_end, '%Y-%m-%d').date()
+                try:
+                    if kind is None:
+                        raise ValueError(f"未找到 {symbol} 的配置信息或不支持的产品类型")
+                    # 任务创建后其他任务或 update_*_to_today 可能已写入同一产品的数据，从已有数据的下一天开始
+                    last_date = _last_date(conn, symbol, kind)
+                    if last_date and datetime.strptime(last_date, '%Y-%m-%d').date() >= start:
+                        start = datetime.strptime(last_date, '%Y-%m-%d').date() + timedelta(days=1)
+                        print(f"{symbol} 已有截至 {last_date} 的数据，从 {start} 开始")
+                    ingest = self._ingest_fund if kind == 'fund' else self._ingest_stock
+                    ingest(conn, symbol, product_info, start, end)
+                except Exception as e:
+                    # 只回滚出错的这一块，之前提交的数据块和检查点保留
+                    conn.rollback()
+                    print(f"{symbol} 入库失败: {e}")
+                    self._finish(conn, symbol, f"{type(e).__name__}: {e}")
+                    summary['failed'] += 1
+                    continue
+                self._finish(conn, symbol)
+                summary['done'] += 1
+
+            # 本次写入的行数包括失败的产品在出错前已提交的数据块
+            inserted = dict(conn.execute(
+                'SELECT symbol, rows_inserted FROM ingestion_checkpoint WHERE job_id = ?', (self.job_id,)).fetchall())
+            summary['rows'] = sum(inserted[symbol] - previous for symbol, _, _, previous in pending)
+            # 已写入过数据的产品（包括失败的产品和上次中断前写入的产品）都需要更新派生数据
+            updated = [symbol for symbol, _, _, _ in pending if inserted[symbol] > 0]
+        finally:
+            conn.close()
+
+        # 有新数据的产品同时更新周线/月线聚合和累计收益指数
+        update_price_aggregates(updated, db_path=self.db_path)
+        update_return_index(updated, db_path=self.db_path)
+        print(f"任务 {self.job_id} 完成 {summary['done']} 个产品，失败 {summary['failed']} 个，写入 {summary['rows']} 行")
+        return summary
+
+    def status(self) -> pd.DataFrame:
+        """任务中每个产品的检查点"""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            init_checkpoint_table(conn)
+            return pd.read_sql_query('''
+                SELECT symbol, status, next_start, target_end, rows_inserted, attempts, last_error, updated_at
+                FROM ingestion_checkpoint WHERE job_id = ? ORDER BY symbol
+            ''', conn, params=(self.job_id,))
+        finally:
+            conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='可续传的入库任务')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help='新建或继续任务，加入产品后开始入库')
+    run_parser.add_argument('symbols', nargs='*', help='产品代码，默认为 TRADING_PRODUCTS 中的全部产品')
+    resume_parser = subparsers.add_parser('resume', help='从检查点继续任务中未完成的产品')
+    status_parser = subparsers.add_parser('status', help='查看任务进度')
+    for sub in (run_parser, resume_parser, status_parser):
+        sub.add_argument('--job-id', required=True, help='任务标识')
+    for sub in (run_parser, resume_parser):
+        sub.add_argument('--chunk-days', type=int, default=DEFAULT_CHUNK_DAYS, help='每块数据覆盖的自然日天数')
+        sub.add_argument('--max-retries', type=int, default=DEFAULT_MAX_RETRIES, help='每块数据的最多重试次数')
+        sub.add_argument('--base-delay', type=float, default=1.0, help='第一次重试前的最长等待秒数')
+    args = parser.parse_args()
+
+    if args.command == 'status':
+        with pd.option_context('display.max_rows', None, 'display.width', 200):
+            print(IngestionJob(args.job_id).status())
+    else:
+        job = IngestionJob(args.job_id, args.chunk_days, args.max_retries, args.base_delay)
+        if args.command == 'run':
+            job.add_symbols(args.symbols or list(TRADING_PRODUCTS))
+        job.run()
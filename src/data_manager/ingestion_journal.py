@@ -0,0 +1,172 @@
+"""
+入库日志模块
+每次写入或修改行情数据时，在同一个事务中向 ingestion_journal 表追加一条记录：产品、数据集、变化的日期范围、行数和校验和。
+日志的 version 单调递增，派生数据（聚合表、缓存的价格面板、回测结果等）的维护方记住上次处理到的版本，
+之后只需查询 changes_since / dirty_ranges 得到变化的产品和日期范围，增量更新而不是全部重建
+
+数据集：
+- stock_price：新增的行情（校验和基于日期和收盘价）
+- fund_nav：新增的基金净值
+- pe_ttm：修改的 PE-TTM 值
+
+使用方法：
+    version = current_version(conn)
+    ...  # 入库
+    dirty_ranges(version)   # {'SPY': ('2025-06-03', '2025-06-30'), ...}
+    # 派生数据在 <派生表>_state 表中记录每个产品已处理的版本
+    first_dirty_dates(conn, 'return_index_state', ['stock_price', 'fund_nav'])   # {'SPY': '2025-06-03', ...}
+"""
+import hashlib
+import sqlite3
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+from common.constants import DB_PATH
+
+JOURNAL_DATASETS = ('stock_price', 'fund_nav', 'pe_ttm')
+JOURNAL_COLUMNS = ['version', 'symbol', 'dataset', 'change_type', 'first_date', 'last_date', 'row_count', 'checksum',
+                   'source', 'created_at']
+
+
+def init_journal_table(conn: sqlite3.Connection) -> None:
+    """创建 ingestion_journal 表（如不存在），不提交事务，可以在写入数据的事务中调用"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS ingestion_journal (
+            version INTEGER PRIMARY KEY AUTOINCREMENT,
+            symbol VARCHAR(20) NOT NULL,
+            dataset VARCHAR(20) NOT NULL,
+            change_type VARCHAR(10) NOT NULL,
+            first_date DATE NOT NULL,
+            last_date DATE NOT NULL,
+            row_count INTEGER NOT NULL,
+            checksum CHAR(64) NOT NULL,
+            source VARCHAR(100),
+            created_at TIMESTAMP NOT NULL
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_ingestion_journal_symbol ON ingestion_journal(symbol, version)')
+
+
+def journal_checksum(dates: List[str], values: Iterable) -> str:
+    """按日期和值（float64）计算SHA-256，同样的数据得到同样的校验和"""
+    digest = hashlib.sha256('\n'.join(dates).encode('utf-8'))
+    digest.update(np.asarray(list(values), dtype='<f8').tobytes())
+    return digest.hexdigest()
+
+
+def record_change(conn: sqlite3.Connection, symbol: str, dataset: str, dates: Iterable, values: Iterable,
+                  change_type: str = 'insert', source: Optional[str] = None) -> Optional[int]:
+    """
+    追加一条日志，不提交事务，由调用方与数据一起提交
+
+    Args:
+        conn: 数据库连接
+        symbol: 产品代码
+        dataset: 数据集，见 JOURNAL_DATASETS
+        dates: 变化的日期（'YYYY-MM-DD' 字符串、date 或 Timestamp）
+        values: 与 dates 对应的新值，用于计算校验和
+        change_type: 'insert' 或 'update'
+        source: 写入方，如入库任务标识
+
+    Returns:
+        int: 日志版本；没有变化的日期时不写日志，返回 None
+    """
+    if dataset not in JOURNAL_DATASETS:
+        raise ValueError(f"不支持的数据集 {dataset}，应为 {JOURNAL_DATASETS} 之一")
+    dates = [str(day)[:10] for day in dates]
+    if not dates:
+        return None
+    init_journal_table(conn)
+    cursor = conn.execute('''
+        INSERT INTO ingestion_journal
+            (symbol, dataset, change_type, first_date, last_date, row_count, checksum, source, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (symbol, dataset, change_type, min(dates), max(dates), len(dates), journal_checksum(dates, values), source,
+          datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+    return cursor.lastrowid
+
+
+def current_version(conn: sqlite3.Connection) -> int:
+    """最新的日志版本，没有日志时为0"""
+    try:
+        return conn.execute('SELECT COALESCE(MAX(version), 0) FROM ingestion_journal').fetchone()[0]
+    except sqlite3.OperationalError:
+        # 尚未创建 ingestion_journal 表
+        return 0
+
+
+def first_dirty_dates(conn: sqlite3.Connection, state_table: str, datasets: Iterable[str]) -> Dict[str, str]:
+    """
+    派生数据上次更新之后，每个产品在入库日志中最早的变化日期
+
+    Args:
+        conn: 数据库连接
+        state_table: 派生数据记录各产品已处理版本的表，包含 symbol、journal_version 两列（如 return_index_state）
+        datasets: 影响该派生数据的数据集
+
+    Returns:
+        Dict[str, str]: 产品代码到最早变化日期的映射，没有日志时为空
+    """
+    if current_version(conn) == 0:
+        return {}
+    datasets = list(datasets)
+    rows = conn.execute(f'''
+        SELECT j.symbol, MIN(j.first_date)
+        FROM ingestion_journal j
+        LEFT JOIN {state_table} s ON s.symbol = j.symbol
+        WHERE j.version > COALESCE(s.journal_version, 0) AND j.dataset IN ({','.join(['?'] * len(datasets))})
+        GROUP BY j.symbol
+    ''', datasets).fetchall()
+    return dict(rows)
+
+
+def changes_since(version: int, symbols: Optional[Iterable[str]] = None, datasets: Optional[Iterable[str]] = None,
+                  db_path: str = DB_PATH) -> pd.DataFrame:
+    """
+    查询某个版本之后的全部日志
+
+    Args:
+        version: 已处理到的版本，返回 version 之后（不含）的日志
+        symbols: 只返回这些产品的日志，None 表示全部
+        datasets: 只返回这些数据集的日志，None 表示全部
+        db_path: 数据库路径
+
+    Returns:
+        DataFrame: 按版本排列，列为 ingestion_journal 表的全部列
+    """
+    query = 'SELECT * FROM ingestion_journal WHERE version > ?'
+    params = [version]
+    for column, items in (('symbol', symbols), ('dataset', datasets)):
+        if items is not None:
+            items = list(items)
+            query += f" AND {column} IN ({','.join(['?'] * len(items))})"
+            params.extend(items)
+    conn = sqlite3.connect(db_path)
+    try:
+        if current_version(conn) == 0:
+            return pd.DataFrame(columns=JOURNAL_COLUMNS)
+        return pd.read_sql_query(query + ' ORDER BY version', conn, params=params)
+    finally:
+        conn.close()
+
+
+def dirty_ranges(version: int, symbols: Optional[Iterable[str]] = None, datasets: Optional[Iterable[str]] = None,
+                 db_path: str = DB_PATH) -> Dict[str, Tuple[str, str]]:
+    """
+    某个版本之后每个产品变化的日期范围，多条日志合并为最早和最晚的日期
+
+    Args:
+        version: 已处理到的版本
+        symbols: 只包含这些产品，None 表示全部
+        datasets: 只包含这些数据集，None 表示全部
+        db_path: 数据库路径
+
+    Returns:
+        Dict[str, Tuple[str, str]]: 产品代码到 (first_date, last_date) 的映射，派生数据需要从 first_date 起重新计算
+    """
+    changes = changes_since(version, symbols, datasets, db_path)
+    if changes.empty:
+        return {}
+    ranges = changes.groupby('symbol').agg(first_date=('first_date', 'min'), last_date=('last_date', 'max'))
+    return {symbol: (row.first_date, row.last_date) for symbol, row in ranges.iterrows()}
@@ -0,0 +1,286 @@
+"""
+分钟线数据存储模块
+分钟线数据量是日线的数百倍，不写入 SQLite，而是按 产品/年-月 分区保存为压缩的 npz 文件：
+    <INTRADAY_DIR>/<产品代码>/<YYYY-MM>.npz
+
+每个分区的编码：
+- minute: 相对月初的分钟数（uint16）
+- close: 以 1/PRICE_SCALE 为单位的整数价格的逐行差分（int64），相邻分钟的差分很小，压缩率高
+- open/high/low: 相对同一行收盘价的整数偏移（int32）
+- volume: 成交量（int64）
+时间为交易所当地时间，不带时区，必须对齐到整分钟。
+
+读取和重采样按分区逐月进行，不需要把全部历史一次加载到内存中；
+重采样周期为一天的约数（如 5min、30min、1D），每个周期都落在同一个月内，因此逐月重采样的结果与整体重采样相同。
+
+使用方法：
+    python -m data_manager.intraday_store update SPY 510300
+    python -m data_manager.intraday_store resample SPY --freq 30min --start 2025-06-01 --end 2025-06-30
+"""
+import argparse
+import os
+from typing import Iterator, List, Optional
+import numpy as np
+import pandas as pd
+from common.constants import INTRADAY_DIR
+from common.profiling import profiled
+from data_manager.universe_manager import get_product_info
+
+# 价格的最小单位为 1/PRICE_SCALE，即保留4位小数
+PRICE_SCALE = 10000
+
+BAR_COLUMNS = ['open', 'high', 'low', 'close', 'volume']
+
+# 重采样时各列的聚合方式
+RESAMPLE_AGG = {'open': 'first', 'high': 'max', 'low': 'min', 'close': 'last', 'volume': 'sum'}
+
+# akshare 分钟线接口返回的列 -> 本模块的列
+AKSHARE_MIN_COLUMNS = {'时间': 'datetime', '开盘': 'open', '最高': 'high', '最低': 'low', '收盘': 'close', '成交量': 'volume'}
+
+_ONE_DAY = pd.Timedelta(days=1)
+
+
+def _empty_bars() -> pd.DataFrame:
+    return pd.DataFrame({col: pd.Series(dtype='float64') for col in BAR_COLUMNS},
+                        index=pd.DatetimeIndex([], name='datetime'))
+
+
+def encode_partition(bars: pd.DataFrame, month_start: pd.Timestamp) -> dict:
+    """
+    把同一个月的分钟线编码为紧凑的数组
+
+    Args:
+        bars: 以时间为索引、包含 BAR_COLUMNS 的分钟线，已排序且时间不重复
+        month_start: 分区所在月份的第一天
+
+    Returns:
+        dict: 可直接传给 np.savez_compressed 的数组
+    """
+    minutes = (bars.index - month_start) // pd.Timedelta(minutes=1)
+    close = np.rint(bars['close'].to_numpy(dtype='float64') * PRICE_SCALE).astype('int64')
+    arrays = {
+        'minute': np.asarray(minutes, dtype='uint16'),
+        'close': np.diff(close, prepend=0),
+        'volume': np.nan_to_num(bars['volume'].to_numpy(dtype='float64')).astype('int64'),
+    }
+    for col in ('open', 'high', 'low'):
+        ticks = np.rint(bars[col].to_numpy(dtype='float64') * PRICE_SCALE).astype('int64')
+        arrays[col] = (ticks - close).astype('int32')
+    return arrays
+
+
+def decode_partition(arrays, month_start: pd.Timestamp) -> pd.DataFrame:
+    """encode_partition 的逆操作"""
+    close = np.cumsum(arrays['close'])
+    index = month_start + pd.to_timedelta(arrays['minute'].astype('int64'), unit='min')
+    data = {col: (arrays[col] + close) / PRICE_SCALE for col in ('open', 'high', 'low')}
+    data['close'] = close / PRICE_SCALE
+    data['volume'] = arrays['volume'].astype('float64')
+    return pd.DataFrame(data, index=pd.DatetimeIndex(index, name='datetime'))[BAR_COLUMNS]
+
+
+class IntradayStore:
+    def __init__(self, root_dir: Optional[str] = None):
+        """
+        初始化分钟线存储
+
+        Args:
+            root_dir: 数据目录，默认为 INTRADAY_DIR
+        """
+        self.root_dir = root_dir or INTRADAY_DIR
+
+    def _symbol_dir(self, symbol: str) -> str:
+        return os.path.join(self.root_dir, symbol)
+
+    def _partition_path(self, symbol: str, month: str) -> str:
+        return os.path.join(self._symbol_dir(symbol), f"{month}.npz")
+
+    def list_partitions(self, symbol: str) -> List[str]:
+        """返回产品已有的分区月份（'YYYY-MM'），按时间排序"""
+        symbol_dir = self._symbol_dir(symbol)
+        if not os.path.isdir(symbol_dir):
+            return []
+        return sorted(name[:-4] for name in os.listdir(symbol_dir) if name.endswith('.npz'))
+
+    def read_partition(self, symbol: str, month: str) -> pd.DataFrame:
+        """读取一个分区的分钟线，分区不存在时返回空表"""
+        path = self._partition_path(symbol, month)
+        if not os.path.exists(path):
+            return _empty_bars()
+        with np.load(path) as arrays:
+            return decode_partition(arrays, pd.Timestamp(f"{month}-01"))
+
+    @profiled('IntradayStore.write_bars')
+    def write_bars(self, symbol: str, bars: pd.DataFrame) -> int:
+        """
+        写入分钟线，与已有分区合并，时间相同的行以新数据为准
+
+        Args:
+            symbol: 产品代码
+            bars: 以时间为索引、包含 BAR_COLUMNS 的分钟线
+
+        Returns:
+            int: 新增的行数，已有时间的分钟线被覆盖，不计入
+        """
+        if bars.empty:
+            return 0
+        missing = [col for col in BAR_COLUMNS if col not in bars.columns]
+        if missing:
+            raise ValueError(f"分钟线缺少列 {missing}")
+        index = pd.DatetimeIndex(bars.index)
+        if index.tz is not None:
+            raise ValueError("分钟线时间应为交易所当地时间，不带时区")
+        if (index != index.floor('min')).any():
+            raise ValueError("分钟线时间必须对齐到整分钟")
+
+        bars = bars[BAR_COLUMNS].set_axis(index.rename('datetime')).dropna(subset=['close'])
+        os.makedirs(self._symbol_dir(symbol), exist_ok=True)
+        written = 0
+        for month_start, month_bars in bars.groupby(bars.index.to_period('M').start_time):
+            month = month_start.strftime('%Y-%m')
+            existing = self.read_partition(symbol, month)
+            merged = pd.concat([existing, month_bars])
+            merged = merged[~merged.index.duplicated(keep='last')].sort_index()
+            written += len(merged) - len(existing)
+            # 先写临时文件再替换，中断时不会留下损坏的分区
+            path = self._partition_path(symbol, month)
+            tmp_path = f"{path}.tmp.npz"
+            np.savez_compressed(tmp_path, **encode_partition(merged, month_start))
+            os.replace(tmp_path, path)
+        return written
+
+    def iter_bars(self, symbol: str, start: Optional[str] = None, end: Optional[str] = None) -> Iterator[pd.DataFrame]:
+        """
+        按月逐个返回分区中落在 [start, end] 内的分钟线
+
+        Args:
+            symbol: 产品代码
+            start: 开始时间，如 '2025-06-01' 或 '2025-06-01 09:30'，None 表示不限
+            end: 结束时间，只写日期时包含当天全部分钟，None 表示不限
+
+        Returns:
+            Iterator[DataFrame]: 每个分区一个 DataFrame，跳过没有数据的分区
+        """
+        start_ts = pd.Timestamp(start) if start else None
+        end_ts = pd.Timestamp(end) if end else None
+        if end_ts is not None and end_ts == end_ts.normalize():
+            end_ts = end_ts + _ONE_DAY - pd.Timedelta(minutes=1)
+
+        for month in self.list_partitions(symbol):
+            month_start = pd.Timestamp(f"{month}-01")
+            if start_ts is not None and month_start + pd.offsets.MonthBegin(1) <= start_ts:
+                continue
+            if end_ts is not None and month_start > end_ts:
+                break
+            bars = self.read_partition(symbol, month)
+            bars = bars.loc[start_ts:end_ts]
+            if not bars.empty:
+                yield bars
+
+    def load_bars(self, symbol: str, start: Optional[str] = None, end: Optional[str] = None) -> pd.DataFrame:
+        """读取 [start, end] 内的全部分钟线，参数同 iter_bars"""
+        parts = list(self.iter_bars(symbol, start, end))
+        return pd.concat(parts) if parts else _empty_bars()
+
+    def iter_resampled(self, symbol: str, freq: str, start: Optional[str] = None,
+                       end: Optional[str] = None) -> Iterator[pd.DataFrame]:
+        """
+        逐月把分钟线重采样为 freq 周期的K线
+
+        Args:
+            symbol: 产品代码
+            freq: 周期，必须是一天的约数，如 '5min'、'30min'、'60min'、'1D'
+            start: 开始时间，参数同 iter_bars
+            end: 结束时间，参数同 iter_bars
+
+        Returns:
+            Iterator[DataFrame]: 每个分区一个 DataFrame，索引为周期的开始时间，没有成交的周期不输出
+        """
+        try:
+            step = pd.Timedelta(freq)
+        except ValueError:
+            step = None
+        if step is None or step <= pd.Timedelta(0) or _ONE_DAY % step != pd.Timedelta(0):
+            raise ValueError(f"重采样周期 {freq} 必须是一天的约数")
+
+        for bars in self.iter_bars(symbol, start, end):
+            resampled = bars.resample(step, label='left', closed='left').agg(RESAMPLE_AGG)
+            yield resampled.dropna(subset=['close'])
+
+    @profiled('IntradayStore.resample_bars')
+    def resample_bars(self, symbol: str, freq: str, start: Optional[str] = None,
+                      end: Optional[str] = None) -> pd.DataFrame:
+        """把 [start, end] 内的分钟线重采样为 freq 周期的K线，参数同 iter_resampled"""
+        parts = list(self.iter_resampled(symbol, freq, start, end))
+        return pd.concat(parts) if parts else _empty_bars()
+
+
+def fetch_intraday_bars(symbol: str, start: str, end: str) -> pd.DataFrame:
+    """
+    从 akshare 获取1分钟K线，支持美股和中国ETF（东方财富只提供最近一段时间的分钟数据）
+
+    Args:
+        symbol: 产品代码
+        start: 开始时间，格式为 'YYYY-MM-DD HH:MM:SS'
+        end: 结束时间，格式同上
+
+    Returns:
+        DataFrame: 以时间为索引、包含 BAR_COLUMNS 的分钟线
+    """
+    product_info = get_product_info(symbol)
+    if not product_info:
+        raise ValueError(f"未找到 {symbol} 的配置信息")
+
+    import akshare as ak
+    if product_info['market'] == 'US':
+        raw = ak.stock_us_hist_min_em(symbol=product_info['akshare_symbol'], start_date=start, end_date=end)
+    elif product_info['market'] == 'CN' and product_info['category'] == 'ETF':
+        raw = ak.fund_etf_hist_min_em(symbol=symbol, period='1', adjust='', start_date=start, end_date=end)
+    else:
+        raise ValueError(f"{symbol} 不是美股或中国ETF，不支持分钟线")
+
+    bars = raw[list(AKSHARE_MIN_COLUMNS)].rename(columns=AKSHARE_MIN_COLUMNS)
+    bars['datetime'] = pd.to_datetime(bars['datetime'])
+    return bars.set_index('datetime')[BAR_COLUMNS].astype('float64')
+
+
+def update_intraday_bars(symbol: str, store: Optional[IntradayStore] = None, days: int = 5) -> Optional[int]:
+    """
+    获取最近 days 天的1分钟K线并写入存储
+
+    Returns:
+        int: 写入的行数，获取失败时返回 None
+    """
+    store = store or IntradayStore()
+    end = pd.Timestamp.now().floor('min')
+    start = end.normalize() - pd.Timedelta(days=days)
+    try:
+        bars = fetch_intraday_bars(symbol, start.strftime('%Y-%m-%d %H:%M:%S'), end.strftime('%Y-%m-%d %H:%M:%S'))
+        rows = store.write_bars(symbol, bars)
+        print(f"成功写入 {symbol} {rows} 条分钟线")
+        return rows
+    except Exception as e:
+        print(f"{symbol} 分钟线更新错误: {e}")
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='分钟线数据存储')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    update_parser = subparsers.add_parser('update', help='获取最近的分钟线并写入存储')
+    update_parser.add_argument('symbols', nargs='+', help='产品代码')
+    update_parser.add_argument('--days', type=int, default=5, help='获取最近多少天的数据')
+
+    resample_parser = subparsers.add_parser('resample', help='重采样并输出K线')
+    resample_parser.add_argument('symbol', help='产品代码')
+    resample_parser.add_argument('--freq', default='30min', help='周期，如 5min、30min、1D')
+    resample_parser.add_argument('--start', help='开始时间')
+    resample_parser.add_argument('--end', help='结束时间')
+
+    args = parser.parse_args()
+    if args.command == 'update':
+        for symbol in args.symbols:
+            update_intraday_bars(symbol, days=args.days)
+    else:
+        print(IntradayStore().resample_bars(args.symbol, args.freq, args.start, args.end).to_string())
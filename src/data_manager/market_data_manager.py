@@ -1,17 +1,145 @@
-import akshare as ak
 import sqlite3
 import os
 import pandas as pd
 from datetime import timedelta, date, datetime
+from typing import Optional
 from common.trading_products import TRADING_PRODUCTS
 from common.constants import DB_PATH
+from common.profiling import profiled
+from data_manager.ingestion_journal import record_change
+from data_manager.universe_manager import get_product_info, DEFAULT_EARLIEST_DATE
 
-def update_stock_price_data_to_today(symbol):
-    """更新股票价格数据到最新日期，支持美股、中国ETF、中国指数"""
-    product_info = TRADING_PRODUCTS.get(symbol)
+# akshare 返回的行情列，按 stock_price 表的列顺序排列
+STOCK_PRICE_COLUMNS = ['日期', '开盘', '收盘', '最高', '最低', '成交量', '成交额', '振幅', '涨跌幅', '涨跌额', '换手率']
+
+
+@profiled('insert_stock_price_rows')
+def insert_stock_price_rows(cursor: sqlite3.Cursor, symbol: str, name: str, hist_df: pd.DataFrame,
+                            source: Optional[str] = None) -> int:
+    """
+    把 akshare 格式的行情数据批量写入 stock_price 表，同时写入一条入库日志，不提交事务
+
+    Args:
+        cursor: 数据库游标
+        symbol: 产品代码
+        name: 产品名称
+        hist_df: 包含 STOCK_PRICE_COLUMNS 各列的行情数据
+        source: 记录在入库日志中的写入方
+
+    Returns:
+        int: 写入的行数
+    """
+    # PE-TTM 先设置为 None，后续可以通过其他方式更新
+    rows = [(symbol, name, *values, None) for values in hist_df[STOCK_PRICE_COLUMNS].to_numpy(dtype=object)]
+    cursor.executemany('''
+    INSERT INTO stock_price (
+        symbol,
+        name,
+        trade_date,
+        open,
+        close, 
+        high,
+        low,
+        volume,
+        amount,
+        amplitude,
+        change_percent,
+        change_amount,
+        turnover_rate,
+        pe_ttm
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', rows)
+    record_change(cursor.connection, symbol, 'stock_price', hist_df['日期'], hist_df['收盘'], source=source)
+    return len(rows)
+
+
+@profiled('insert_fund_nav_rows')
+def insert_fund_nav_rows(cursor: sqlite3.Cursor, fund_code: str, name: str, fund_nav_df: pd.DataFrame,
+                         source: Optional[str] = None) -> int:
+    """
+    把 akshare 格式的基金累计净值数据批量写入 fund_nav 表，同时写入一条入库日志，不提交事务
+
+    Args:
+        cursor: 数据库游标
+        fund_code: 基金代码
+        name: 基金名称
+        fund_nav_df: 包含 净值日期（date类型）和 累计净值 列的数据
+        source: 记录在入库日志中的写入方
+
+    Returns:
+        int: 写入的行数
+    """
+    rows = [
+        (fund_code, name, nav_date.strftime('%Y-%m-%d'), nav)
+        for nav_date, nav in fund_nav_df[['净值日期', '累计净值']].to_numpy(dtype=object)
+    ]
+    cursor.executemany('''
+    INSERT INTO fund_nav (
+        fund_code,
+        name,
+        nav_date,
+        nav
+    ) VALUES (?, ?, ?, ?)
+    ''', rows)
+    record_change(cursor.connection, fund_code, 'fund_nav', [row[2] for row in rows], [row[3] for row in rows],
+                  source=source)
+    return len(rows)
+
+
+def fetch_stock_price_history(symbol: str, product_info: dict, start_date: date, end_date: date) -> pd.DataFrame:
+    """
+    从 akshare 获取美股、中国ETF或中国指数在 [start_date, end_date] 内的日线行情
+
+    Args:
+        symbol: 产品代码
+        product_info: get_product_info 返回的产品信息
+        start_date: 开始日期
+        end_date: 结束日期
+
+    Returns:
+        DataFrame: 包含 STOCK_PRICE_COLUMNS 各列的行情数据，美股和ETF为后复权价格
+    """
+    import akshare as ak
+
+    start, end = start_date.strftime('%Y%m%d'), end_date.strftime('%Y%m%d')
+    if product_info['market'] == 'US':
+        return ak.stock_us_hist(symbol=product_info['akshare_symbol'], period="daily",
+                                start_date=start, end_date=end, adjust="hfq")
+    if product_info['market'] == 'CN' and product_info['category'] == 'ETF':
+        return ak.fund_etf_hist_em(symbol=symbol, period="daily", start_date=start, end_date=end, adjust="hfq")
+    if product_info['market'] == 'CN' and product_info['category'] == 'index':
+        return ak.index_zh_a_hist(symbol=symbol, period="daily", start_date=start, end_date=end)
+    raise ValueError(f"{symbol} 不支持的产品类型 {product_info['market']}/{product_info['category']}")
+
+
+def fetch_fund_nav_history(symbol: str) -> pd.DataFrame:
+    """
+    从 akshare 获取基金的全部累计净值历史（接口不支持按日期范围获取）
+
+    Returns:
+        DataFrame: 包含 净值日期（date类型）和 累计净值 列
+    """
+    import akshare as ak
+
+    fund_nav_df = ak.fund_open_fund_info_em(symbol=symbol, indicator="累计净值走势")
+    fund_nav_df['净值日期'] = pd.to_datetime(fund_nav_df['净值日期']).dt.date
+    return fund_nav_df
+
+
+@profiled('update_stock_price_data_to_today')
+def update_stock_price_data_to_today(symbol, db_path=DB_PATH):
+    """
+    更新股票价格数据到最新日期，支持美股、中国ETF、中国指数
+
+    产品信息来自 TRADING_PRODUCTS 或 product_metadata 表（见 universe_manager）。
+
+    Returns:
+        int: 写入的行数，已是最新或没有新数据时为0；产品不存在、不支持或更新出错时返回 None
+    """
+    product_info = get_product_info(symbol, db_path)
     if not product_info:
         print(f"未找到 {symbol} 的配置信息")
-        return
+        return None
         
     # 检查产品类型
     if product_info['market'] == 'US':
@@ -19,12 +147,12 @@ def update_stock_price_data_to_today(symbol):
     elif product_info['market'] == 'CN':
         if product_info['category'] not in ['ETF', 'index']:
             print(f"{symbol} 不是中国ETF或中国指数")
-            return
+            return None
     else:
         print(f"{symbol} 不支持的市场类型")
-        return
+        return None
         
-    conn = sqlite3.connect(DB_PATH)
+    conn = sqlite3.connect(db_path)
     cursor = conn.cursor()
 
     # 查询最新的数据日期
@@ -37,7 +165,7 @@ def update_stock_price_data_to_today(symbol):
     last_date = cursor.fetchone()[0] # 返回的是字符串类型，格式为 'YYYY-MM-DD'    
 
     if not last_date:
-        start_date = datetime.strptime(product_info['earliest_date'], '%Y-%m-%d').date()
+        start_date = datetime.strptime(product_info.get('earliest_date') or DEFAULT_EARLIEST_DATE, '%Y-%m-%d').date()
         print(f"未找到 {symbol} {product_info['name']} 的历史数据,设定开始时间为 {start_date}")
     else:
         start_date = datetime.strptime(last_date, '%Y-%m-%d').date() + timedelta(days=1)
@@ -48,70 +176,23 @@ def update_stock_price_data_to_today(symbol):
     # 如果start_date大于等于end_date,跳过更新
     if start_date >= end_date:
         print(f"{symbol} {product_info['name']} 历史数据最新日期为 {last_date},已为最新,跳过更新")
-        return
+        conn.close()
+        return 0
     
     try:
-        # 根据市场类型获取数据
-        if product_info['market'] == 'US':
-            hist_df = ak.stock_us_hist(symbol=product_info['akshare_symbol'], period="daily", 
-                                     start_date=start_date.strftime('%Y%m%d'), 
-                                     end_date=end_date.strftime('%Y%m%d'), 
-                                     adjust="hfq")
-        elif product_info['market'] == 'CN' and product_info['category'] == 'ETF':
-            hist_df = ak.fund_etf_hist_em(symbol=symbol, period="daily", 
-                                        start_date=start_date.strftime('%Y%m%d'), 
-                                        end_date=end_date.strftime('%Y%m%d'), 
-                                        adjust="hfq")
-        elif product_info['market'] == 'CN' and product_info['category'] == 'index':
-            hist_df = ak.index_zh_a_hist(symbol=symbol, period="daily", 
-                                         start_date=start_date.strftime('%Y%m%d'), 
-                                         end_date=end_date.strftime('%Y%m%d'))
-        
+        hist_df = fetch_stock_price_history(symbol, product_info, start_date, end_date)
             
         if hist_df.empty:
             print(f"{symbol} {product_info['name']} 没有发现 {start_date} 到 {end_date} 的新数据, 可能是非交易日或者数据尚未更新，跳过更新")
-            return
+            return 0
 
         print(f"开始更新 {symbol} {product_info['name']} 从 {hist_df['日期'].min()} 到 {hist_df['日期'].max()} 的数据...")
 
-        # 遍历DataFrame的每一行数据
-        for index, row in hist_df.iterrows():
-            cursor.execute('''
-            INSERT INTO stock_price (
-                symbol,
-                name,
-                trade_date,
-                open,
-                close, 
-                high,
-                low,
-                volume,
-                amount,
-                amplitude,
-                change_percent,
-                change_amount,
-                turnover_rate,
-                pe_ttm
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                symbol,
-                product_info['name'],
-                row['日期'],
-                row['开盘'],
-                row['收盘'],
-                row['最高'],
-                row['最低'],
-                row['成交量'],
-                row['成交额'],
-                row['振幅'],
-                row['涨跌幅'],
-                row['涨跌额'],
-                row['换手率'],
-                None  # 先设置为 None，后续可以通过其他方式更新 PE-TTM 数据
-            ))
+        rows_inserted = insert_stock_price_rows(cursor, symbol, product_info['name'], hist_df)
         
         conn.commit()
         print(f"成功更新 {symbol} {product_info['name']} 历史价格数据")
+        return rows_inserted
         
     except sqlite3.Error as e:
         print(f"价格数据更新错误: {e}")
@@ -123,14 +204,20 @@ def update_stock_price_data_to_today(symbol):
     finally:
         conn.close()
 
-def update_cn_fund_nav_to_today(symbol):
-    """更新基金净值数据到最新日期"""
-    product_info = TRADING_PRODUCTS.get(symbol)
+@profiled('update_cn_fund_nav_to_today')
+def update_cn_fund_nav_to_today(symbol, db_path=DB_PATH):
+    """
+    更新基金净值数据到最新日期
+
+    Returns:
+        int: 写入的行数，已是最新或没有新数据时为0；产品不存在、不是中国基金或更新出错时返回 None
+    """
+    product_info = get_product_info(symbol, db_path)
     if not product_info or product_info['market'] != 'CN' or product_info['category'] not in ['stock_fund', 'bond_fund', 'money_fund']:
         print(f"未找到 {symbol} 的配置信息或不是中国基金")
-        return
+        return None
         
-    conn = sqlite3.connect(DB_PATH)
+    conn = sqlite3.connect(db_path)
     cursor = conn.cursor()
 
     # 查询最新的数据日期
@@ -143,46 +230,32 @@ def update_cn_fund_nav_to_today(symbol):
     last_date = cursor.fetchone()[0] # 返回的是字符串类型，格式为 'YYYY-MM-DD'
     
     if not last_date:
-        start_date = datetime.strptime(product_info['earliest_date'], '%Y-%m-%d').date()
+        start_date = datetime.strptime(product_info.get('earliest_date') or DEFAULT_EARLIEST_DATE, '%Y-%m-%d').date()
         print(f"未找到 {symbol} {product_info['name']} 的历史数据,设定开始时间为 {start_date}")
     else:
         start_date = datetime.strptime(last_date, '%Y-%m-%d').date() + timedelta(days=1)
     
     if start_date >= date.today():
         print(f"{symbol} {product_info['name']} 历史数据已是最新,跳过更新")
-        return
+        conn.close()
+        return 0
     
     try:
-        # 获取所有历史数据
-        fund_nav_df = ak.fund_open_fund_info_em(symbol=symbol, indicator="累计净值走势")
-        
+        fund_nav_df = fetch_fund_nav_history(symbol)
+
         # 筛选出大于等于start_date的数据
-        fund_nav_df['净值日期'] = pd.to_datetime(fund_nav_df['净值日期']).dt.date
         fund_nav_df = fund_nav_df[fund_nav_df['净值日期'] >= start_date]
 
         if fund_nav_df.empty:
             print(f"{symbol} {product_info['name']} 没有发现 {start_date} 到 {date.today()} 的新数据, 可能是非交易日或者数据尚未更新，跳过更新")
-            return
+            return 0
 
         print(f"开始更新 {symbol} {product_info['name']} 从 {fund_nav_df['净值日期'].min()}  到 {fund_nav_df['净值日期'].max()} 的数据...")
-        # 遍历DataFrame的每一行数据
-        for index, row in fund_nav_df.iterrows():
-            cursor.execute('''
-            INSERT INTO fund_nav (
-                fund_code,
-                name,
-                nav_date,
-                nav
-            ) VALUES (?, ?, ?, ?)
-            ''', (
-                symbol,
-                product_info['name'],  
-                row['净值日期'].strftime('%Y-%m-%d'),
-                row['累计净值']
-            ))
+        rows_inserted = insert_fund_nav_rows(cursor, symbol, product_info['name'], fund_nav_df)
         
         conn.commit()
         print(f"成功更新 {symbol} 历史净值数据")
+        return rows_inserted
         
     except sqlite3.Error as e:
         print(f"净值数据更新错误: {e}")
@@ -207,4 +280,12 @@ if __name__ == "__main__":
         elif info['market'] == 'CN' and info['category'] in ['stock_fund', 'bond_fund']:
             update_cn_fund_nav_to_today(symbol)
 
+    # 更新周线/月线聚合，只重新计算每个产品最后一个周期之后的数据
+    from data_manager.price_aggregate_manager import update_price_aggregates
+    update_price_aggregates(TRADING_PRODUCTS.keys())
+
+    # 更新累计收益指数，只计算新日期和入库日志中有变化的日期
+    from data_manager.return_index_manager import update_return_index
+    update_return_index(TRADING_PRODUCTS.keys())
+
 
@@ -5,6 +5,9 @@ from datetime import datetime
 from contextlib import contextmanager
 from common.trading_products import TRADING_PRODUCTS
 from common.constants import DB_PATH
+from common.profiling import profiled
+from data_manager.ingestion_journal import record_change
+from data_manager.pe_ttm_rank_manager import update_pe_ttm_ranks
 
 @contextmanager
 def get_db_connection():
@@ -15,6 +18,7 @@ def get_db_connection():
     finally:
         conn.close()
 
+@profiled('update_sp500_pe_ttm_data')
 def update_sp500_pe_ttm_data():
     """更新SP500的PE-TTM数据到数据库"""
     symbol = 'SPY'
@@ -24,7 +28,7 @@ def update_sp500_pe_ttm_data():
     with open(pe_ttm_file_path, 'r') as f:
         pe_ttm_data = json.load(f)
 
-    updated_count = 0
+    updated = []
     with get_db_connection() as conn:
         cursor = conn.cursor()
         
@@ -42,17 +46,23 @@ def update_sp500_pe_ttm_data():
                 print(f"Warning: No record found for symbol {symbol} on date {trade_date}. Skipping update.")
                 continue
 
-            # 更新PE-TTM值
+            # 更新PE-TTM值，值没有变化的行不更新，也不写入入库日志
             cursor.execute('''
                 UPDATE stock_price
                 SET pe_ttm = ?
-                WHERE symbol = ? AND trade_date = ?
-            ''', (pe_ttm_value, symbol, trade_date))
+                WHERE symbol = ? AND trade_date = ? AND pe_ttm IS NOT ?
+            ''', (pe_ttm_value, symbol, trade_date, pe_ttm_value))
             
-            updated_count += cursor.rowcount
+            if cursor.rowcount:
+                updated.append((trade_date, pe_ttm_value))
 
+        record_change(conn, symbol, 'pe_ttm', [row[0] for row in updated], [row[1] for row in updated],
+                      change_type='update', source='update_sp500_pe_ttm_data')
         conn.commit()
-        print(f"更新了 {updated_count} 条PE-TTM记录")
+        print(f"更新了 {len(updated)} 条PE-TTM记录")
+
+    # 增量更新PE-TTM百分位
+    update_pe_ttm_ranks(symbol)
 
 
 def validate_sp500_pe_ttm_data():
@@ -0,0 +1,267 @@
+"""
+PE-TTM百分位管理模块
+用树状数组（Fenwick树）按估值大小计数，在 O(n log n) 内计算每个交易日PE-TTM在全部历史或最近N年中的百分位，
+估值经坐标压缩（全部估值去重排序后的序号）作为下标，按原始精度比较，
+结果增量更新并保存到数据库的 pe_ttm_rank 表，供回测和分析脚本直接读取
+"""
+import sqlite3
+from collections import deque
+from datetime import datetime
+from typing import Iterable, Optional
+import numpy as np
+import pandas as pd
+from common.constants import DB_PATH
+from common.profiling import profiled
+from data_manager.ingestion_journal import current_version, first_dirty_dates
+
+# pe_ttm_rank 表中 window_years 为0表示与全部历史比较
+EXPANDING_WINDOW = 0
+
+DEFAULT_WINDOWS = (None, 10)
+
+
+class FenwickTree:
+    """树状数组：单点加减、前缀求和均为 O(log n)，下标范围 0..size-1 在创建时确定"""
+
+    def __init__(self, size: int = 1 << 18):
+        self.size = size
+        self.tree = [0] * (size + 1)
+
+    def add(self, index: int, delta: int) -> None:
+        i = index + 1
+        while i <= self.size:
+            self.tree[i] += delta
+            i += i & (-i)
+
+    def prefix_sum(self, index: int) -> int:
+        """下标 0..index（含）的计数之和"""
+        i = min(index, self.size - 1) + 1
+        total = 0
+        while i > 0:
+            total += self.tree[i]
+            i -= i & (-i)
+        return total
+
+
+class PercentileRankEngine:
+    """
+    估值百分位引擎
+
+    逐日加入估值，返回当天估值在窗口内的百分位：窗口内不高于当天估值的数据占比，
+    与 pandas 的 rank(method='max', pct=True) 口径一致。
+    滚动窗口与 pandas 的 rolling('<天数>D') 一致，包含 (当天-窗口天数, 当天] 内的数据。
+    """
+
+    def __init__(self, values: Iterable[float], window_years: Optional[int] = None):
+        """
+        Args:
+            values: 之后会加入的全部估值（可以重复、无需排序），去重排序后作为树状数组的下标（坐标压缩），
+                估值按原始精度比较
+            window_years: 回看窗口（年），None 表示使用全部历史
+        """
+        self.levels = np.unique(np.asarray(values, dtype=float))
+        self.window_days = None if window_years is None else int(round(window_years * 365.25))
+        self.tree = FenwickTree(max(len(self.levels), 1))
+        self.window = deque()  # 窗口内的 (日期序号, 估值下标)
+        self.count = 0
+
+    def _buckets(self, values) -> np.ndarray:
+        """估值在 levels 中的下标"""
+        values = np.atleast_1d(np.asarray(values, dtype=float))
+        buckets = np.searchsorted(self.levels, values)
+        found = buckets < len(self.levels)
+        found[found] = self.levels[buckets[found]] == values[found]
+        if not found.all():
+            raise ValueError(f"估值 {values[~found][0]} 不在创建引擎时提供的估值中")
+        return buckets
+
+    def _insert(self, day: int, bucket: int) -> None:
+        self.tree.add(bucket, 1)
+        self.count += 1
+        if self.window_days is not None:
+            self.window.append((day, bucket))
+
+    def add(self, day: int, value: float) -> float:
+        """
+        加入一天的估值并返回它的百分位
+
+        Args:
+            day: 日期序号（自1970-01-01起的天数），必须单调不减
+            value: 当天的估值，必须在创建引擎时提供的估值中
+
+        Returns:
+            float: 百分位，取值范围 (0, 1]
+        """
+        return self._add_bucket(day, int(self._buckets(value)[0]))
+
+    def _add_bucket(self, day: int, bucket: int) -> float:
+        if self.window_days is not None:
+            while self.window and self.window[0][0] <= day - self.window_days:
+                _, expired = self.window.popleft()
+                self.tree.add(expired, -1)
+                self.count -= 1
+
+        self._insert(day, bucket)
+        return self.tree.prefix_sum(bucket) / self.count
+
+    def load_history(self, dates: pd.DatetimeIndex, values: Iterable[float]) -> None:
+        """载入已经计算过百分位的历史估值，只更新窗口状态，不计算百分位"""
+        days = pd.DatetimeIndex(dates).values.astype('datetime64[D]').astype(np.int64)
+        for day, bucket in zip(days, self._buckets(values)):
+            self._insert(int(day), int(bucket))
+
+    def extend(self, dates: pd.DatetimeIndex, values: Iterable[float]) -> np.ndarray:
+        """依次加入多天的估值，返回每天的百分位"""
+        days = pd.DatetimeIndex(dates).values.astype('datetime64[D]').astype(np.int64)
+        return np.array([self._add_bucket(int(day), int(bucket)) for day, bucket in zip(days, self._buckets(values))])
+
+
+def compute_percentile_ranks(values: pd.Series, window_years: Optional[int] = None) -> pd.Series:
+    """
+    计算估值序列每个日期的百分位
+
+    Args:
+        values: 以日期为索引、按日期升序排列的估值序列
+        window_years: 回看窗口（年），None 表示使用全部历史
+
+    Returns:
+        Series: 与 values 对齐的百分位
+    """
+    engine = PercentileRankEngine(values.to_numpy(dtype=float), window_years)
+    return pd.Series(engine.extend(values.index, values.to_numpy(dtype=float)), index=values.index)
+
+
+def _window_key(window_years: Optional[int]) -> int:
+    return EXPANDING_WINDOW if window_years is None else int(window_years)
+
+
+def init_pe_ttm_rank_table(conn: sqlite3.Connection) -> None:
+    """创建 pe_ttm_rank 表和记录各产品已处理的入库日志版本的 pe_ttm_rank_state 表（如不存在）"""
+    conn.executescript('''
+    CREATE TABLE IF NOT EXISTS pe_ttm_rank (
+        symbol VARCHAR(20) NOT NULL,
+        trade_date DATE NOT NULL,
+        window_years INTEGER NOT NULL,
+        pe_ttm DECIMAL(10,2) NOT NULL,
+        percentile_rank DECIMAL(10,6) NOT NULL,
+        UNIQUE (symbol, window_years, trade_date)
+    );
+
+    CREATE TABLE IF NOT EXISTS pe_ttm_rank_state (
+        symbol VARCHAR(20) PRIMARY KEY,
+        journal_version INTEGER NOT NULL,
+        updated_at TIMESTAMP NOT NULL
+    );
+    ''')
+
+
+@profiled('update_pe_ttm_ranks')
+def update_pe_ttm_ranks(symbol: str = 'SPY', windows=DEFAULT_WINDOWS, db_path: str = DB_PATH) -> None:
+    """
+    增量更新某个产品的PE-TTM百分位
+
+    从最早需要计算的日期开始重新计算：新日期、之前没有估值后来补全的日期、已保存日期的PE-TTM被修改或清空的日期，
+    以及入库日志（见 ingestion_journal）中上次更新之后 pe_ttm 有变化的最早日期。
+    该日期之前的百分位保持不变，窗口状态直接由已有的估值载入，不重新计算这些日期的百分位。
+
+    Args:
+        symbol: 产品代码，默认为 'SPY'
+        windows: 需要维护的回看窗口（年）列表，None 表示全部历史
+        db_path: 数据库路径
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        init_pe_ttm_rank_table(conn)
+        journal_version = current_version(conn)
+        journal_dirty = first_dirty_dates(conn, 'pe_ttm_rank_state', ('pe_ttm',)).get(symbol)
+        values = pd.read_sql_query('''
+            SELECT trade_date, pe_ttm FROM stock_price
+            WHERE symbol = ? AND pe_ttm IS NOT NULL
+            ORDER BY trade_date
+        ''', conn, params=(symbol,))
+        if values.empty:
+            print(f"{symbol} 没有PE-TTM数据，跳过百分位更新")
+            return
+        values['trade_date'] = pd.to_datetime(values['trade_date'])
+        pe_ttm = values.set_index('trade_date')['pe_ttm'].astype(float)
+
+        for window_years in windows:
+            window_key = _window_key(window_years)
+            stored = pd.read_sql_query('''
+                SELECT trade_date, pe_ttm FROM pe_ttm_rank
+                WHERE symbol = ? AND window_years = ?
+                ORDER BY trade_date
+            ''', conn, params=(symbol, window_key))
+            stored['trade_date'] = pd.to_datetime(stored['trade_date'])
+            stored = stored.set_index('trade_date')['pe_ttm'].astype(float)
+
+            # 第一个需要（重新）计算的日期：已保存的估值被修改或清空的日期，
+            # 以及有估值但还没有百分位的日期（新日期和之前为空、之后补全的日期）
+            current = pe_ttm.reindex(stored.index)
+            changed = stored.index[current.to_numpy() != stored.to_numpy()]
+            missing = pe_ttm.index.difference(stored.index)
+            candidates = [dates[0] for dates in (changed, missing) if len(dates)]
+            if journal_dirty and len(stored):
+                candidates.append(pd.Timestamp(journal_dirty))
+            if not candidates:
+                print(f"{symbol} 窗口 {window_key} 年的PE-TTM百分位已是最新")
+                continue
+            first_dirty = min(candidates)
+            conn.execute('DELETE FROM pe_ttm_rank WHERE symbol = ? AND window_years = ? AND trade_date >= ?',
+                         (symbol, window_key, first_dirty.strftime('%Y-%m-%d')))
+            start = pe_ttm.index.searchsorted(first_dirty)
+            if start >= len(pe_ttm):
+                # 只是删除了最后几天的估值
+                conn.commit()
+                continue
+
+            engine = PercentileRankEngine(pe_ttm.to_numpy(), window_years)
+            # 载入新日期之前仍在窗口内的估值
+            history = pe_ttm.iloc[:start]
+            if engine.window_days is not None:
+                history = history[history.index > pe_ttm.index[start] - pd.Timedelta(days=engine.window_days)]
+            engine.load_history(history.index, history.to_numpy())
+
+            new_values = pe_ttm.iloc[start:]
+            ranks = engine.extend(new_values.index, new_values.to_numpy())
+            conn.executemany('''
+                INSERT INTO pe_ttm_rank (symbol, trade_date, window_years, pe_ttm, percentile_rank)
+                VALUES (?, ?, ?, ?, ?)
+            ''', [
+                (symbol, trade_date.strftime('%Y-%m-%d'), window_key, float(value), float(rank))
+                for trade_date, value, rank in zip(new_values.index, new_values.to_numpy(), ranks)
+            ])
+            conn.commit()
+            print(f"更新了 {symbol} 窗口 {window_key} 年的 {len(new_values)} 条PE-TTM百分位记录")
+        conn.execute('INSERT OR REPLACE INTO pe_ttm_rank_state (symbol, journal_version, updated_at) VALUES (?, ?, ?)',
+                     (symbol, journal_version, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def load_pe_ttm_ranks(symbol: str = 'SPY', window_years: Optional[int] = None, db_path: str = DB_PATH) -> pd.Series:
+    """
+    读取已保存的PE-TTM百分位
+
+    Args:
+        symbol: 产品代码，默认为 'SPY'
+        window_years: 回看窗口（年），None 表示全部历史
+        db_path: 数据库路径
+
+    Returns:
+        Series: 以日期为索引的百分位，尚未计算时为空
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        if not conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'pe_ttm_rank'").fetchone():
+            return pd.Series(dtype=float, index=pd.DatetimeIndex([], name='trade_date'), name='percentile_rank')
+        ranks = pd.read_sql_query('''
+            SELECT trade_date, percentile_rank FROM pe_ttm_rank
+            WHERE symbol = ? AND window_years = ?
+            ORDER BY trade_date
+        ''', conn, params=(symbol, _window_key(window_years)))
+    finally:
+        conn.close()
+    ranks['trade_date'] = pd.to_datetime(ranks['trade_date'])
+    return ranks.set_index('trade_date')['percentile_rank'].astype(float)
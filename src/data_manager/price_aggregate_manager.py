@@ -0,0 +1,319 @@
+"""
+周线/月线聚合管理模块
+把 stock_price 和 fund_nav 中的日线按周、按月聚合，增量保存到数据库的 price_aggregate 表，
+供 frequency 为 'W' 或 'M' 的低频回测直接读取
+
+周期按日历划分，周线在月初处截断（跨月的一周分为两个周期），因此每个月、每年的第一个交易日都是某个周期的第一个交易日。
+每个周期保存第一个交易日 first_date 及其收盘价 first_close、最后一个交易日 trade_date 及其收盘价 close：
+回测在周期的第一个交易日再平衡、在最后一个交易日估值，两次再平衡之间持仓不变，
+所以按年、按月再平衡的结果与日线回测在每个周期末完全相同（再平衡价格的取法见 combine_period_parts）。
+"""
+import sqlite3
+from datetime import datetime
+from typing import Iterable, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+from common.constants import DB_PATH
+from common.profiling import profiled
+from data_manager.ingestion_journal import current_version, first_dirty_dates
+
+DAILY = 'D'
+AGGREGATE_FREQUENCIES = ('W', 'M')
+SUPPORTED_FREQUENCIES = (DAILY,) + AGGREGATE_FREQUENCIES
+
+# 低频价格数据中周期第一个交易日收盘价列的后缀，不以 _close 结尾，避免被当作产品列
+FIRST_PRICE_SUFFIX = '_first_price'
+
+_ONE_DAY = pd.Timedelta(days=1)
+
+# (收盘价, 周期内第一个收盘价, 是否在周期第一个交易日有数据)，三个表的索引和列相同，列名为 <产品代码>_close
+PeriodParts = Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]
+
+
+def _check_frequency(frequency: str) -> None:
+    if frequency not in AGGREGATE_FREQUENCIES:
+        raise ValueError(f"不支持的聚合周期 {frequency}，应为 {AGGREGATE_FREQUENCIES} 之一")
+
+
+def calendar_period_start(dates: pd.DatetimeIndex, frequency: str) -> pd.DatetimeIndex:
+    """
+    返回每个日期所在日历周期的第一天
+
+    Args:
+        dates: 日期
+        frequency: 'W' 表示周（周一开始，在月初处截断），'M' 表示月
+
+    Returns:
+        DatetimeIndex: 与 dates 对齐的周期起始日期
+    """
+    _check_frequency(frequency)
+    dates = pd.DatetimeIndex(dates).normalize()
+    month_start = dates.to_period('M').start_time
+    if frequency == 'M':
+        return pd.DatetimeIndex(month_start)
+    week_start = dates - pd.to_timedelta(dates.weekday, unit='D')
+    return pd.DatetimeIndex(np.maximum(week_start.values, month_start.values))
+
+
+def calendar_period_end(dates: pd.DatetimeIndex, frequency: str) -> pd.DatetimeIndex:
+    """返回每个日期所在日历周期的最后一天，参数同 calendar_period_start"""
+    _check_frequency(frequency)
+    dates = pd.DatetimeIndex(dates).normalize()
+    month_end = dates.to_period('M').end_time.normalize()
+    if frequency == 'M':
+        return pd.DatetimeIndex(month_end)
+    week_end = dates + pd.to_timedelta(6 - dates.weekday, unit='D')
+    return pd.DatetimeIndex(np.minimum(week_end.values, month_end.values))
+
+
+def aggregate_close_parts(daily: pd.DataFrame, frequency: str, split_first_day: bool = True) -> PeriodParts:
+    """
+    把 load_portfolio_data 格式的日线收盘价按周期聚合，结果交给 combine_period_parts 合并
+
+    Args:
+        daily: 以日期为索引、列为 <产品代码>_close 的日线收盘价，可以包含缺失值
+        frequency: 'W' 或 'M'
+        split_first_day: 是否把第一个日期单独作为一行，使回测的初始持仓按当天收盘价建立
+
+    Returns:
+        PeriodParts: 索引为每个周期最后一个交易日的 (收盘价, 周期内第一个收盘价, 是否在周期第一个交易日有数据)
+    """
+    keys = calendar_period_start(daily.index, frequency)
+    if split_first_day and len(keys):
+        # 第一个日期单独成组，组号比同周期其余日期小
+        keys = keys.where(np.arange(len(keys)) != 0, keys[0] - _ONE_DAY)
+    groups = daily.groupby(keys, sort=True)
+    close = groups.last()
+    first_close = groups.first()
+    on_first_day = daily[~keys.duplicated(keep='first')].notna()
+    labels = pd.Series(daily.index, index=daily.index).groupby(keys, sort=True).max()
+
+    index = pd.DatetimeIndex(labels.to_numpy(), name=daily.index.name)
+    close.index = first_close.index = on_first_day.index = index
+    return close, first_close, on_first_day
+
+
+def combine_period_parts(parts: List[PeriodParts], columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    按时间顺序合并各段周期数据，计算每个产品在周期第一个交易日的价格
+
+    周期第一个交易日指所有产品合在一起的第一个交易日，与日线回测的再平衡日相同：
+    产品当天有数据时为当天收盘价；当天没有数据但之前有数据时，与日线回测的 ffill 相同，沿用上一个收盘价；
+    此前从没有数据时，与日线回测的 bfill 相同，为产品在周期内的第一个收盘价。
+
+    Args:
+        parts: aggregate_close_parts 或 load_period_parts 的结果，按时间顺序排列
+        columns: 结果中的 <产品代码>_close 列，默认为各段列的并集
+
+    Returns:
+        DataFrame: 索引为每个周期最后一个交易日，每个产品两列：
+            <产品代码>_close 为周期内最后一个收盘价，<产品代码>_first_price 为周期第一个交易日的价格；
+            产品开始有数据之前的周期为NaN
+    """
+    parts = [part for part in parts if len(part[0])]
+    if columns is None:
+        columns = sorted({col for part in parts for col in part[0].columns})
+    if not parts:
+        return pd.DataFrame(columns=_interleave_columns(columns), index=pd.DatetimeIndex([], name='date'), dtype=float)
+
+    close, first_close, on_first_day = (
+        pd.concat([part[k].reindex(columns=columns) for part in parts]) for k in range(3)
+    )
+    previous_close = close.ffill().shift()
+    on_first_day = on_first_day.fillna(False).astype(bool)
+    first_price = first_close.where(on_first_day, previous_close.where(previous_close.notna(), first_close))
+
+    first_price.columns = [col[:-len('_close')] + FIRST_PRICE_SUFFIX for col in columns]
+    return pd.concat([close, first_price], axis=1)[_interleave_columns(columns)]
+
+
+def aggregate_close_panel(daily: pd.DataFrame, frequency: str) -> pd.DataFrame:
+    """
+    把 load_portfolio_data 格式的日线收盘价聚合为周期数据，第一个日期单独作为一行
+
+    Returns:
+        DataFrame: combine_period_parts 格式的数据
+    """
+    return combine_period_parts([aggregate_close_parts(daily, frequency)], list(daily.columns))
+
+
+def _interleave_columns(columns: List[str]) -> List[str]:
+    """按产品交替排列收盘价列和周期第一个交易日价格列"""
+    result = []
+    for col in columns:
+        result += [col, col[:-len('_close')] + FIRST_PRICE_SUFFIX]
+    return result
+
+
+def init_price_aggregate_table(conn: sqlite3.Connection) -> None:
+    """创建 price_aggregate 表和记录各产品已处理的入库日志版本的 price_aggregate_state 表（如不存在）"""
+    conn.executescript('''
+    CREATE TABLE IF NOT EXISTS price_aggregate (
+        symbol VARCHAR(20) NOT NULL,
+        frequency CHAR(1) NOT NULL,
+        period_start DATE NOT NULL,
+        period_end DATE NOT NULL,
+        first_date DATE NOT NULL,
+        trade_date DATE NOT NULL,
+        open DECIMAL(10,3),
+        high DECIMAL(10,3),
+        low DECIMAL(10,3),
+        close DECIMAL(10,3) NOT NULL,
+        first_close DECIMAL(10,3) NOT NULL,
+        UNIQUE (symbol, frequency, period_start)
+    );
+
+    CREATE TABLE IF NOT EXISTS price_aggregate_state (
+        symbol VARCHAR(20) PRIMARY KEY,
+        journal_version INTEGER NOT NULL,
+        updated_at TIMESTAMP NOT NULL
+    );
+    ''')
+
+
+def _load_daily_bars(conn: sqlite3.Connection, symbol: str, start_date: str) -> pd.DataFrame:
+    """读取某个产品从 start_date 开始的日线，基金净值的开盘、最高、最低价都等于净值"""
+    bars = pd.read_sql_query('''
+        SELECT trade_date AS date, open, high, low, close FROM stock_price
+        WHERE symbol = ? AND trade_date >= ? AND close IS NOT NULL
+        UNION ALL
+        SELECT nav_date AS date, nav AS open, nav AS high, nav AS low, nav AS close FROM fund_nav
+        WHERE fund_code = ? AND nav_date >= ? AND nav IS NOT NULL
+        ORDER BY date
+    ''', conn, params=(symbol, start_date, symbol, start_date))
+    bars['date'] = pd.to_datetime(bars['date'])
+    return bars.set_index('date').astype(float)
+
+
+def aggregate_daily_bars(bars: pd.DataFrame, frequency: str) -> pd.DataFrame:
+    """
+    把单个产品的日线OHLC聚合为周期K线
+
+    Args:
+        bars: 以日期为索引、包含 open、high、low、close 的日线
+        frequency: 'W' 或 'M'
+
+    Returns:
+        DataFrame: 每个周期一行，列为 period_start、period_end、first_date、trade_date、
+            open、high、low、close、first_close
+    """
+    dates = pd.Series(bars.index, index=bars.index)
+    keys = calendar_period_start(bars.index, frequency)
+    groups = bars.groupby(keys, sort=True)
+    result = pd.DataFrame({
+        'first_date': dates.groupby(keys, sort=True).min(),
+        'trade_date': dates.groupby(keys, sort=True).max(),
+        'open': groups['open'].first(),
+        'high': groups['high'].max(),
+        'low': groups['low'].min(),
+        'close': groups['close'].last(),
+        'first_close': groups['close'].first(),
+    })
+    result.insert(0, 'period_start', result.index)
+    result.insert(1, 'period_end', calendar_period_end(result.index, frequency))
+    return result.reset_index(drop=True)
+
+
+def _all_symbols(conn: sqlite3.Connection) -> list:
+    return [row[0] for row in conn.execute(
+        'SELECT DISTINCT symbol FROM stock_price UNION SELECT DISTINCT fund_code FROM fund_nav')]
+
+
+@profiled('update_price_aggregates')
+def update_price_aggregates(symbols: Optional[Iterable[str]] = None, frequencies=AGGREGATE_FREQUENCIES,
+                            db_path: str = DB_PATH) -> int:
+    """
+    增量更新周线/月线聚合
+
+    每个产品只重新计算最后一个已保存的周期（它可能还没有结束）及之后的日线，历史周期不再重复计算；
+    入库日志（见 ingestion_journal）显示更早的日线有变化时，从最早变化日期所在的周期开始重新计算。
+
+    Args:
+        symbols: 需要更新的产品代码，None 表示数据库中的全部产品
+        frequencies: 需要维护的周期
+        db_path: 数据库路径
+
+    Returns:
+        int: 写入的周期记录数
+    """
+    conn = sqlite3.connect(db_path)
+    written = 0
+    try:
+        init_price_aggregate_table(conn)
+        journal_version = current_version(conn)
+        dirty = first_dirty_dates(conn, 'price_aggregate_state', ('stock_price', 'fund_nav'))
+        symbols = _all_symbols(conn) if symbols is None else list(symbols)
+        for symbol in symbols:
+            for frequency in frequencies:
+                _check_frequency(frequency)
+                last_start = conn.execute(
+                    'SELECT MAX(period_start) FROM price_aggregate WHERE symbol = ? AND frequency = ?',
+                    (symbol, frequency)).fetchone()[0]
+                if last_start and symbol in dirty:
+                    dirty_start = calendar_period_start(pd.DatetimeIndex([dirty[symbol]]), frequency)[0]
+                    last_start = min(last_start, dirty_start.strftime('%Y-%m-%d'))
+                bars = _load_daily_bars(conn, symbol, last_start or '0000-01-01')
+                if bars.empty:
+                    continue
+                periods = aggregate_daily_bars(bars, frequency)
+                if last_start:
+                    conn.execute('DELETE FROM price_aggregate WHERE symbol = ? AND frequency = ? AND period_start >= ?',
+                                 (symbol, frequency, last_start))
+                conn.executemany('''
+                    INSERT INTO price_aggregate (symbol, frequency, period_start, period_end, first_date, trade_date,
+                                                 open, high, low, close, first_close)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', [
+                    (symbol, frequency, *(value.strftime('%Y-%m-%d') for value in row[:4]), *map(float, row[4:]))
+                    for row in periods.itertuples(index=False)
+                ])
+                written += len(periods)
+            conn.execute('INSERT OR REPLACE INTO price_aggregate_state (symbol, journal_version, updated_at) VALUES (?, ?, ?)',
+                         (symbol, journal_version, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+            conn.commit()
+    finally:
+        conn.close()
+    return written
+
+
+def load_period_parts(conn: sqlite3.Connection, symbols: List[str], frequency: str,
+                      first_period: str, last_period_end: str) -> PeriodParts:
+    """
+    读取 [first_period, last_period_end] 内完整周期的聚合数据，结果交给 combine_period_parts 合并
+
+    Args:
+        conn: 数据库连接
+        symbols: 产品代码列表
+        frequency: 'W' 或 'M'
+        first_period: 第一个周期的起始日期
+        last_period_end: 最后一个周期的结束日期
+
+    Returns:
+        PeriodParts: 与 aggregate_close_parts 格式相同，缺少聚合记录的产品不包含在列中
+    """
+    init_price_aggregate_table(conn)
+    placeholders = ','.join(['?'] * len(symbols))
+    rows = pd.read_sql_query(f'''
+        SELECT symbol, period_start, first_date, trade_date, close, first_close
+        FROM price_aggregate
+        WHERE frequency = ? AND symbol IN ({placeholders})
+        AND period_start >= ? AND period_end <= ?
+    ''', conn, params=[frequency, *symbols, first_period, last_period_end])
+
+    # 周期第一个交易日为各产品第一个交易日中最早的一个；不同市场的最后一个交易日可能不同，取最晚的一个作为索引
+    by_period = rows.groupby('period_start')
+    rows['on_first_day'] = rows['first_date'] == by_period['first_date'].transform('min')
+    labels = by_period['trade_date'].max()
+
+    parts = []
+    for values in ('close', 'first_close', 'on_first_day'):
+        part = rows.pivot(index='period_start', columns='symbol', values=values)
+        part.index = pd.DatetimeIndex(pd.to_datetime(labels.reindex(part.index).to_numpy()), name='date')
+        part.columns = [f"{col}_close" for col in part.columns]
+        parts.append(part)
+    return tuple(parts)
+
+
+if __name__ == "__main__":
+    count = update_price_aggregates()
+    print(f"更新了 {count} 条周线/月线聚合记录")
@@ -0,0 +1,263 @@
+"""
+区间极值与区间最大回撤索引模块
+对每个产品的收盘价建立稀疏表（sparse table）：第 k 层保存从每个位置开始、长度为 2^k 的区间的摘要 (最大值, 最小值, 最大回撤)
+
+- 区间最大值/最小值：两个可以重叠的 2^k 区间覆盖查询区间，O(1)
+- 区间最大回撤：摘要的合并（同 rolling_metrics._combine）满足结合律但不可重叠，
+  把查询区间按长度的二进制位拆成互不重叠的 2^k 区间从左到右合并，O(log n)
+- 所有查询都对一批区间向量化计算，每一层只做一次数组运算，适合每个起点 × 每个期限的全量扫描
+- 新的交易日只需计算各层末尾受影响的位置，不重建整个表
+
+DrawdownIndex 从 return_index 表（见 return_index_manager）读取收盘价并按入库日志增量刷新，
+rolling_start_table 与 ReturnIndex 一起生成滚动起点分析表。
+
+使用方法：
+    index = DrawdownIndex()
+    index.max_drawdowns('510300', starts, ends)
+    rolling_start_table('510300', '2013-01-01', '2020-01-01', years=(1, 3, 5))
+"""
+import sqlite3
+from typing import Dict, Iterable, List, Optional
+import numpy as np
+import pandas as pd
+from common.constants import DB_PATH
+from data_manager.ingestion_journal import current_version, dirty_ranges
+from data_manager.return_index_manager import ReturnIndex, init_return_index_table
+
+
+class SparseRangeIndex:
+    def __init__(self, values: Iterable[float] = ()):
+        """
+        建立稀疏表
+
+        Args:
+            values: 按时间排列的价格或净值，不能包含 NaN
+        """
+        self.values = np.empty(0)
+        # 第 k 层的第 i 项为 values[i:i+2^k] 的摘要
+        self._max: List[np.ndarray] = []
+        self._min: List[np.ndarray] = []
+        self._drawdown: List[np.ndarray] = []
+        self.extend(values)
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def extend(self, values: Iterable[float]) -> None:
+        """在末尾追加数据，每层只计算包含新数据的区间"""
+        values = np.asarray(values, dtype=float)
+        if len(values) == 0:
+            return
+        old = len(self.values)
+        self.values = np.concatenate((self.values, values))
+        n = len(self.values)
+        if not self._max:
+            self._max.append(self.values.copy())
+            self._min.append(self.values.copy())
+            self._drawdown.append(np.zeros(n))
+        else:
+            self._max[0] = self.values.copy()
+            self._min[0] = self.values.copy()
+            self._drawdown[0] = np.zeros(n)
+
+        k = 1
+        while (1 << k) <= n:
+            half = 1 << (k - 1)
+            size = n - (1 << k) + 1
+            first = max(0, old - (1 << k) + 1)
+            # 新区间由上一层相邻的两个区间合并
+            left = slice(first, size)
+            right = slice(first + half, size + half)
+            prev_max, prev_min, prev_drawdown = self._max[k - 1], self._min[k - 1], self._drawdown[k - 1]
+            block_max = np.maximum(prev_max[left], prev_max[right])
+            block_min = np.minimum(prev_min[left], prev_min[right])
+            block_drawdown = np.minimum(np.minimum(prev_drawdown[left], prev_drawdown[right]),
+                                        prev_min[right] / prev_max[left] - 1)
+            if k < len(self._max):
+                self._max[k] = np.concatenate((self._max[k][:first], block_max))
+                self._min[k] = np.concatenate((self._min[k][:first], block_min))
+                self._drawdown[k] = np.concatenate((self._drawdown[k][:first], block_drawdown))
+            else:
+                self._max.append(block_max)
+                self._min.append(block_min)
+                self._drawdown.append(block_drawdown)
+            k += 1
+
+    def _positions(self, starts, ends):
+        starts = np.atleast_1d(np.asarray(starts, dtype=np.int64))
+        ends = np.atleast_1d(np.asarray(ends, dtype=np.int64))
+        starts, ends = np.broadcast_arrays(starts, ends)
+        valid = (starts >= 0) & (starts <= ends) & (ends < len(self.values))
+        return np.where(valid, starts, 0), np.where(valid, ends, 0), valid
+
+    def _extreme(self, tables: List[np.ndarray], reduce, starts, ends) -> np.ndarray:
+        starts, ends, valid = self._positions(starts, ends)
+        levels = np.floor(np.log2(ends - starts + 1)).astype(np.int64)
+        result = np.full(len(starts), np.nan)
+        for k in np.unique(levels[valid]):
+            mask = valid & (levels == k)
+            table = tables[k]
+            result[mask] = reduce(table[starts[mask]], table[ends[mask] - (1 << k) + 1])
+        return result
+
+    def range_max(self, starts, ends) -> np.ndarray:
+        """
+        多个区间 [start, end]（位置，含首尾）的最大值，O(1)
+
+        Returns:
+            ndarray: 无效区间（越界或 start > end）为 NaN
+        """
+        return self._extreme(self._max, np.maximum, starts, ends)
+
+    def range_min(self, starts, ends) -> np.ndarray:
+        """多个区间的最小值，参数同 range_max"""
+        return self._extreme(self._min, np.minimum, starts, ends)
+
+    def max_drawdowns(self, starts, ends) -> np.ndarray:
+        """
+        多个区间 [start, end]（位置，含首尾）内的最大回撤，O(log n)
+
+        Returns:
+            ndarray: 最大回撤（负数或0，如-0.12表示回撤12%），无效区间为 NaN
+        """
+        starts, ends, valid = self._positions(starts, ends)
+        position = starts.copy()
+        running_max = np.full(len(starts), np.nan)
+        drawdown = np.zeros(len(starts))
+        for k in range(len(self._max) - 1, -1, -1):
+            take = np.flatnonzero(valid & (position + (1 << k) - 1 <= ends))
+            if len(take) == 0:
+                continue
+            at = position[take]
+            block_min = self._min[k][at]
+            # running_max 为 NaN（第一个区间）时 fmin 忽略跨区间的回撤
+            drawdown[take] = np.fmin(np.minimum(drawdown[take], self._drawdown[k][at]),
+                                     block_min / running_max[take] - 1)
+            running_max[take] = np.fmax(running_max[take], self._max[k][at])
+            position[take] += 1 << k
+        return np.where(valid, drawdown, np.nan)
+
+
+class DrawdownIndex:
+    def __init__(self, db_path: str = DB_PATH):
+        """
+        按产品缓存稀疏表的查询接口，数据来自 return_index 表的收盘价
+
+        Args:
+            db_path: 数据库路径
+        """
+        self.db_path = db_path
+        self._indexes: Dict[str, SparseRangeIndex] = {}
+        self._dates: Dict[str, np.ndarray] = {}
+        self._journal_versions: Dict[str, int] = {}
+
+    def _read_closes(self, symbol: str, after: Optional[str] = None) -> pd.DataFrame:
+        conn = sqlite3.connect(self.db_path)
+        try:
+            init_return_index_table(conn)
+            self._journal_versions[symbol] = current_version(conn)
+            return pd.read_sql_query('''
+                SELECT trade_date, close FROM return_index
+                WHERE symbol = ? AND trade_date > ? ORDER BY trade_date
+            ''', conn, params=(symbol, after or '0000-01-01'))
+        finally:
+            conn.close()
+
+    def _load(self, symbol: str) -> SparseRangeIndex:
+        if symbol not in self._indexes:
+            rows = self._read_closes(symbol)
+            if rows.empty:
+                raise ValueError(f"{symbol} 没有累计收益指数，请先运行 update_return_index")
+            self._indexes[symbol] = SparseRangeIndex(rows['close'].to_numpy(dtype=float))
+            self._dates[symbol] = pd.to_datetime(rows['trade_date']).values
+        return self._indexes[symbol]
+
+    def refresh(self, symbol: str) -> None:
+        """
+        读取 return_index 中的新数据：只有新追加的交易日时增量扩展稀疏表，已加载的日期被修正时重建
+
+        应在 update_return_index 之后调用。
+        """
+        if symbol not in self._indexes:
+            return
+        last_date = pd.Timestamp(self._dates[symbol][-1]).strftime('%Y-%m-%d')
+        changed = dirty_ranges(self._journal_versions[symbol], [symbol], ('stock_price', 'fund_nav'), self.db_path)
+        if symbol in changed and changed[symbol][0] <= last_date:
+            del self._indexes[symbol]
+            self._load(symbol)
+            return
+        rows = self._read_closes(symbol, last_date)
+        if not rows.empty:
+            self._indexes[symbol].extend(rows['close'].to_numpy(dtype=float))
+            self._dates[symbol] = np.concatenate((self._dates[symbol], pd.to_datetime(rows['trade_date']).values))
+
+    def last_date(self, symbol: str) -> np.datetime64:
+        """已加载的最后一个交易日"""
+        self._load(symbol)
+        return self._dates[symbol][-1]
+
+    def _window_positions(self, symbol: str, starts, ends):
+        """与 ReturnIndex 相同，开始和结束日期都取当天或之前最后一个交易日，早于第一个交易日时位置为 -1"""
+        dates = self._dates[symbol]
+        starts = pd.to_datetime(np.atleast_1d(np.asarray(starts))).values
+        ends = pd.to_datetime(np.atleast_1d(np.asarray(ends))).values
+        return np.searchsorted(dates, starts, side='right') - 1, np.searchsorted(dates, ends, side='right') - 1
+
+    def max_drawdowns(self, symbol: str, starts, ends) -> np.ndarray:
+        """
+        多个日期区间内的最大回撤
+
+        Args:
+            symbol: 产品代码
+            starts: 开始日期，单个日期或数组
+            ends: 结束日期，与 starts 形状相同或可以广播
+
+        Returns:
+            ndarray: 最大回撤（负数或0），开始日期早于第一个交易日或晚于结束日期时为 NaN
+        """
+        index = self._load(symbol)
+        return index.max_drawdowns(*self._window_positions(symbol, starts, ends))
+
+    def range_max(self, symbol: str, starts, ends) -> np.ndarray:
+        """多个日期区间内的最高收盘价，参数同 max_drawdowns"""
+        index = self._load(symbol)
+        return index.range_max(*self._window_positions(symbol, starts, ends))
+
+    def range_min(self, symbol: str, starts, ends) -> np.ndarray:
+        """多个日期区间内的最低收盘价，参数同 max_drawdowns"""
+        index = self._load(symbol)
+        return index.range_min(*self._window_positions(symbol, starts, ends))
+
+
+def rolling_start_table(symbol: str, first_start: str, last_start: str, years: Iterable[int] = (1, 3, 5),
+                        step_months: int = 1, db_path: str = DB_PATH) -> pd.DataFrame:
+    """
+    滚动起点分析表：每个起始日期持有不同年数的收益率、年化收益率和最大回撤
+
+    与 experiment_runner 的 rolling_windows 相同，结束日期为起始日期加 365*年数 天。
+
+    Args:
+        symbol: 产品代码
+        first_start: 第一个起始日期
+        last_start: 最后一个起始日期
+        years: 持有年数列表
+        step_months: 相邻起始日期相隔的月数
+        db_path: 数据库路径
+
+    Returns:
+        DataFrame: 以起始日期为索引，每个持有年数 N 有 N年收益率、N年年化收益率、N年最大回撤 三列；
+            结束日期超出数据范围的窗口为 NaN
+    """
+    starts = pd.date_range(first_start, last_start, freq=pd.DateOffset(months=step_months))
+    return_index = ReturnIndex(db_path)
+    drawdown_index = DrawdownIndex(db_path)
+    last_date = drawdown_index.last_date(symbol)
+
+    table = pd.DataFrame(index=pd.DatetimeIndex(starts, name='start_date'))
+    for n in years:
+        ends = (starts + pd.Timedelta(days=365 * n)).values
+        complete = ends <= last_date
+        table[f'{n}年收益率'] = np.where(complete, return_index.window_returns(symbol, starts.values, ends), np.nan)
+        table[f'{n}年年化收益率'] = np.where(complete, return_index.annualized_returns(symbol, starts.values, ends), np.nan)
+        table[f'{n}年最大回撤'] = np.where(complete, drawdown_index.max_drawdowns(symbol, starts.values, ends), np.nan)
+    return table
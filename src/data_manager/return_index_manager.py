@@ -0,0 +1,221 @@
+"""
+累计收益指数模块
+为每个产品保存累计对数收益指数 log_index（日对数收益率的前缀和，第一个交易日为0），
+任意两个日期之间的收益率为 exp(log_index[end] - log_index[start]) - 1，查询只需两次数组下标访问
+
+- return_index 表：每个产品每个交易日一行，入库后由 update_return_index 增量维护
+- 增量更新按入库日志（见 ingestion_journal）确定需要重新计算的起始日期：新追加的数据只计算新日期，
+  历史数据被修正时从被修正的最早日期开始重新计算，之前的指数不变
+- ReturnIndex 把指数展开为按自然日排列的数组（每天取当天或之前最后一个交易日的值），
+  window_returns 可以一次向量化地计算数百万个 (开始日期, 结束日期) 的收益率，适合滚动起点研究
+
+使用方法：
+    python -m data_manager.return_index_manager update
+    python -m data_manager.return_index_manager query 510300 2015-01-01 2020-12-31
+    ReturnIndex().window_returns('510300', starts, ends)
+"""
+import argparse
+import sqlite3
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Tuple
+import numpy as np
+import pandas as pd
+from common.constants import DB_PATH
+from common.profiling import profiled
+from data_manager.ingestion_journal import current_version, first_dirty_dates
+
+_EPOCH = np.datetime64('1970-01-01', 'D')
+
+
+def init_return_index_table(conn: sqlite3.Connection) -> None:
+    """创建 return_index 表和记录各产品已处理的入库日志版本的 return_index_state 表（如不存在）"""
+    conn.executescript('''
+    CREATE TABLE IF NOT EXISTS return_index (
+        symbol VARCHAR(20) NOT NULL,
+        trade_date DATE NOT NULL,
+        close DECIMAL(10,3) NOT NULL,
+        log_index REAL NOT NULL,
+        UNIQUE (symbol, trade_date)
+    );
+
+    CREATE TABLE IF NOT EXISTS return_index_state (
+        symbol VARCHAR(20) PRIMARY KEY,
+        journal_version INTEGER NOT NULL,
+        updated_at TIMESTAMP NOT NULL
+    );
+    ''')
+
+
+def _all_symbols(conn: sqlite3.Connection) -> list:
+    return [row[0] for row in conn.execute(
+        'SELECT DISTINCT symbol FROM stock_price UNION SELECT DISTINCT fund_code FROM fund_nav')]
+
+
+@profiled('update_return_index')
+def update_return_index(symbols: Optional[Iterable[str]] = None, db_path: str = DB_PATH) -> int:
+    """
+    增量更新累计收益指数
+
+    每个产品从最后一个已保存日期的下一天开始计算；入库日志显示更早的日期有变化时，从最早变化的日期开始重新计算。
+    重新计算的起点之前的指数不变，新的指数接在起点前最后一个已保存的交易日之后。
+
+    Args:
+        symbols: 需要更新的产品代码，None 表示数据库中的全部产品
+        db_path: 数据库路径
+
+    Returns:
+        int: 写入的记录数
+    """
+    conn = sqlite3.connect(db_path)
+    written = 0
+    try:
+        init_return_index_table(conn)
+        journal_version = current_version(conn)
+        dirty = first_dirty_dates(conn, 'return_index_state', ('stock_price', 'fund_nav'))
+        symbols = _all_symbols(conn) if symbols is None else list(symbols)
+        for symbol in symbols:
+            last_date = conn.execute('SELECT MAX(trade_date) FROM return_index WHERE symbol = ?',
+                                     (symbol,)).fetchone()[0]
+            if last_date:
+                start = (pd.Timestamp(last_date) + pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+                start = min(start, dirty.get(symbol, start))
+            else:
+                start = '0000-01-01'
+            closes = pd.read_sql_query('''
+                SELECT date, close FROM unified_price_view
+                WHERE symbol = ? AND date >= ? AND close > 0
+                ORDER BY date
+            ''', conn, params=(symbol, start))
+            if not closes.empty:
+                anchor = conn.execute('''
+                    SELECT close, log_index FROM return_index
+                    WHERE symbol = ? AND trade_date < ? ORDER BY trade_date DESC LIMIT 1
+                ''', (symbol, closes['date'].iloc[0])).fetchone()
+                log_close = np.log(closes['close'].to_numpy(dtype=float))
+                base_close, base_index = anchor if anchor else (closes['close'].iloc[0], 0.0)
+                log_index = base_index + log_close - np.log(float(base_close))
+                conn.execute('DELETE FROM return_index WHERE symbol = ? AND trade_date >= ?',
+                             (symbol, closes['date'].iloc[0]))
+                conn.executemany(
+                    'INSERT INTO return_index (symbol, trade_date, close, log_index) VALUES (?, ?, ?, ?)',
+                    zip([symbol] * len(closes), closes['date'], closes['close'].astype(float), log_index.tolist()))
+                written += len(closes)
+            conn.execute('INSERT OR REPLACE INTO return_index_state (symbol, journal_version, updated_at) VALUES (?, ?, ?)',
+                         (symbol, journal_version, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+            conn.commit()
+    finally:
+        conn.close()
+    return written
+
+
+def _to_days(dates) -> np.ndarray:
+    """日期（字符串、Timestamp、datetime64 或它们的数组）转换为距 1970-01-01 的天数"""
+    values = pd.to_datetime(np.atleast_1d(np.asarray(dates))).values.astype('datetime64[D]')
+    return (values - _EPOCH).astype('int64')
+
+
+class ReturnIndex:
+    def __init__(self, db_path: str = DB_PATH):
+        """
+        累计收益指数的查询接口，每个产品第一次查询时从 return_index 表读取并缓存
+
+        Args:
+            db_path: 数据库路径
+        """
+        self.db_path = db_path
+        # 产品代码 -> (第一个交易日的天数, 每个自然日的 log_index, 每个自然日对应的交易日天数)
+        self._dense: Dict[str, Tuple[int, np.ndarray, np.ndarray]] = {}
+
+    def _load(self, symbol: str) -> Tuple[int, np.ndarray, np.ndarray]:
+        if symbol not in self._dense:
+            conn = sqlite3.connect(self.db_path)
+            try:
+                init_return_index_table(conn)
+                rows = pd.read_sql_query(
+                    'SELECT trade_date, log_index FROM return_index WHERE symbol = ? ORDER BY trade_date',
+                    conn, params=(symbol,))
+            finally:
+                conn.close()
+            if rows.empty:
+                raise ValueError(f"{symbol} 没有累计收益指数，请先运行 update_return_index")
+            days = _to_days(rows['trade_date'])
+            # 每个自然日取当天或之前最后一个交易日的位置
+            positions = np.searchsorted(days, np.arange(days[0], days[-1] + 1), side='right') - 1
+            self._dense[symbol] = (int(days[0]), rows['log_index'].to_numpy(dtype=float)[positions], days[positions])
+        return self._dense[symbol]
+
+    def _lookup(self, symbol: str, dates) -> Tuple[np.ndarray, np.ndarray]:
+        """每个日期当天或之前最后一个交易日的 log_index 和交易日天数，早于第一个交易日时为 NaN"""
+        first_day, log_index, trade_days = self._load(symbol)
+        offsets = _to_days(dates) - first_day
+        valid = offsets >= 0
+        offsets = np.clip(offsets, 0, len(log_index) - 1)
+        return (np.where(valid, log_index[offsets], np.nan),
+                np.where(valid, trade_days[offsets].astype(float), np.nan))
+
+    def log_returns(self, symbol: str, starts, ends) -> np.ndarray:
+        """
+        多个区间的对数收益率，开始和结束日期都取当天或之前最后一个交易日的收盘价
+
+        Args:
+            symbol: 产品代码
+            starts: 开始日期，单个日期或数组
+            ends: 结束日期，与 starts 形状相同或可以广播
+
+        Returns:
+            ndarray: 对数收益率，开始日期早于第一个交易日时为 NaN
+        """
+        start_index, _ = self._lookup(symbol, starts)
+        end_index, _ = self._lookup(symbol, ends)
+        return end_index - start_index
+
+    def window_returns(self, symbol: str, starts, ends) -> np.ndarray:
+        """多个区间的收益率，参数同 log_returns"""
+        return np.expm1(self.log_returns(symbol, starts, ends))
+
+    def annualized_returns(self, symbol: str, starts, ends) -> np.ndarray:
+        """
+        多个区间的年化收益率，与 PortfolioAnalyzer 相同按实际交易日之间的自然日数以365天年化
+
+        Args:
+            symbol: 产品代码
+            starts: 开始日期，单个日期或数组
+            ends: 结束日期
+
+        Returns:
+            ndarray: 年化收益率，区间内不足一天时为 NaN
+        """
+        start_index, start_days = self._lookup(symbol, starts)
+        end_index, end_days = self._lookup(symbol, ends)
+        days = end_days - start_days
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(days > 0, np.expm1((end_index - start_index) * 365 / days), np.nan)
+
+    def window_return(self, symbol: str, start_date: str, end_date: str) -> float:
+        """单个区间的收益率，如 window_return('510300', '2015-01-01', '2020-12-31')"""
+        return float(self.window_returns(symbol, start_date, end_date)[0])
+
+    def clear(self) -> None:
+        """清空缓存，update_return_index 之后调用"""
+        self._dense.clear()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='累计收益指数')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    update_parser = subparsers.add_parser('update', help='增量更新累计收益指数')
+    update_parser.add_argument('symbols', nargs='*', help='产品代码，默认为全部产品')
+    query_parser = subparsers.add_parser('query', help='查询区间收益率')
+    query_parser.add_argument('symbol', help='产品代码')
+    query_parser.add_argument('start_date', help='开始日期')
+    query_parser.add_argument('end_date', help='结束日期')
+    args = parser.parse_args()
+
+    if args.command == 'update':
+        count = update_return_index(args.symbols or None)
+        print(f"更新了 {count} 条累计收益指数记录")
+    else:
+        index = ReturnIndex()
+        print(f"{args.symbol} {args.start_date} ~ {args.end_date} "
+              f"收益率 {index.window_return(args.symbol, args.start_date, args.end_date):.2%}，"
+              f"年化收益率 {index.annualized_returns(args.symbol, args.start_date, args.end_date)[0]:.2%}")
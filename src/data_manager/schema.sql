@@ -77,8 +77,120 @@ SELECT
     NULL as pe_ttm  -- 基金没有 PE-TTM，用 NULL 填充
 FROM fund_nav;
 
+-- 创建PE-TTM百分位表，window_years 为0表示与全部历史比较
+CREATE TABLE IF NOT EXISTS pe_ttm_rank (
+    symbol VARCHAR(20) NOT NULL,
+    trade_date DATE NOT NULL,
+    window_years INTEGER NOT NULL,
+    pe_ttm DECIMAL(10,2) NOT NULL,
+    percentile_rank DECIMAL(10,6) NOT NULL,
+    UNIQUE (symbol, window_years, trade_date)
+);
+
+CREATE TABLE IF NOT EXISTS pe_ttm_rank_state (
+    symbol VARCHAR(20) PRIMARY KEY,
+    journal_version INTEGER NOT NULL,
+    updated_at TIMESTAMP NOT NULL
+);
+
+
+-- 创建产品元数据表，登记 TRADING_PRODUCTS 之外的全市场产品（见 universe_manager.py）
+CREATE TABLE IF NOT EXISTS product_metadata (
+    symbol VARCHAR(20) PRIMARY KEY,
+    name VARCHAR(100) NOT NULL,
+    market VARCHAR(10) NOT NULL,
+    category VARCHAR(20) NOT NULL,
+    akshare_symbol VARCHAR(30),
+    earliest_date DATE,
+    source VARCHAR(20) NOT NULL,
+    updated_at TIMESTAMP NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_product_metadata_market_category ON product_metadata(market, category);
+
+-- 创建入库进度表，记录每个入库任务中各产品的状态，用于续传
+CREATE TABLE IF NOT EXISTS ingestion_progress (
+    job_id VARCHAR(50) NOT NULL,
+    symbol VARCHAR(20) NOT NULL,
+    status VARCHAR(10) NOT NULL,
+    rows_inserted INTEGER,
+    updated_at TIMESTAMP NOT NULL,
+    PRIMARY KEY (job_id, symbol)
+);
+
+-- 价格表改用覆盖索引，删除与 UNIQUE 约束重复的索引
+CREATE INDEX IF NOT EXISTS idx_stock_price_symbol_date_close ON stock_price(symbol, trade_date, close, pe_ttm);
+CREATE INDEX IF NOT EXISTS idx_fund_nav_code_date_nav ON fund_nav(fund_code, nav_date, nav);
+DROP INDEX IF EXISTS idx_stock_price_symbol;
+DROP INDEX IF EXISTS idx_stock_price_symbol_date;
+DROP INDEX IF EXISTS idx_fund_nav_code;
+DROP INDEX IF EXISTS idx_fund_nav_code_date;
+
+-- 创建周线/月线聚合表，frequency 为 'W' 或 'M'，由 price_aggregate_manager.py 增量维护
+CREATE TABLE IF NOT EXISTS price_aggregate (
+    symbol VARCHAR(20) NOT NULL,
+    frequency CHAR(1) NOT NULL,
+    period_start DATE NOT NULL,
+    period_end DATE NOT NULL,
+    first_date DATE NOT NULL,
+    trade_date DATE NOT NULL,
+    open DECIMAL(10,3),
+    high DECIMAL(10,3),
+    low DECIMAL(10,3),
+    close DECIMAL(10,3) NOT NULL,
+    first_close DECIMAL(10,3) NOT NULL,
+    UNIQUE (symbol, frequency, period_start)
+);
+
+CREATE TABLE IF NOT EXISTS price_aggregate_state (
+    symbol VARCHAR(20) PRIMARY KEY,
+    journal_version INTEGER NOT NULL,
+    updated_at TIMESTAMP NOT NULL
+);
+
+-- 创建入库检查点表，记录可续传入库任务中每个产品下一块数据的开始日期，由 ingestion_job.py 维护
+CREATE TABLE IF NOT EXISTS ingestion_checkpoint (
+    job_id VARCHAR(50) NOT NULL,
+    symbol VARCHAR(20) NOT NULL,
+    next_start DATE NOT NULL,
+    target_end DATE NOT NULL,
+    status VARCHAR(10) NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    rows_inserted INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    updated_at TIMESTAMP NOT NULL,
+    PRIMARY KEY (job_id, symbol)
+);
+
+-- 创建入库日志表，每次写入或修改行情数据时追加一条，派生数据按 version 增量维护（见 ingestion_journal.py）
+CREATE TABLE IF NOT EXISTS ingestion_journal (
+    version INTEGER PRIMARY KEY AUTOINCREMENT,
+    symbol VARCHAR(20) NOT NULL,
+    dataset VARCHAR(20) NOT NULL,
+    change_type VARCHAR(10) NOT NULL,
+    first_date DATE NOT NULL,
+    last_date DATE NOT NULL,
+    row_count INTEGER NOT NULL,
+    checksum CHAR(64) NOT NULL,
+    source VARCHAR(100),
+    created_at TIMESTAMP NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_ingestion_journal_symbol ON ingestion_journal(symbol, version);
+
+-- 创建累计收益指数表，log_index 为日对数收益率的前缀和，由 return_index_manager.py 按入库日志增量维护
+CREATE TABLE IF NOT EXISTS return_index (
+    symbol VARCHAR(20) NOT NULL,
+    trade_date DATE NOT NULL,
+    close DECIMAL(10,3) NOT NULL,
+    log_index REAL NOT NULL,
+    UNIQUE (symbol, trade_date)
+);
+
+CREATE TABLE IF NOT EXISTS return_index_state (
+    symbol VARCHAR(20) PRIMARY KEY,
+    journal_version INTEGER NOT NULL,
+    updated_at TIMESTAMP NOT NULL
+);
+
 -- 更新错误数据
 UPDATE stock_price SET open = 1158.553, close=1159.458, high=1162.882, low=1147.351 WHERE trade_date = '2025-06-02'
 UPDATE stock_price SET open =1165.160, close=1166.071, high=1169.513, low=1153.894 WHERE trade_date = '2025-06-03'
-
-	
@@ -0,0 +1,378 @@
+"""
+全市场产品管理模块
+把产品元数据保存到数据库的 product_metadata 表（按市场和类别建索引），支持登记数千个产品，
+并按分片、分批增量入库，入库进度记录在 ingestion_progress 表中，中断后重新运行会跳过已完成的产品
+
+TRADING_PRODUCTS 仍是手工维护的核心产品列表，get_product_info 先查它，再查 product_metadata 表。
+
+使用方法：
+    # 登记A股ETF、场外基金和美股的全部产品
+    python -m data_manager.universe_manager register
+    # 把产品分成4片，本进程入库第0片，每批50个产品
+    python -m data_manager.universe_manager ingest --market CN --category ETF --shard 0/4 --batch-size 50
+"""
+import argparse
+import os
+import sqlite3
+import zlib
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Optional
+import pandas as pd
+from common.constants import DB_PATH
+from common.trading_products import TRADING_PRODUCTS
+
+# 没有记录最早日期的产品从这一天开始获取历史数据
+DEFAULT_EARLIEST_DATE = '1990-01-01'
+
+# 场外基金的类别映射：天天基金的基金类型 -> 本项目的类别
+FUND_CATEGORY_MAP = {
+    '股票型': 'stock_fund',
+    '混合型': 'stock_fund',
+    '指数型': 'stock_fund',
+    '债券型': 'bond_fund',
+    '货币型': 'money_fund',
+}
+
+STOCK_PRICE_CATEGORIES = ('ETF', 'index', 'stock')
+FUND_NAV_CATEGORIES = ('stock_fund', 'bond_fund', 'money_fund')
+
+# 进程内缓存的产品信息，键为 (数据库路径, 产品代码)
+_product_cache: Dict[tuple, Optional[Dict]] = {}
+
+
+def init_universe_tables(conn: sqlite3.Connection) -> None:
+    """创建 product_metadata 和 ingestion_progress 表（如不存在）"""
+    conn.executescript('''
+    CREATE TABLE IF NOT EXISTS product_metadata (
+        symbol VARCHAR(20) PRIMARY KEY,
+        name VARCHAR(100) NOT NULL,
+        market VARCHAR(10) NOT NULL,
+        category VARCHAR(20) NOT NULL,
+        akshare_symbol VARCHAR(30),
+        earliest_date DATE,
+        source VARCHAR(20) NOT NULL,
+        updated_at TIMESTAMP NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_product_metadata_market_category ON product_metadata(market, category);
+
+    CREATE TABLE IF NOT EXISTS ingestion_progress (
+        job_id VARCHAR(50) NOT NULL,
+        symbol VARCHAR(20) NOT NULL,
+        status VARCHAR(10) NOT NULL,
+        rows_inserted INTEGER,
+        updated_at TIMESTAMP NOT NULL,
+        PRIMARY KEY (job_id, symbol)
+    );
+    ''')
+
+
+def optimize_price_indexes(conn: sqlite3.Connection) -> None:
+    """
+    把价格表的索引调整为适合全市场数据量的覆盖索引
+
+    stock_price 和 fund_nav 的 UNIQUE 约束已经提供了 (代码, 日期) 索引，另外两个以代码开头的索引是重复的，
+    删除它们可以减少入库时的写入量；覆盖索引包含收盘价（和PE-TTM），按产品查询时不需要回表，
+    数千个产品、几十年的数据混在同一张表中时，单个产品的查询仍然只读取连续的索引页。
+    """
+    conn.executescript('''
+    CREATE INDEX IF NOT EXISTS idx_stock_price_symbol_date_close ON stock_price(symbol, trade_date, close, pe_ttm);
+    CREATE INDEX IF NOT EXISTS idx_fund_nav_code_date_nav ON fund_nav(fund_code, nav_date, nav);
+    DROP INDEX IF EXISTS idx_stock_price_symbol;
+    DROP INDEX IF EXISTS idx_stock_price_symbol_date;
+    DROP INDEX IF EXISTS idx_fund_nav_code;
+    DROP INDEX IF EXISTS idx_fund_nav_code_date;
+    ''')
+
+
+def register_products(products: Iterable[Dict], source: str = 'universe', db_path: str = DB_PATH) -> int:
+    """
+    登记或更新产品元数据
+
+    Args:
+        products: 产品列表，每项包含 symbol、name、market、category，可选 akshare_symbol、earliest_date
+        source: 数据来源，如 'manual' 表示 TRADING_PRODUCTS，'universe' 表示全市场列表
+        db_path: 数据库路径
+
+    Returns:
+        int: 登记的产品数量
+    """
+    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    rows = [(
+        product['symbol'], product['name'], product['market'], product['category'],
+        product.get('akshare_symbol'), product.get('earliest_date'), source, now
+    ) for product in products]
+
+    conn = sqlite3.connect(db_path)
+    try:
+        init_universe_tables(conn)
+        conn.executemany('''
+            INSERT INTO product_metadata (symbol, name, market, category, akshare_symbol, earliest_date, source, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(symbol) DO UPDATE SET
+                name = excluded.name,
+                market = excluded.market,
+                category = excluded.category,
+                akshare_symbol = COALESCE(excluded.akshare_symbol, product_metadata.akshare_symbol),
+                earliest_date = COALESCE(excluded.earliest_date, product_metadata.earliest_date),
+                source = excluded.source,
+                updated_at = excluded.updated_at
+        ''', rows)
+        conn.commit()
+    finally:
+        conn.close()
+
+    for row in rows:
+        _product_cache.pop((db_path, row[0]), None)
+    return len(rows)
+
+
+def sync_trading_products(db_path: str = DB_PATH) -> int:
+    """把 TRADING_PRODUCTS 中手工维护的产品登记到 product_metadata 表"""
+    return register_products(
+        ({'symbol': symbol, **info} for symbol, info in TRADING_PRODUCTS.items()),
+        source='manual', db_path=db_path
+    )
+
+
+def fetch_cn_etf_universe() -> List[Dict]:
+    """从 akshare 获取全部A股场内ETF"""
+    import akshare as ak
+    spot = ak.fund_etf_spot_em()
+    return [{'symbol': str(code), 'name': name, 'market': 'CN', 'category': 'ETF'}
+            for code, name in zip(spot['代码'], spot['名称'])]
+
+
+def fetch_cn_fund_universe() -> List[Dict]:
+    """从 akshare 获取全部场外基金，只保留能映射到本项目类别的基金"""
+    import akshare as ak
+    funds = ak.fund_name_em()
+    products = []
+    for code, name, fund_type in zip(funds['基金代码'], funds['基金简称'], funds['基金类型']):
+        category = next((value for key, value in FUND_CATEGORY_MAP.items() if str(fund_type).startswith(key)), None)
+        if category:
+            products.append({'symbol': str(code), 'name': name, 'market': 'CN', 'category': category})
+    return products
+
+
+def fetch_us_stock_universe() -> List[Dict]:
+    """从 akshare 获取全部美股，代码形如 '105.AAPL'，点号后为产品代码"""
+    import akshare as ak
+    spot = ak.stock_us_spot_em()
+    return [{'symbol': str(code).split('.', 1)[-1], 'name': name, 'market': 'US', 'category': 'stock',
+             'akshare_symbol': str(code)}
+            for code, name in zip(spot['代码'], spot['名称'])]
+
+
+UNIVERSE_FETCHERS = {
+    'cn_etf': fetch_cn_etf_universe,
+    'cn_fund': fetch_cn_fund_universe,
+    'us_stock': fetch_us_stock_universe,
+}
+
+
+def register_universe(universes: Iterable[str] = tuple(UNIVERSE_FETCHERS), db_path: str = DB_PATH) -> Dict[str, int]:
+    """
+    获取并登记全市场产品列表，TRADING_PRODUCTS 中的产品以手工维护的信息为准
+
+    Args:
+        universes: 需要登记的产品列表名称，见 UNIVERSE_FETCHERS
+        db_path: 数据库路径
+
+    Returns:
+        Dict[str, int]: 每个产品列表登记的产品数量
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        optimize_price_indexes(conn)
+    finally:
+        conn.close()
+
+    counts = {}
+    for universe in universes:
+        products = [product for product in UNIVERSE_FETCHERS[universe]() if product['symbol'] not in TRADING_PRODUCTS]
+        counts[universe] = register_products(products, source='universe', db_path=db_path)
+        print(f"登记了 {counts[universe]} 个 {universe} 产品")
+    sync_trading_products(db_path)
+    return counts
+
+
+def get_product_info(symbol: str, db_path: str = DB_PATH) -> Optional[Dict]:
+    """
+    获取产品信息，先查 TRADING_PRODUCTS，再查 product_metadata 表
+
+    Args:
+        symbol: 产品代码
+        db_path: 数据库路径
+
+    Returns:
+        Dict: 与 TRADING_PRODUCTS 中的格式相同，包含 name、category、market，可能包含 akshare_symbol、earliest_date；
+            未找到时返回 None
+    """
+    if symbol in TRADING_PRODUCTS:
+        return TRADING_PRODUCTS[symbol]
+
+    key = (db_path, symbol)
+    if key not in _product_cache:
+        info = None
+        if os.path.exists(db_path):
+            conn = sqlite3.connect(db_path)
+            try:
+                row = conn.execute('''
+                    SELECT name, category, market, akshare_symbol, earliest_date
+                    FROM product_metadata WHERE symbol = ?
+                ''', (symbol,)).fetchone()
+            except sqlite3.OperationalError:
+                # 尚未创建 product_metadata 表
+                row = None
+            finally:
+                conn.close()
+            if row:
+                info = {'name': row[0], 'category': row[1], 'market': row[2]}
+                if row[3]:
+                    info['akshare_symbol'] = row[3]
+                if row[4]:
+                    info['earliest_date'] = row[4]
+        _product_cache[key] = info
+    return _product_cache[key]
+
+
+def clear_product_cache() -> None:
+    """清空进程内缓存的产品信息，其他进程更新 product_metadata 后调用"""
+    _product_cache.clear()
+
+
+def list_products(market: Optional[str] = None, category: Optional[str] = None, db_path: str = DB_PATH) -> pd.DataFrame:
+    """
+    按市场和类别筛选已登记的产品
+
+    Args:
+        market: 市场，如 'CN'、'US'，None 表示不限
+        category: 类别，如 'ETF'、'stock_fund'，None 表示不限
+        db_path: 数据库路径
+
+    Returns:
+        DataFrame: 列为 symbol、name、market、category、akshare_symbol、earliest_date、source，按代码排序
+    """
+    query = 'SELECT symbol, name, market, category, akshare_symbol, earliest_date, source FROM product_metadata WHERE 1 = 1'
+    params = []
+    if market:
+        query += ' AND market = ?'
+        params.append(market)
+    if category:
+        query += ' AND category = ?'
+        params.append(category)
+    query += ' ORDER BY symbol'
+
+    conn = sqlite3.connect(db_path)
+    try:
+        init_universe_tables(conn)
+        return pd.read_sql_query(query, conn, params=params)
+    finally:
+        conn.close()
+
+
+def shard_symbols(symbols: Iterable[str], shard_index: int = 0, shard_count: int = 1) -> List[str]:
+    """
+    按代码的 CRC32 把产品稳定地分到 shard_count 片中，返回第 shard_index 片
+
+    多个进程或机器各自处理一片即可并行入库，产品列表变化时已有产品所在的分片不变。
+    """
+    if not 0 <= shard_index < shard_count:
+        raise ValueError(f"分片序号 {shard_index} 应在 0 到 {shard_count - 1} 之间")
+    return [symbol for symbol in symbols if zlib.crc32(symbol.encode('utf-8')) % shard_count == shard_index]
+
+
+def _completed_symbols(conn: sqlite3.Connection, job_id: str) -> set:
+    return {row[0] for row in conn.execute(
+        "SELECT symbol FROM ingestion_progress WHERE job_id = ? AND status = 'done'", (job_id,))}
+
+
+def ingest_universe(market: Optional[str] = None, category: Optional[str] = None, shard_index: int = 0,
+                    shard_count: int = 1, batch_size: int = 50, job_id: Optional[str] = None,
+                    db_path: str = DB_PATH) -> Dict[str, int]:
+    """
+    分片、分批地把已登记产品的行情或净值更新到最新
+
+    每批处理完后更新有新数据产品的周线/月线聚合和累计收益指数，并把这批产品的状态写入 ingestion_progress 表；
+    同一个 job_id 重新运行时跳过已完成的产品，失败的产品会被重试。
+
+    Args:
+        market: 只处理该市场的产品，None 表示不限
+        category: 只处理该类别的产品，None 表示不限
+        shard_index: 本进程处理的分片序号
+        shard_count: 分片总数
+        batch_size: 每批产品数量
+        job_id: 入库任务标识，默认为 'universe-<今天日期>'，同一天内重新运行即续传
+        db_path: 数据库路径
+
+    Returns:
+        Dict[str, int]: 包含 total、skipped、done、failed 的数量
+    """
+    from data_manager.market_data_manager import update_stock_price_data_to_today, update_cn_fund_nav_to_today
+    from data_manager.price_aggregate_manager import update_price_aggregates
+    from data_manager.return_index_manager import update_return_index
+
+    job_id = job_id or f"universe-{date.today().strftime('%Y-%m-%d')}"
+    products = list_products(market, category, db_path)
+    symbols = shard_symbols(products['symbol'], shard_index, shard_count)
+    categories = dict(zip(products['symbol'], products['category']))
+
+    conn = sqlite3.connect(db_path)
+    try:
+        init_universe_tables(conn)
+        optimize_price_indexes(conn)
+        completed = _completed_symbols(conn, job_id)
+        pending = [symbol for symbol in symbols if symbol not in completed]
+        summary = {'total': len(symbols), 'skipped': len(symbols) - len(pending), 'done': 0, 'failed': 0}
+        print(f"任务 {job_id} 分片 {shard_index}/{shard_count}：共 {len(symbols)} 个产品，"
+              f"已完成 {summary['skipped']} 个，待处理 {len(pending)} 个")
+
+        for start in range(0, len(pending), batch_size):
+            batch = pending[start:start + batch_size]
+            progress = []
+            for symbol in batch:
+                if categories[symbol] in FUND_NAV_CATEGORIES:
+                    rows = update_cn_fund_nav_to_today(symbol, db_path)
+                else:
+                    rows = update_stock_price_data_to_today(symbol, db_path)
+                status = 'failed' if rows is None else 'done'
+                summary[status] += 1
+                progress.append((job_id, symbol, status, rows, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+
+            # 有新数据的产品同时更新周线/月线聚合和累计收益指数
+            updated = [row[1] for row in progress if row[3]]
+            update_price_aggregates(updated, db_path=db_path)
+            update_return_index(updated, db_path=db_path)
+            conn.executemany('''
+                INSERT OR REPLACE INTO ingestion_progress (job_id, symbol, status, rows_inserted, updated_at)
+                VALUES (?, ?, ?, ?, ?)
+            ''', progress)
+            conn.commit()
+            print(f"已处理 {summary['skipped'] + summary['done'] + summary['failed']}/{len(symbols)} 个产品，"
+                  f"失败 {summary['failed']} 个")
+    finally:
+        conn.close()
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='全市场产品登记与入库')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    register_parser = subparsers.add_parser('register', help='登记全市场产品列表')
+    register_parser.add_argument('--universe', nargs='*', default=list(UNIVERSE_FETCHERS),
+                                 choices=list(UNIVERSE_FETCHERS), help='需要登记的产品列表')
+
+    ingest_parser = subparsers.add_parser('ingest', help='分片分批入库')
+    ingest_parser.add_argument('--market', help='市场，如 CN、US')
+    ingest_parser.add_argument('--category', help='类别，如 ETF、stock_fund、stock')
+    ingest_parser.add_argument('--shard', default='0/1', help='分片，格式为 序号/总数，如 0/4')
+    ingest_parser.add_argument('--batch-size', type=int, default=50, help='每批产品数量')
+    ingest_parser.add_argument('--job-id', help='入库任务标识，相同标识重新运行时续传')
+
+    args = parser.parse_args()
+    if args.command == 'register':
+        register_universe(args.universe)
+    else:
+        shard_index, shard_count = (int(part) for part in args.shard.split('/'))
+        ingest_universe(args.market, args.category, shard_index, shard_count, args.batch_size, args.job_id)
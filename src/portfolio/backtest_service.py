@@ -0,0 +1,257 @@
+"""
+本地回测服务模块
+常驻进程，通过 HTTP/JSON 接收 PortfolioBacktest 格式的回测配置，返回绩效指标和净值曲线。
+进程内缓存每个产品全部历史的收盘价，同一产品只从数据库加载一次，调整持仓比例等交互式请求只需要运行回测本身；
+日线回测使用 StreamingBacktest 的 NumPy 实现，返回组合层面的指标。
+
+数据更新后缓存自动失效：每次请求前检查数据库的 PRAGMA data_version，其他连接（如入库任务）提交写入后
+该值会变化，此时按入库日志（见 data_manager.ingestion_journal）只丢弃数据有变化的产品，PE-TTM 有变化时清空估值百分位缓存；
+数据库中还没有入库日志时清空全部缓存。直接修改数据库等不写日志的场景可以调用 POST /invalidate 清空全部缓存。
+
+接口：
+    GET  /health        服务状态、缓存的产品数量和命中次数
+    POST /backtest      请求体 {"config": {...}, "include_curve": true, "max_points": 2000}
+                        返回 {"metrics": {...}, "max_drawdowns": [...], "equity_curve": {"dates": [...], "values": [...]}}
+    POST /invalidate    清空全部缓存
+
+使用方法：
+    python -m portfolio.backtest_service --port 8765
+    curl -X POST localhost:8765/backtest -d '{"config": {"target_percentage": {"SPY": 0.6, "070009": 0.4}, ...}}'
+"""
+import argparse
+import json
+import logging
+import sqlite3
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+import pandas as pd
+from common.constants import DB_PATH
+from data_manager.ingestion_journal import current_version, changes_since
+from data_manager.universe_manager import clear_product_cache
+from portfolio.data_loader import DataLoader
+from portfolio.experiment_runner import run_experiment
+from portfolio.portfolio_visualizer import downsample_series, DEFAULT_MAX_POINTS
+from portfolio.valuation_allocation import clear_percentile_cache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 8765
+
+# 缓存全部历史时使用的日期范围
+_FULL_HISTORY = ('1900-01-01', '9999-12-31')
+
+
+class BacktestService:
+    def __init__(self, db_path: str = DB_PATH):
+        """
+        初始化回测服务
+
+        Args:
+            db_path: 行情数据库路径
+        """
+        self.data_loader = DataLoader(db_path)
+        # 只用于读取 data_version 的常驻连接，其他连接提交写入后该值才会变化
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._closes: Dict[str, pd.Series] = {}
+        self._data_version = self._read_data_version()
+        self._journal_version = current_version(self._conn)
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _read_data_version(self) -> int:
+        return self._conn.execute('PRAGMA data_version').fetchone()[0]
+
+    def invalidate(self) -> None:
+        """清空价格、估值百分位和产品信息缓存"""
+        with self._lock:
+            self._closes.clear()
+            clear_percentile_cache()
+            clear_product_cache()
+            self.invalidations += 1
+        logger.info("数据已更新，清空缓存")
+
+    def refresh(self) -> bool:
+        """
+        检查数据库是否被其他连接修改过，修改过时按入库日志丢弃有变化的产品
+
+        没有新日志的修改（检查点、聚合表等）不影响缓存；数据库中还没有入库日志时无法确定范围，清空全部缓存。
+
+        Returns:
+            bool: 数据库是否被修改过
+        """
+        with self._lock:
+            version = self._read_data_version()
+            if version == self._data_version:
+                return False
+            self._data_version = version
+            has_journal = self._conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'ingestion_journal'").fetchone()
+            if has_journal:
+                changes = changes_since(self._journal_version, db_path=self.data_loader.db_path)
+                if changes.empty:
+                    return True
+                self._journal_version = int(changes['version'].max())
+                for symbol in changes['symbol'].unique():
+                    self._closes.pop(symbol, None)
+                if (changes['dataset'] == 'pe_ttm').any():
+                    clear_percentile_cache()
+                clear_product_cache()
+                self.invalidations += 1
+                logger.info(f"数据已更新，丢弃 {changes['symbol'].nunique()} 个产品的缓存")
+                return True
+        self.invalidate()
+        return True
+
+    def price_data(self, symbols: List[str]) -> pd.DataFrame:
+        """
+        组合内产品全部历史的收盘价，格式同 load_portfolio_data（未填充缺失值），未缓存的产品一次查询加载
+
+        Args:
+            symbols: 产品代码列表
+
+        Returns:
+            DataFrame: 列按产品代码排序
+        """
+        symbols = sorted(set(symbols))
+        with self._lock:
+            missing = [symbol for symbol in symbols if symbol not in self._closes]
+            if missing:
+                self.misses += len(missing)
+                loaded = self.data_loader.load_portfolio_data(missing, *_FULL_HISTORY)
+                for symbol in missing:
+                    column = f"{symbol}_close"
+                    # 没有数据的产品也缓存为空序列，由回测报告缺少数据
+                    self._closes[symbol] = loaded[column].dropna() if column in loaded else pd.Series(dtype=float)
+            self.hits += len(symbols) - len(missing)
+            closes = {f"{symbol}_close": self._closes[symbol] for symbol in symbols if not self._closes[symbol].empty}
+        return pd.DataFrame(closes).rename_axis('date')
+
+    def run(self, request: Dict) -> Dict:
+        """
+        运行一次回测
+
+        Args:
+            request: 包含 config，可选 include_curve（默认 True）和 max_points（净值曲线的最大点数，None 表示不降采样）
+
+        Returns:
+            Dict: 包含 status、error、metrics、max_drawdowns、elapsed_ms，include_curve 时另有 equity_curve
+        """
+        started = time.perf_counter()
+        config = request.get('config')
+        if not isinstance(config, dict) or not isinstance(config.get('target_percentage'), dict):
+            raise ValueError("请求中缺少 config.target_percentage")
+        include_curve = request.get('include_curve', True)
+        self.refresh()
+
+        price_data = self.price_data(list(config['target_percentage']))
+        record = run_experiment({'experiment': 'service', 'run': 'service', 'source': 'service', 'config': config},
+                                price_data, include_curve=include_curve, streaming=True, data_loader=self.data_loader)
+        response = {key: record[key] for key in ('status', 'error', 'metrics', 'max_drawdowns')}
+        curve = record.get('equity_curve')
+        if curve is not None:
+            curve = downsample_series(curve, request.get('max_points', DEFAULT_MAX_POINTS))
+            response['equity_curve'] = {
+                'dates': curve.index.strftime('%Y-%m-%d').tolist(),
+                'values': curve.tolist(),
+            }
+        response['elapsed_ms'] = (time.perf_counter() - started) * 1000
+        return response
+
+    def status(self) -> Dict:
+        """服务状态"""
+        return {
+            'status': 'ok',
+            'db_path': self.data_loader.db_path,
+            'cached_symbols': len(self._closes),
+            'hits': self.hits,
+            'misses': self.misses,
+            'invalidations': self.invalidations,
+        }
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+class _ServiceHandler(BaseHTTPRequestHandler):
+    server_version = 'BacktestService/1.0'
+
+    def _send_json(self, code: int, body: Dict) -> None:
+        payload = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self) -> None:
+        if self.path == '/health':
+            self._send_json(200, self.server.service.status())
+        else:
+            self._send_json(404, {'error': f"未知的路径 {self.path}"})
+
+    def do_POST(self) -> None:
+        service = self.server.service
+        if self.path == '/invalidate':
+            service.invalidate()
+            self._send_json(200, service.status())
+            return
+        if self.path != '/backtest':
+            self._send_json(404, {'error': f"未知的路径 {self.path}"})
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length) or b'{}')
+            response = service.run(request)
+        except (ValueError, json.JSONDecodeError) as e:
+            self._send_json(400, {'status': 'error', 'error': str(e)})
+            return
+        except Exception as e:
+            logger.exception("回测请求处理失败")
+            self._send_json(500, {'status': 'error', 'error': f"{type(e).__name__}: {e}"})
+            return
+        self._send_json(200 if response['status'] == 'ok' else 400, response)
+
+    def log_message(self, format: str, *args) -> None:
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+
+def create_server(host: str = '127.0.0.1', port: int = DEFAULT_PORT,
+                  service: Optional[BacktestService] = None) -> ThreadingHTTPServer:
+    """
+    创建回测服务的 HTTP 服务器，每个请求在单独的线程中处理
+
+    Args:
+        host: 监听地址，默认只接受本机请求
+        port: 监听端口，0 表示自动选择
+        service: 回测服务，默认使用 DB_PATH 指向的数据库
+
+    Returns:
+        ThreadingHTTPServer: 调用 serve_forever 开始处理请求
+    """
+    server = ThreadingHTTPServer((host, port), _ServiceHandler)
+    server.daemon_threads = True
+    server.service = service or BacktestService()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='本地回测服务')
+    parser.add_argument('--host', default='127.0.0.1', help='监听地址')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='监听端口')
+    parser.add_argument('--db', default=DB_PATH, help='行情数据库路径')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    server = create_server(args.host, args.port, BacktestService(args.db))
+    logger.info(f"回测服务已启动：http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.service.close()
@@ -0,0 +1,136 @@
+"""
+批量投资组合分析模块
+把多条净值曲线组成 日期×组合 的矩阵，按列向量化计算收益、回撤和风险指标
+"""
+import numpy as np
+import pandas as pd
+from typing import Dict
+from portfolio.drawdown_engine import top_drawdown_episodes
+from portfolio.performance_metrics import compute_metrics_table
+
+
+class BatchPortfolioAnalyzer:
+    def __init__(self, equity_curves: pd.DataFrame):
+        """
+        初始化批量分析器
+
+        Args:
+            equity_curves: 净值曲线矩阵，索引为日期，每列为一个组合的总价值。
+                各组合起始日期或交易日历不同（如A股和美股组合）时，没有数据的日期为NaN，
+                收益率和风险指标只用每个组合自己的交易日计算，不会因为合并后的日历多出收益率为0的日子
+        """
+        if equity_curves is None or equity_curves.empty:
+            raise ValueError("请提供有效的净值曲线矩阵")
+        self.equity_curves = equity_curves.sort_index()
+
+    @classmethod
+    def from_backtest_results(cls, results: Dict[str, pd.DataFrame]) -> 'BatchPortfolioAnalyzer':
+        """
+        由多个回测结果构建批量分析器
+
+        Args:
+            results: 组合名称到回测结果（PortfolioBacktest.get_results()）的字典
+        """
+        return cls(pd.DataFrame({name: result['total_value'] for name, result in results.items()}))
+
+    def _column_returns(self) -> pd.DataFrame:
+        """每个组合只在自己有数据的日期之间计算收益率，其余日期为NaN"""
+        return pd.DataFrame({
+            name: curve.dropna().pct_change() for name, curve in self.equity_curves.items()
+        }).reindex(self.equity_curves.index)[self.equity_curves.columns]
+
+    def calculate_returns(self) -> pd.DataFrame:
+        """
+        计算每个组合的总收益率和年化收益率
+
+        Returns:
+            DataFrame: 每行一个组合，列为 portfolio_return、annualized_portfolio_return
+        """
+        metrics = compute_metrics_table(self.equity_curves, returns=self._column_returns())
+        return pd.DataFrame({
+            'portfolio_return': metrics['total_return'],
+            'annualized_portfolio_return': metrics['annualized_return'],
+        })
+
+    def calculate_annual_returns(self) -> pd.DataFrame:
+        """
+        计算每个组合每年的收益率，口径与 PortfolioAnalyzer.calculate_portfolio_return 相同
+
+        Returns:
+            DataFrame: 行为年份，列为组合
+        """
+        grouped = self.equity_curves.groupby(self.equity_curves.index.year)
+        return grouped.last() / grouped.first() - 1
+
+    def calculate_drawdowns(self, top_n: int = 3) -> pd.DataFrame:
+        """
+        计算每个组合前 top_n 名互不重叠的最大回撤
+
+        Args:
+            top_n: 每个组合返回的回撤数量，默认为3
+
+        Returns:
+            DataFrame: 每行一个回撤，列为 portfolio、rank、max_drawdown(%)、peak_date、trough_date、
+                recovery_date、drawdown_length、recovery_length，尚未恢复的回撤恢复日期为NaT、恢复天数为NaN
+        """
+        matrix = self.equity_curves.to_numpy(dtype=float)
+        episodes = top_drawdown_episodes(matrix, k=top_n)
+        dates = self.equity_curves.index
+        curve = episodes['curve'].to_numpy(dtype=int)
+        # 回撤引擎在合并后的日历上沿用前一个有效值，高点可能落在填充的日期上，换回它对应的有效日期；
+        # 天数按每个组合自己的交易日计数
+        valid = ~np.isnan(matrix)
+        source_row = np.maximum.accumulate(np.where(valid, np.arange(len(matrix))[:, None], 0), axis=0)
+        trading_day = np.cumsum(valid, axis=0)
+        peak = source_row[episodes['peak'].to_numpy(dtype=int), curve]
+        trough = episodes['trough'].to_numpy(dtype=int)
+        recovered = episodes['recovery'].to_numpy() >= 0
+        recovery_rows = np.where(recovered, episodes['recovery'].to_numpy(), 0)
+        return pd.DataFrame({
+            'portfolio': self.equity_curves.columns[curve],
+            'rank': episodes['rank'].to_numpy(),
+            'max_drawdown': episodes['depth'].to_numpy() * 100,
+            'peak_date': dates[peak],
+            'trough_date': dates[trough],
+            'recovery_date': dates[recovery_rows].where(recovered),
+            'drawdown_length': trading_day[trough, curve] - trading_day[peak, curve] + 1,
+            'recovery_length': np.where(recovered, trading_day[recovery_rows, curve] - trading_day[trough, curve] + 1,
+                                        np.nan),
+        })
+
+    def calculate_risk_metrics(self, risk_free_rate: float = 0.0) -> pd.DataFrame:
+        """
+        计算每个组合的风险收益指标，指标含义见 compute_metrics_table
+
+        Args:
+            risk_free_rate: 年化无风险利率，默认为0
+
+        Returns:
+            DataFrame: 每行一个组合
+        """
+        return compute_metrics_table(self.equity_curves, risk_free_rate, returns=self._column_returns())
+
+    def get_metrics_table(self, risk_free_rate: float = 0.0) -> pd.DataFrame:
+        """
+        汇总每个组合的全部指标，得到一行一个组合的整洁表格
+
+        包括风险收益指标、最大回撤的起止日期和持续天数，以及每年的收益率（列名为 annual_return_<年份>）。
+
+        Args:
+            risk_free_rate: 年化无风险利率，默认为0
+
+        Returns:
+            DataFrame: 索引为组合名称
+        """
+        table = self.calculate_risk_metrics(risk_free_rate)
+
+        worst = self.calculate_drawdowns(top_n=1).set_index('portfolio')
+        worst = worst[['peak_date', 'trough_date', 'recovery_date', 'drawdown_length', 'recovery_length']]
+        table = table.join(worst.add_prefix('max_drawdown_'))
+
+        annual_returns = self.calculate_annual_returns().T
+        annual_returns.columns = [f"annual_return_{year}" for year in annual_returns.columns]
+        table = table.join(annual_returns)
+
+        table.index.name = 'portfolio'
+        return table
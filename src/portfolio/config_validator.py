@@ -4,14 +4,17 @@
 """
 from datetime import datetime
 from typing import Dict
-from common.trading_products import TRADING_PRODUCTS
+from common.constants import DB_PATH
+from data_manager.universe_manager import get_product_info
+from data_manager.price_aggregate_manager import DAILY, SUPPORTED_FREQUENCIES
 
-def check_portfolio_config(config: Dict) -> tuple[int, str]:
+def check_portfolio_config(config: Dict, db_path: str = DB_PATH) -> tuple[int, str]:
     """
     检查投资组合配置的有效性
     
     Args:
         config: 投资组合配置字典
+        db_path: 查询全市场产品信息的数据库路径，应与回测的 DataLoader 相同
         
     Returns:
         tuple[int, str]: (错误代码, 错误信息)
@@ -22,12 +25,15 @@ def check_portfolio_config(config: Dict) -> tuple[int, str]:
     
     # 检查投资组合中每个产品的最早可用日期
     for symbol in config['target_percentage'].keys():
-        # 检查产品是否在支持列表中
-        if symbol not in TRADING_PRODUCTS:
+        # 检查产品是否在支持列表中（TRADING_PRODUCTS 或已登记的全市场产品）
+        product_info = get_product_info(symbol, db_path)
+        if not product_info:
             errors.append(f"错误: {symbol} 不在支持的投资品种列表中")
             continue
-            
-        product_info = TRADING_PRODUCTS[symbol]
+
+        # 全市场产品可能没有记录最早日期，此时不检查
+        if not product_info.get('earliest_date'):
+            continue
         earliest_date = datetime.strptime(product_info['earliest_date'], '%Y-%m-%d')
         start_date = datetime.strptime(config['start_date'], '%Y-%m-%d')
         
@@ -35,6 +41,26 @@ def check_portfolio_config(config: Dict) -> tuple[int, str]:
             errors.append(f"错误: {symbol} ({product_info['name']}) 的最早可用日期是 {earliest_date.date()}, "
                         f"晚于回测开始日期 {start_date.date()}")
     
+    # 检查模拟周期
+    frequency = config.get('frequency', DAILY)
+    if frequency not in SUPPORTED_FREQUENCIES:
+        errors.append(f"错误: 模拟周期 {frequency} 不受支持，应为 {SUPPORTED_FREQUENCIES} 之一")
+
+    # 检查估值择时配置
+    valuation_config = config.get('valuation_allocation')
+    if valuation_config:
+        if not get_product_info(valuation_config.get('signal_symbol'), db_path):
+            errors.append(f"错误: 估值序列产品 {valuation_config.get('signal_symbol')} 不在支持的投资品种列表中")
+        lag_days = valuation_config.get('lag_days', 0)
+        if not isinstance(lag_days, int) or lag_days < 0:
+            errors.append(f"错误: 估值择时的 lag_days {lag_days} 应为非负整数")
+        for tier in valuation_config.get('tiers', []):
+            if not 0 <= tier['min_percentile'] <= 1:
+                errors.append(f"错误: 估值分档的 min_percentile {tier['min_percentile']} 应在0到1之间")
+            unknown_symbols = set(tier['target_percentage']) - set(config['target_percentage'])
+            if unknown_symbols:
+                errors.append(f"错误: 估值分档中的 {sorted(unknown_symbols)} 不在投资组合 target_percentage 中")
+    
     if errors:
         return 1, "\n".join(errors)
     return 0, "" 
\ No newline at end of file
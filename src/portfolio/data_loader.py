@@ -2,17 +2,30 @@
 数据加载模块
 负责从数据库加载投资组合相关的数据
 """
+import numpy as np
 import pandas as pd
 import sqlite3
-from typing import List
+from typing import Iterator, List, Optional
 from common.constants import DB_PATH
+from common.profiling import profiled, profile_span
+from data_manager.price_aggregate_manager import (
+    DAILY, SUPPORTED_FREQUENCIES, aggregate_close_parts, combine_period_parts, calendar_period_start, calendar_period_end,
+    load_period_parts
+)
 
 class DataLoader:
-    def __init__(self):
-        """初始化数据加载器，设置数据库路径"""
-        self.db_path = DB_PATH
+    def __init__(self, db_path: Optional[str] = None):
+        """
+        初始化数据加载器，设置数据库路径
+        
+        Args:
+            db_path: 数据库路径，默认为 DB_PATH
+        """
+        self.db_path = db_path or DB_PATH
         
-    def load_portfolio_data(self, symbols: List[str], start_date: str, end_date: str) -> pd.DataFrame:
+    @profiled('DataLoader.load_portfolio_data')
+    def load_portfolio_data(self, symbols: List[str], start_date: str, end_date: str,
+                            frequency: str = DAILY) -> pd.DataFrame:
         """
         从数据库加载投资组合数据
         
@@ -20,10 +33,16 @@ class DataLoader:
             symbols: 投资组合中的产品代码列表，如 ['510300', '515100', 'GLD', 'QQQ']
             start_date: 开始日期，格式为 'YYYY-MM-DD'
             end_date: 结束日期，格式为 'YYYY-MM-DD'
+            frequency: 数据周期，'D' 为日线，'W'/'M' 为周线/月线（见 load_period_data）
             
         Returns:
             DataFrame: 包含所有产品价格数据的DataFrame，索引为日期，列为各产品的收盘价
         """
+        if frequency not in SUPPORTED_FREQUENCIES:
+            raise ValueError(f"不支持的数据周期 {frequency}，应为 {SUPPORTED_FREQUENCIES} 之一")
+        if frequency != DAILY:
+            return self.load_period_data(symbols, start_date, end_date, frequency)
+
         conn = sqlite3.connect(self.db_path)
         
         # 构建SQL查询，使用参数化查询防止SQL注入
@@ -41,16 +60,188 @@ class DataLoader:
         
         # 执行查询，将查询参数和日期范围合并
         params = symbols + [start_date, end_date]
-        df = pd.read_sql_query(query, conn, params=params)
+        with profile_span('query'):
+            df = pd.read_sql_query(query, conn, params=params)
         
-        # 将日期列转换为datetime类型，便于后续处理
-        df['date'] = pd.to_datetime(df['date'])
+        with profile_span('pivot'):
+            # 将日期列转换为datetime类型，便于后续处理
+            df['date'] = pd.to_datetime(df['date'])
+            
+            # 将数据透视为宽格式，每个产品一列
+            df_pivot = df.pivot(index='date', columns='symbol', values='close')
+            
+            # 重命名列以添加后缀，便于后续处理
+            df_pivot.columns = [f"{col}_close" for col in df_pivot.columns]
         
-        # 将数据透视为宽格式，每个产品一列
-        df_pivot = df.pivot(index='date', columns='symbol', values='close')
+        conn.close()
+        return df_pivot
+
+    @profiled('DataLoader.load_period_data')
+    def load_period_data(self, symbols: List[str], start_date: str, end_date: str, frequency: str) -> pd.DataFrame:
+        """
+        加载周线/月线数据，区间内完整的周期读取 price_aggregate 表，首尾不完整的周期由日线现场聚合
+
+        第一个交易日单独作为一行，与日线回测的建仓日相同。有产品在 price_aggregate 中没有记录时，
+        全部改为由日线聚合。
+        
+        Args:
+            symbols: 产品代码列表
+            start_date: 开始日期，格式为 'YYYY-MM-DD'
+            end_date: 结束日期，格式为 'YYYY-MM-DD'
+            frequency: 'W' 或 'M'
+            
+        Returns:
+            DataFrame: combine_period_parts 格式的数据，索引为每个周期最后一个交易日，
+                每个产品包含 <产品代码>_close 和 <产品代码>_first_price 两列，按产品代码排序
+        """
+        start = pd.Timestamp(start_date)
+        end = pd.Timestamp(end_date)
+        columns = [f"{symbol}_close" for symbol in sorted(symbols)]
+        # 区间内完整周期的范围 [interior_start, interior_end]
+        interior_start = calendar_period_end([start], frequency)[0] + pd.Timedelta(days=1)
+        if calendar_period_end([end], frequency)[0] == end:
+            interior_end = end
+        else:
+            interior_end = calendar_period_start([end], frequency)[0] - pd.Timedelta(days=1)
+
+        def day(value: pd.Timestamp) -> str:
+            return value.strftime('%Y-%m-%d')
+
+        def from_daily() -> pd.DataFrame:
+            daily = self.load_portfolio_data(symbols, start_date, end_date)
+            return combine_period_parts([aggregate_close_parts(daily, frequency)]).dropna(how='all')
+
+        head = self.load_portfolio_data(symbols, start_date, day(interior_start - pd.Timedelta(days=1)))
+        if interior_start > interior_end or head.empty:
+            # 区间内没有完整周期，或第一个周期内没有数据（建仓日落在完整周期中），全部由日线聚合
+            return from_daily()
+
+        conn = sqlite3.connect(self.db_path)
+        try:
+            with profile_span('query'):
+                interior = load_period_parts(conn, symbols, frequency, day(interior_start), day(interior_end))
+        finally:
+            conn.close()
+        if any(col not in interior[0].columns for col in columns):
+            # 有产品尚未生成聚合记录
+            return from_daily()
+
+        parts = [aggregate_close_parts(head, frequency), interior]
+        if interior_end < end:
+            tail = self.load_portfolio_data(symbols, day(interior_end + pd.Timedelta(days=1)), end_date)
+            parts.append(aggregate_close_parts(tail, frequency, split_first_day=False))
+        with profile_span('combine'):
+            return combine_period_parts(parts, columns).dropna(how='all')
+
+    def _first_closes(self, conn: sqlite3.Connection, start_date: str, end_date: str) -> pd.Series:
+        """区间内每个产品第一个交易日的收盘价，产品来自临时表 chunk_symbols"""
+        # SQLite 中与 MIN() 一起查询的裸列取自 MIN() 所在的行
+        rows = conn.execute('''
+            SELECT symbol, MIN(date), close
+            FROM unified_price_view
+            WHERE symbol IN (SELECT symbol FROM temp.chunk_symbols)
+            AND date BETWEEN ? AND ?
+            GROUP BY symbol
+        ''', (start_date, end_date)).fetchall()
+        return pd.Series({symbol: close for symbol, _, close in rows}, dtype=float)
+
+    def iter_portfolio_chunks(self, symbols: List[str], start_date: str, end_date: str,
+                              chunk_days: int = 365, fill: bool = True) -> Iterator[pd.DataFrame]:
+        """
+        按日期分块逐个返回投资组合数据，峰值内存只与一个块的大小有关
+
+        每块按日期区间单独查询和透视，列固定为全部产品（按产品代码排序）。fill 为 True 时的结果与
+        load_portfolio_data(...).ffill().bfill() 逐行相同：向前填充带着上一块的最后一行继续，
+        开头还没有数据的产品用它在区间内的第一个收盘价填充（预先查询一次）。
+        产品数量很多时，产品列表写入临时表，不受SQL参数个数的限制。
+
+        Args:
+            symbols: 产品代码列表
+            start_date: 开始日期，格式为 'YYYY-MM-DD'
+            end_date: 结束日期，格式为 'YYYY-MM-DD'
+            chunk_days: 每块覆盖的自然日天数
+            fill: 是否填充缺失值
+
+        Returns:
+            Iterator[DataFrame]: 索引为日期、列为 <产品代码>_close 的数据块，跳过没有数据的区间；
+                区间内完全没有数据的产品整列为NaN
+        """
+        if chunk_days <= 0:
+            raise ValueError(f"chunk_days 应大于0，当前为 {chunk_days}")
+        symbols = sorted(symbols)
+        columns = [f"{symbol}_close" for symbol in symbols]
+        conn = sqlite3.connect(self.db_path)
+        try:
+            conn.execute('CREATE TEMP TABLE IF NOT EXISTS chunk_symbols (symbol VARCHAR(20) PRIMARY KEY)')
+            conn.execute('DELETE FROM temp.chunk_symbols')
+            conn.executemany('INSERT OR IGNORE INTO temp.chunk_symbols VALUES (?)', [(symbol,) for symbol in symbols])
+
+            carry = pd.Series(np.nan, index=columns)
+            if fill:
+                seeds = self._first_closes(conn, start_date, end_date)
+                seeds.index = [f"{symbol}_close" for symbol in seeds.index]
+                seeds = seeds.reindex(columns)
+
+            block_start = pd.Timestamp(start_date)
+            end = pd.Timestamp(end_date)
+            while block_start <= end:
+                block_end = min(block_start + pd.Timedelta(days=chunk_days - 1), end)
+                with profile_span('query'):
+                    df = pd.read_sql_query('''
+                        SELECT symbol, date, close
+                        FROM unified_price_view
+                        WHERE symbol IN (SELECT symbol FROM temp.chunk_symbols)
+                        AND date BETWEEN ? AND ?
+                        ORDER BY date
+                    ''', conn, params=(block_start.strftime('%Y-%m-%d'), block_end.strftime('%Y-%m-%d')))
+                block_start = block_end + pd.Timedelta(days=1)
+                if df.empty:
+                    continue
+
+                with profile_span('pivot'):
+                    df['date'] = pd.to_datetime(df['date'])
+                    chunk = df.pivot(index='date', columns='symbol', values='close')
+                    chunk.columns = [f"{col}_close" for col in chunk.columns]
+                    chunk = chunk.reindex(columns=columns)
+                del df
+
+                if fill:
+                    with profile_span('fill'):
+                        chunk.iloc[0] = chunk.iloc[0].fillna(carry)
+                        chunk = chunk.ffill().fillna(seeds)
+                        carry = chunk.iloc[-1]
+                yield chunk
+        finally:
+            conn.close()
+
+    @profiled('DataLoader.load_valuation_data')
+    def load_valuation_data(self, symbol: str, start_date: Optional[str] = None, end_date: Optional[str] = None) -> pd.Series:
+        """
+        从数据库加载某个产品的PE-TTM估值数据
         
-        # 重命名列以添加后缀，便于后续处理
-        df_pivot.columns = [f"{col}_close" for col in df_pivot.columns]
+        Args:
+            symbol: 产品代码，如 'SPY'
+            start_date: 开始日期，格式为 'YYYY-MM-DD'，默认从最早的数据开始
+            end_date: 结束日期，格式为 'YYYY-MM-DD'，默认到最新的数据
+            
+        Returns:
+            Series: 以日期为索引的PE-TTM序列，不含缺失值
+        """
+        conn = sqlite3.connect(self.db_path)
         
+        query = """
+        SELECT 
+            date,
+            pe_ttm
+        FROM unified_price_view
+        WHERE symbol = ?
+        AND pe_ttm IS NOT NULL
+        AND date BETWEEN ? AND ?
+        ORDER BY date
+        """
+        params = [symbol, start_date or '0000-01-01', end_date or '9999-12-31']
+        df = pd.read_sql_query(query, conn, params=params)
         conn.close()
-        return df_pivot 
\ No newline at end of file
+        
+        df['date'] = pd.to_datetime(df['date'])
+        return df.set_index('date')['pe_ttm'].astype(float)
@@ -0,0 +1,62 @@
+"""
+数据版本模块
+描述一个回测配置所用的行情和估值数据的版本，用于判断回测结果是否因数据变化而过期（报告生成、结果库）
+"""
+import sqlite3
+from typing import Dict, Tuple
+
+
+class DataVersionCache:
+    """按 (产品, 区间) 缓存数据版本，同一批配置共用的产品和区间只查询一次"""
+
+    def __init__(self):
+        self._versions: Dict[Tuple, list] = {}
+
+    def price_version(self, conn: sqlite3.Connection, symbol: str, start_date: str, end_date: str) -> list:
+        """
+        某个产品在回测区间内数据的版本：行数、最后日期和收盘价之和
+
+        区间外追加的新数据不改变版本，区间内的数据被补录或修正时版本随之变化。
+        """
+        key = (symbol, start_date, end_date)
+        if key not in self._versions:
+            row = conn.execute('''
+                SELECT COUNT(*), MAX(date), ROUND(SUM(close), 6)
+                FROM unified_price_view
+                WHERE symbol = ? AND date BETWEEN ? AND ?
+            ''', (symbol, start_date, end_date)).fetchone()
+            self._versions[key] = list(row)
+        return self._versions[key]
+
+    def valuation_version(self, conn: sqlite3.Connection, symbol: str, end_date: str) -> list:
+        """估值百分位与回测结束日期之前的全部估值历史有关"""
+        key = (symbol, 'pe_ttm', end_date)
+        if key not in self._versions:
+            row = conn.execute('''
+                SELECT COUNT(*), MAX(date), ROUND(SUM(pe_ttm), 6)
+                FROM unified_price_view
+                WHERE symbol = ? AND pe_ttm IS NOT NULL AND date <= ?
+            ''', (symbol, end_date)).fetchone()
+            self._versions[key] = list(row)
+        return self._versions[key]
+
+    def config_versions(self, conn: sqlite3.Connection, config: Dict) -> Dict[str, list]:
+        """
+        一个回测配置所用全部数据的版本
+
+        Returns:
+            Dict[str, list]: 产品代码到价格数据版本的映射，配置了估值择时时另有 'valuation' 项
+        """
+        start_date, end_date = config['start_date'], config['end_date']
+        versions = {
+            symbol: self.price_version(conn, symbol, start_date, end_date)
+            for symbol in sorted(config['target_percentage'])
+        }
+        valuation = config.get('valuation_allocation')
+        if valuation:
+            versions['valuation'] = self.valuation_version(conn, valuation['signal_symbol'], end_date)
+        return versions
+
+    def clear(self) -> None:
+        """清空缓存，数据更新后调用"""
+        self._versions.clear()
@@ -0,0 +1,111 @@
+"""
+回撤计算模块
+在一次线性扫描中把净值曲线切分为 高点→低点→恢复 的回撤区间，支持同时处理多条净值曲线
+"""
+import numpy as np
+import pandas as pd
+
+EPISODE_COLUMNS = ['curve', 'peak', 'trough', 'recovery', 'depth', 'drawdown_length', 'recovery_length']
+
+
+def find_drawdown_episodes(values) -> pd.DataFrame:
+    """
+    找出净值曲线中的所有回撤区间
+
+    回撤区间为净值低于历史最高值的一段连续时间：起点为进入回撤前最后一个创新高的位置，
+    低点为区间内的最小值，恢复点为之后第一次回到（不低于）起点净值的位置。
+    各区间之间天然不重叠。
+
+    Args:
+        values: 一维数组（单条净值曲线），或二维数组（行为日期，列为各条净值曲线）。
+            每列开头的NaN视为尚无数据，之后的NaN（如不同交易日历的曲线合并后的缺失）沿用前一个有效值。
+
+    Returns:
+        DataFrame: 每行一个回撤区间，位置均为行号：
+            - curve: 所属净值曲线的列号（一维输入时为0）
+            - peak: 回撤起始位置（高点）
+            - trough: 回撤最低点位置
+            - recovery: 恢复位置，尚未恢复为-1
+            - depth: 回撤幅度（负数，如-0.12表示回撤12%）
+            - drawdown_length: 高点到低点的天数（含首尾）
+            - recovery_length: 低点到恢复点的天数（含首尾），尚未恢复为-1
+    """
+    matrix = np.asarray(values, dtype=float)
+    if matrix.ndim == 1:
+        matrix = matrix[:, None]
+    n_rows, n_curves = matrix.shape
+    if n_rows == 0:
+        return pd.DataFrame(columns=EPISODE_COLUMNS)
+
+    # 向前填充：每个位置取本列当天或之前最后一个有效值的行号，开头的NaN保持不变
+    source_row = np.maximum.accumulate(np.where(np.isnan(matrix), 0, np.arange(n_rows)[:, None]), axis=0)
+    matrix = matrix[source_row, np.arange(n_curves)]
+
+    # 按列展开成一维，每列的第0行不可能处于回撤中，因此回撤区间不会跨列
+    flat = matrix.ravel(order='F')
+    running_max = np.fmax.accumulate(matrix, axis=0).ravel(order='F')
+    underwater = flat < running_max
+
+    previous = np.concatenate(([False], underwater[:-1]))
+    following = np.concatenate((underwater[1:], [False]))
+    row = np.tile(np.arange(n_rows), n_curves)
+    previous[row == 0] = False
+    following[row == n_rows - 1] = False
+    starts = np.flatnonzero(underwater & ~previous)
+    ends = np.flatnonzero(underwater & ~following)
+
+    if len(starts) == 0:
+        return pd.DataFrame(columns=EPISODE_COLUMNS)
+
+    # 每个区间的最小值：reduceat 交替使用区间起点和终点的下一位作为分段边界
+    bounds = np.empty(len(starts) * 2, dtype=np.int64)
+    bounds[0::2] = starts
+    bounds[1::2] = ends + 1
+    if bounds[-1] == len(flat):
+        bounds = bounds[:-1]
+    segment_min = np.minimum.reduceat(flat, bounds)[0::2]
+
+    # 每个区间内第一次取到最小值的位置
+    lengths = ends - starts + 1
+    members = np.flatnonzero(underwater)
+    episode_id = np.repeat(np.arange(len(starts)), lengths)
+    is_min = flat[members] == np.repeat(segment_min, lengths)
+    hits = members[is_min]
+    hit_ids = episode_id[is_min]
+    first_hit = np.concatenate(([True], hit_ids[1:] != hit_ids[:-1]))
+    troughs = hits[first_hit]
+
+    peaks = starts - 1
+    recovered = row[ends] < n_rows - 1
+
+    # 高点位于填充的位置时取它的来源行，即实际创新高的日期
+    peak_rows = source_row.ravel(order='F')[peaks]
+    trough_rows = row[troughs]
+    recovery_rows = np.where(recovered, row[np.minimum(ends + 1, len(flat) - 1)], -1)
+
+    return pd.DataFrame({
+        'curve': starts // n_rows,
+        'peak': peak_rows,
+        'trough': trough_rows,
+        'recovery': recovery_rows,
+        'depth': flat[troughs] / flat[peaks] - 1,
+        'drawdown_length': trough_rows - peak_rows + 1,
+        'recovery_length': np.where(recovered, recovery_rows - trough_rows + 1, -1),
+    })
+
+
+def top_drawdown_episodes(values, k: int = 3) -> pd.DataFrame:
+    """
+    找出每条净值曲线中幅度最大的k个回撤区间
+
+    Args:
+        values: 一维或二维净值数组，含义同 find_drawdown_episodes
+        k: 每条曲线返回的回撤区间数量
+
+    Returns:
+        DataFrame: 列同 find_drawdown_episodes，按曲线、回撤幅度从大到小排序，另含 rank 列（从1开始）
+    """
+    episodes = find_drawdown_episodes(values)
+    episodes = episodes.sort_values(['curve', 'depth'], kind='stable')
+    episodes['rank'] = episodes.groupby('curve').cumcount() + 1
+    return episodes[episodes['rank'] <= k].reset_index(drop=True)
@@ -0,0 +1,289 @@
+"""
+批量回测实验运行器
+从 YAML/JSON 实验定义文件读取回测配置，在同一个进程中共享一次加载的价格数据运行全部实验，
+每次回测的结果作为一行 JSON 写入 JSONL 文件
+
+实验定义文件格式（YAML 示例，JSON 结构相同）：
+    defaults:                 # 可选，合并到每个实验的配置中
+      initial_total_value: 100000
+      rebalance_strategy: DRIFT_REBALANCE
+      drift_threshold: 0.2
+    experiments:
+      - name: 股债平衡
+        config:
+          target_percentage: {SPY: 0.2, '090010': 0.2, '518880': 0.2, '070009': 0.4}
+          start_date: '2013-08-01'
+          end_date: '2025-04-30'
+      - name: 滚动5年
+        config: {...}
+        rolling_windows:        # 可选，展开为多个起始日期的回测
+          first_start: '2013-08-01'
+          last_start: '2020-04-01'
+          step_months: 1
+          years: 5
+
+使用方法：
+    python -m portfolio.experiment_runner portfolio/experiments/rebalance_strategies.yaml -o results.jsonl
+    python -m portfolio.experiment_runner a.yaml b.json --workers 4
+    # 日线回测使用 StreamingBacktest（只计算组合层面的指标）
+    python -m portfolio.experiment_runner a.yaml --workers 4 --streaming
+    # 同时写入结果库（见 portfolio.results_store），--store-curves 同时保存净值曲线
+    python -m portfolio.experiment_runner a.yaml --store --sweep-id 2025-06-30 --store-curves
+"""
+import argparse
+import copy
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional
+import pandas as pd
+from common.constants import RESULTS_DB_PATH
+from data_manager.price_aggregate_manager import DAILY
+from portfolio.data_loader import DataLoader
+from portfolio.portfolio_backtest import PortfolioBacktest, check_portfolio_config
+from portfolio.portfolio_analyzer import PortfolioAnalyzer
+
+# 随代码提供的实验定义文件目录，run_* 脚本从这里读取各自的配置
+EXPERIMENTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'experiments')
+
+# 进程池中每个子进程映射的共享价格面板及其 DataFrame 视图
+_worker_panel = None
+_worker_price_data: Optional[pd.DataFrame] = None
+_worker_include_curve = False
+_worker_streaming = False
+
+
+def load_experiment_file(path: str) -> Dict:
+    """
+    读取实验定义文件，按扩展名选择 YAML 或 JSON 解析
+
+    Args:
+        path: 文件路径，扩展名为 .yaml/.yml 或 .json
+
+    Returns:
+        Dict: 包含 defaults 和 experiments 的字典
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        if path.endswith(('.yaml', '.yml')):
+            import yaml
+            definition = yaml.safe_load(f)
+        else:
+            definition = json.load(f)
+    if not isinstance(definition, dict) or not isinstance(definition.get('experiments'), list):
+        raise ValueError(f"{path} 中缺少 experiments 列表")
+    return definition
+
+
+def _rolling_starts(first_start: str, last_start: str, step_months: int) -> Iterator[str]:
+    start = pd.Timestamp(first_start)
+    last = pd.Timestamp(last_start)
+    while start <= last:
+        yield start.strftime('%Y-%m-%d')
+        start += pd.DateOffset(months=step_months)
+
+
+def expand_experiments(definition: Dict, source: str = '') -> List[Dict]:
+    """
+    把实验定义展开为单次回测的列表
+
+    Args:
+        definition: load_experiment_file 返回的字典
+        source: 定义文件路径，记录在结果中
+
+    Returns:
+        List[Dict]: 每项包含 experiment、run、source、config
+    """
+    defaults = definition.get('defaults') or {}
+    runs = []
+    for index, experiment in enumerate(definition['experiments']):
+        name = str(experiment.get('name', f'experiment_{index + 1}'))
+        config = {**copy.deepcopy(defaults), **copy.deepcopy(experiment.get('config') or {})}
+        rolling = experiment.get('rolling_windows')
+        if not rolling:
+            runs.append({'experiment': name, 'run': name, 'source': source, 'config': config})
+            continue
+
+        # 与 run_different_time_backtest.py 相同，每个窗口的结束日期为起始日期加 365*years 天
+        for start_date in _rolling_starts(rolling['first_start'], rolling['last_start'], rolling.get('step_months', 1)):
+            run_config = copy.deepcopy(config)
+            run_config['start_date'] = start_date
+            run_config['end_date'] = (datetime.strptime(start_date, '%Y-%m-%d') +
+                                      timedelta(days=365 * rolling['years'])).strftime('%Y-%m-%d')
+            runs.append({'experiment': name, 'run': f"{name}@{start_date}", 'source': source, 'config': run_config})
+    return runs
+
+
+def load_shared_price_data(runs: List[Dict], data_loader: Optional[DataLoader] = None) -> pd.DataFrame:
+    """
+    一次加载所有回测需要的产品在最大日期范围内的价格数据（未填充缺失值）
+
+    Args:
+        runs: expand_experiments 返回的回测列表
+        data_loader: 数据加载器，默认新建一个
+
+    Returns:
+        DataFrame: load_portfolio_data 格式的价格数据
+    """
+    data_loader = data_loader or DataLoader()
+    # 缺少必要字段的配置在 run_experiment 中记录为错误，这里跳过
+    configs = [run['config'] for run in runs
+               if all(key in run['config'] for key in ('target_percentage', 'start_date', 'end_date'))]
+    if not configs:
+        return pd.DataFrame()
+    symbols = sorted({symbol for config in configs for symbol in config['target_percentage']})
+    start_date = min(config['start_date'] for config in configs)
+    end_date = max(config['end_date'] for config in configs)
+    return data_loader.load_portfolio_data(symbols, start_date, end_date)
+
+
+def _json_value(value):
+    if isinstance(value, pd.Timestamp):
+        return value.strftime('%Y-%m-%d')
+    if value is None or isinstance(value, (str, int, bool)):
+        return value
+    value = float(value)
+    return None if pd.isna(value) else value
+
+
+def run_experiment(run: Dict, price_data: Optional[pd.DataFrame] = None, include_curve: bool = False,
+                   streaming: bool = False, data_loader: Optional[DataLoader] = None) -> Dict:
+    """
+    运行单次回测并整理成可序列化的结果，配置无效或回测出错时记录错误而不抛出异常
+
+    Args:
+        run: expand_experiments 返回的一项
+        price_data: 共享的价格数据，None 时从数据库加载
+        include_curve: 是否在结果中附带净值曲线（equity_curve，total_value 序列，不可直接序列化为 JSON）
+        streaming: 日线回测是否使用 StreamingBacktest，总价值相同、速度快得多，但只计算组合层面的指标
+        data_loader: 数据加载器，配置检查、估值百分位等都使用它的数据库，默认使用 DB_PATH 指向的数据库
+
+    Returns:
+        Dict: 包含 experiment、run、source、config、status、error、elapsed_seconds、metrics、max_drawdowns
+    """
+    record = {**run, 'status': 'ok', 'error': None, 'metrics': None, 'max_drawdowns': None}
+    started = time.perf_counter()
+    try:
+        data_loader = data_loader or DataLoader()
+        error_code, error_msg = check_portfolio_config(run['config'], data_loader.db_path)
+        if error_code != 0:
+            raise ValueError(error_msg)
+
+        if streaming and run['config'].get('frequency', DAILY) == DAILY:
+            from portfolio.streaming_backtest import StreamingBacktest
+            backtest = StreamingBacktest(run['config'], data_loader, price_data=price_data)
+        else:
+            backtest = PortfolioBacktest(run['config'], data_loader, price_data=price_data)
+        backtest.run_backtest()
+        results = backtest.get_results()
+        analyzer = PortfolioAnalyzer(results)
+
+        metrics = analyzer.compute_all_metrics(flat=True)
+        record['metrics'] = {key: _json_value(value) for key, value in metrics.items()}
+        record['max_drawdowns'] = [
+            {key: _json_value(value) for key, value in drawdown.items()}
+            for drawdown in analyzer.calculate_portfolio_max_drawdown()
+        ]
+        if include_curve:
+            record['equity_curve'] = results['total_value']
+    except Exception as e:
+        record['status'] = 'error'
+        record['error'] = f"{type(e).__name__}: {e}"
+    record['elapsed_seconds'] = time.perf_counter() - started
+    return record
+
+
+def _init_worker(panel_descriptor: Dict, include_curve: bool = False, streaming: bool = False) -> None:
+    global _worker_panel, _worker_price_data, _worker_include_curve, _worker_streaming
+    from portfolio.shared_panel import SharedPricePanel
+    _worker_panel = SharedPricePanel.attach(panel_descriptor)
+    _worker_price_data = _worker_panel.to_frame()
+    _worker_include_curve = include_curve
+    _worker_streaming = streaming
+
+
+def _run_in_worker(run: Dict) -> Dict:
+    return run_experiment(run, _worker_price_data, _worker_include_curve, _worker_streaming)
+
+
+def run_experiments(runs: List[Dict], workers: int = 1, price_data: Optional[pd.DataFrame] = None,
+                    include_curve: bool = False, streaming: bool = False) -> Iterator[Dict]:
+    """
+    运行全部回测，按输入顺序逐个返回结果
+
+    Args:
+        runs: expand_experiments 返回的回测列表
+        workers: 进程数，1 表示在当前进程中依次运行
+        price_data: 共享的价格数据，默认由 load_shared_price_data 加载
+        include_curve: 是否在结果中附带净值曲线，见 run_experiment
+        streaming: 日线回测是否使用 StreamingBacktest，见 run_experiment
+
+    Returns:
+        Iterator[Dict]: run_experiment 的结果
+    """
+    if not runs:
+        return
+    if price_data is None:
+        price_data = load_shared_price_data(runs)
+
+    if workers <= 1:
+        for run in runs:
+            yield run_experiment(run, price_data, include_curve, streaming)
+        return
+
+    # 价格数据只在共享内存中保存一份，子进程按描述信息映射为只读视图，之后每个任务只传配置
+    from concurrent.futures import ProcessPoolExecutor
+    from portfolio.shared_panel import SharedPricePanel
+    with SharedPricePanel.publish(price_data) as panel:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(panel.descriptor, include_curve, streaming)) as executor:
+            chunksize = max(1, len(runs) // (workers * 4))
+            yield from executor.map(_run_in_worker, runs, chunksize=chunksize)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='批量运行回测实验')
+    parser.add_argument('files', nargs='+', help='实验定义文件（.yaml/.yml/.json）')
+    parser.add_argument('-o', '--output', default='experiment_results.jsonl', help='结果输出路径（JSONL），- 表示标准输出')
+    parser.add_argument('-w', '--workers', type=int, default=1, help='并行进程数')
+    parser.add_argument('--store', nargs='?', const=RESULTS_DB_PATH, help='同时写入结果库，可指定结果库路径')
+    parser.add_argument('--sweep-id', help='写入结果库时的批次标识，默认为当前时间')
+    parser.add_argument('--store-curves', action='store_true', help='在结果库中同时保存净值曲线')
+    parser.add_argument('--streaming', action='store_true',
+                        help='日线回测使用 StreamingBacktest，速度快得多，但只计算组合层面的指标')
+    args = parser.parse_args(argv)
+
+    runs = []
+    for path in args.files:
+        runs.extend(expand_experiments(load_experiment_file(path), source=os.path.basename(path)))
+
+    store = None
+    if args.store:
+        from portfolio.results_store import ResultsStore
+        store = ResultsStore(args.store)
+    sweep_id = args.sweep_id or datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+    output = sys.stdout if args.output == '-' else open(args.output, 'w', encoding='utf-8')
+    failed = 0
+    try:
+        for record in run_experiments(runs, args.workers, include_curve=store is not None and args.store_curves,
+                                      streaming=args.streaming):
+            failed += record['status'] != 'ok'
+            if store is not None:
+                store.add(record, sweep_id)
+            record.pop('equity_curve', None)
+            output.write(json.dumps(record, ensure_ascii=False) + '\n')
+    finally:
+        if output is not sys.stdout:
+            output.close()
+        if store is not None:
+            store.close()
+
+    if output is not sys.stdout:
+        print(f"完成 {len(runs)} 次回测，失败 {failed} 次，结果已保存到 {args.output}", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
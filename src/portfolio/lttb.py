@@ -0,0 +1,52 @@
+"""
+折线降采样模块
+实现 LTTB（Largest-Triangle-Three-Buckets）算法，在大幅减少点数的同时保留曲线的峰谷形状
+"""
+import numpy as np
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """
+    用 LTTB 算法选出需要保留的数据点
+
+    首尾两点总是保留；中间的点均分成 threshold-2 个桶，每个桶保留与前一个选中点、
+    下一个桶平均点构成三角形面积最大的那个点。
+
+    Args:
+        x: 横坐标（数值型，日期需先转换为数值），单调递增
+        y: 纵坐标
+        threshold: 保留的点数
+
+    Returns:
+        np.ndarray: 保留点的下标，单调递增
+    """
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    # 桶边界：中间 n-2 个点均分成 threshold-2 个桶
+    edges = np.floor(np.linspace(1, n - 1, threshold - 1)).astype(np.int64)
+
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    previous = 0
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        # 下一个桶的平均点，最后一个桶以末尾点为参照
+        if bucket + 2 < len(edges):
+            next_start, next_end = edges[bucket + 1], edges[bucket + 2]
+            next_x = x[next_start:next_end].mean()
+            next_y = y[next_start:next_end].mean()
+        else:
+            next_x, next_y = x[-1], y[-1]
+
+        areas = np.abs(
+            (x[previous] - next_x) * (y[start:end] - y[previous]) -
+            (x[previous] - x[start:end]) * (next_y - y[previous])
+        )
+        previous = start + int(np.argmax(areas))
+        selected[bucket + 1] = previous
+    return selected
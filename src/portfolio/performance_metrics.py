@@ -0,0 +1,184 @@
+"""
+绩效指标模块
+基于一次计算得到的日收益率，用向量化的方式按列计算各条净值曲线的全部绩效指标
+"""
+import numpy as np
+import pandas as pd
+from typing import Dict
+
+TRADING_DAYS_PER_YEAR = 252
+
+
+def infer_periods_per_year(index: pd.DatetimeIndex) -> float:
+    """
+    根据日期索引推断每年的观测次数（日频约为252，周频约为52，月频为12）
+
+    Args:
+        index: 净值曲线的日期索引
+
+    Returns:
+        float: 每年的观测次数，数据不足时返回日频的默认值
+    """
+    if len(index) < 2:
+        return TRADING_DAYS_PER_YEAR
+    years = (index[-1] - index[0]).days / 365.25
+    if years <= 0:
+        return TRADING_DAYS_PER_YEAR
+    return (len(index) - 1) / years
+
+
+def compute_period_returns(returns: pd.DataFrame, freq: str) -> pd.DataFrame:
+    """
+    把日收益率复合成月度或年度收益率
+
+    Args:
+        returns: 日收益率，行为日期，列为各条净值曲线
+        freq: 'M' 表示按月，'Y' 表示按年
+
+    Returns:
+        DataFrame: 行为期间，列为各条净值曲线
+    """
+    keys = returns.index.year if freq == 'Y' else returns.index.to_period('M')
+    return np.exp(np.log1p(returns).groupby(keys).sum(min_count=1)) - 1
+
+
+def compute_metrics_table(values: pd.DataFrame, risk_free_rate: float = 0.0, returns: pd.DataFrame = None) -> pd.DataFrame:
+    """
+    计算多条净值曲线的绩效指标
+
+    日收益率只计算一次，所有指标都由它通过 groupby 或 NumPy 归约得到。
+
+    Args:
+        values: 净值曲线，行为日期，列为各条净值曲线
+        risk_free_rate: 年化无风险利率，用于夏普和索提诺比率
+        returns: 已经计算好的日收益率，不提供时由 values 计算；values 中各曲线的交易日历不同时，
+            应由调用方按每条曲线自己的有效日期计算，见 BatchPortfolioAnalyzer
+
+    Returns:
+        DataFrame: 每行一条净值曲线，列为各项指标：
+            - total_return / annualized_return: 总收益率 / 年化收益率
+            - annualized_volatility: 年化波动率
+            - sharpe_ratio / sortino_ratio / calmar_ratio: 夏普、索提诺、卡玛比率
+            - max_drawdown: 最大回撤（负数）
+            - best_month / worst_month / best_year / worst_year: 最好/最差的月度、年度收益率
+            - hit_rate / monthly_hit_rate: 日收益率、月收益率为正的比例
+            - skewness / kurtosis: 日收益率的偏度和超额峰度
+    """
+    # 每条曲线按自己的首个、最后一个有效日期计算总收益和年化收益
+    matrix = values.to_numpy(dtype=float)
+    valid = ~np.isnan(matrix)
+    first_row = valid.argmax(axis=0)
+    last_row = len(matrix) - 1 - valid[::-1].argmax(axis=0)
+    columns = np.arange(matrix.shape[1])
+    total_return = matrix[last_row, columns] / matrix[first_row, columns] - 1
+    total_days = (values.index.values[last_row] - values.index.values[first_row]) / np.timedelta64(1, 'D')
+
+    # 每年的观测次数也按每条曲线自己的有效日期推断，口径同 infer_periods_per_year
+    with np.errstate(divide='ignore', invalid='ignore'):
+        periods_per_year = np.where(total_days > 0, (valid.sum(axis=0) - 1) / (total_days / 365.25),
+                                    TRADING_DAYS_PER_YEAR)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        annualized_return = np.where(total_days > 0, (1 + total_return) ** (365 / total_days) - 1, np.nan)
+
+    if returns is None:
+        returns = values.pct_change(fill_method=None)
+    returns_matrix = returns.to_numpy(dtype=float)
+
+    # 年化波动率、夏普比率和索提诺比率
+    periodic_risk_free = risk_free_rate / periods_per_year
+    excess = returns_matrix - periodic_risk_free
+    mean_excess = np.nanmean(excess, axis=0)
+    volatility = np.nanstd(returns_matrix, axis=0, ddof=1) * np.sqrt(periods_per_year)
+    downside = np.sqrt(np.nanmean(np.minimum(excess, 0.0) ** 2, axis=0)) * np.sqrt(periods_per_year)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sharpe = mean_excess * periods_per_year / volatility
+        sortino = mean_excess * periods_per_year / downside
+
+    # 最大回撤和卡玛比率
+    max_drawdown = np.nanmin(matrix / np.fmax.accumulate(matrix, axis=0) - 1, axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        calmar = annualized_return / np.abs(max_drawdown)
+
+    monthly = compute_period_returns(returns, 'M')
+    yearly = compute_period_returns(returns, 'Y')
+    valid_returns = ~np.isnan(returns_matrix)
+
+    return pd.DataFrame({
+        'total_return': total_return,
+        'annualized_return': annualized_return,
+        'annualized_volatility': volatility,
+        'sharpe_ratio': sharpe,
+        'sortino_ratio': sortino,
+        'max_drawdown': max_drawdown,
+        'calmar_ratio': calmar,
+        'best_month': monthly.max().to_numpy(),
+        'worst_month': monthly.min().to_numpy(),
+        'best_year': yearly.max().to_numpy(),
+        'worst_year': yearly.min().to_numpy(),
+        'hit_rate': (returns_matrix > 0).sum(axis=0) / valid_returns.sum(axis=0),
+        'monthly_hit_rate': (monthly > 0).sum().to_numpy() / monthly.count().to_numpy(),
+        'skewness': returns.skew().to_numpy(),
+        'kurtosis': returns.kurt().to_numpy(),
+    }, index=values.columns)
+
+
+def compute_asset_contribution(asset_values: pd.DataFrame, asset_prices: pd.DataFrame,
+                               total_values: pd.Series = None) -> pd.Series:
+    """
+    计算每个资产对组合收益的贡献
+
+    每日贡献为前一日该资产占组合的权重乘以当日该资产的价格收益率。日收益率是复利累积的，
+    直接把每日贡献相加与总收益率对不上，这里用 Carino 对数系数链接：每日贡献乘以 ln(1+R_t)/R_t
+    再除以 ln(1+R)/R，R_t 为组合当日收益率，R 为组合总收益率。
+
+    组合每天的收益率都等于各资产贡献之和时，链接后的贡献之和正好等于 R。PortfolioBacktest 的再平衡日
+    按前一日总价值和当日价格重新建仓，当天的价格变动不计入组合收益，这部分差额不归入任何资产，
+    即 R 减去各资产贡献之和。
+
+    Args:
+        asset_values: 各资产每日持仓价值，列为资产
+        asset_prices: 各资产每日价格，列与 asset_values 一一对应
+        total_values: 组合每日总价值，默认为各资产持仓价值之和
+
+    Returns:
+        Series: 以资产为索引的收益贡献
+    """
+    if total_values is None:
+        total_values = asset_values.sum(axis=1)
+    weights = asset_values.div(asset_values.sum(axis=1), axis=0).shift(1)
+    price_returns = asset_prices.pct_change(fill_method=None)
+    price_returns.columns = asset_values.columns
+    portfolio_returns = total_values.pct_change(fill_method=None).iloc[1:]
+    total_return = total_values.iloc[-1] / total_values.iloc[0] - 1
+    daily = (weights * price_returns).iloc[1:]
+    return daily.mul(_carino_factor(portfolio_returns), axis=0).sum() / _carino_factor(total_return)
+
+
+def _carino_factor(returns):
+    """Carino 链接系数 ln(1+r)/r，r 为 0 时取极限值 1"""
+    returns = np.asarray(returns, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        factor = np.where(returns == 0, 1.0, np.log1p(returns) / returns)
+    return factor if factor.ndim else float(factor)
+
+
+def flatten_metrics(metrics: Dict) -> Dict:
+    """
+    把嵌套的指标字典展开成一层，便于拼成大的比较表
+
+    Series 或字典类型的指标展开为 "<指标名>_<键>" 形式的字段，如 calendar_year_returns_2020。
+
+    Args:
+        metrics: compute_all_metrics 返回的指标字典
+
+    Returns:
+        Dict: 只包含标量值的一层字典
+    """
+    record = {}
+    for name, value in metrics.items():
+        if isinstance(value, (pd.Series, dict)):
+            for key, item in dict(value).items():
+                record[f"{name}_{key}"] = float(item)
+        else:
+            record[name] = float(value)
+    return record
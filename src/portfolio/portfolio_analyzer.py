@@ -3,20 +3,62 @@
 负责分析回测结果，计算各种性能指标
 """
 import pandas as pd
-from typing import Dict, List
+from typing import Dict, List, Optional
 from datetime import datetime
+from common.profiling import profiled
+from data_manager.price_aggregate_manager import DAILY, AGGREGATE_FREQUENCIES, calendar_period_start
+from portfolio.drawdown_engine import top_drawdown_episodes
+from portfolio.rolling_metrics import calculate_rolling_metrics
+from portfolio.performance_metrics import compute_metrics_table, compute_period_returns, compute_asset_contribution, flatten_metrics
+
+def get_portfolio_symbols(portfolio_data: pd.DataFrame) -> List[str]:
+    """
+    获取回测结果中的产品代码列表
+    
+    优先使用回测时记录在 attrs 中的产品列表，否则去掉 "_close" 后缀得到（产品代码本身可以包含下划线）
+    """
+    if 'symbols' in portfolio_data.attrs:
+        return list(portfolio_data.attrs['symbols'])
+    return [col[:-len('_close')] for col in portfolio_data.columns if col.endswith('_close')]
+
+def sample_period_ends(portfolio_data: pd.DataFrame, frequency: str) -> pd.DataFrame:
+    """
+    从日线回测结果中取出第一行和每个周期的最后一行，得到与低频回测相同采样点的结果
+
+    Args:
+        portfolio_data: 回测结果
+        frequency: 'W' 或 'M'，周期划分与 price_aggregate 表相同
+
+    Returns:
+        DataFrame: 采样后的回测结果，保留 attrs 并把 attrs['frequency'] 设置为 frequency
+    """
+    keys = calendar_period_start(portfolio_data.index, frequency)
+    mask = ~keys.duplicated(keep='last')
+    mask[0] = True
+    sampled = portfolio_data[mask]
+    sampled.attrs = {**portfolio_data.attrs, 'frequency': frequency}
+    return sampled
 
 class PortfolioAnalyzer:
-    def __init__(self, portfolio_data: pd.DataFrame):
+    def __init__(self, portfolio_data: pd.DataFrame, frequency: Optional[str] = None):
         """
         初始化分析器
         
         Args:
             portfolio_data: 包含回测结果的DataFrame
+            frequency: 分析周期，None 表示使用回测结果本身的周期；对日线结果指定 'W'/'M' 时，
+                只用每个周期末的数据计算指标（年化波动率等按实际采样频率折算），适合长周期批量分析
         """
+        data_frequency = portfolio_data.attrs.get('frequency', DAILY)
+        if frequency is not None and frequency != data_frequency:
+            if frequency not in AGGREGATE_FREQUENCIES or data_frequency != DAILY:
+                raise ValueError(f"{data_frequency} 周期的回测结果不能按 {frequency} 周期分析")
+            portfolio_data = sample_period_ends(portfolio_data, frequency)
         self.portfolio_data = portfolio_data
-        self.portfolio = [col.split('_')[0] for col in portfolio_data.columns if col.endswith('_close')]
+        self.frequency = portfolio_data.attrs.get('frequency', DAILY)
+        self.portfolio = get_portfolio_symbols(portfolio_data)
 
+    @profiled('PortfolioAnalyzer.calculate_portfolio_return')
     def calculate_portfolio_return(self) -> Dict:
         """
         计算投资组合的收益率指标
@@ -30,11 +72,8 @@ class PortfolioAnalyzer:
         annualized_portfolio_return = (1 + portfolio_return) ** (365/total_days) - 1
         
         # 计算每年的收益率
-        annual_returns = {}
-        for year in range(self.portfolio_data.index[0].year, self.portfolio_data.index[-1].year + 1):
-            year_data = self.portfolio_data[self.portfolio_data.index.year == year]
-            year_return = (year_data['total_value'].iloc[-1] / year_data['total_value'].iloc[0] - 1)
-            annual_returns[year] = year_return
+        yearly_values = self.portfolio_data['total_value'].groupby(self.portfolio_data.index.year).agg(['first', 'last'])
+        annual_returns = (yearly_values['last'] / yearly_values['first'] - 1).to_dict()
 
         return {
             'portfolio_return': portfolio_return,
@@ -42,6 +81,7 @@ class PortfolioAnalyzer:
             'annual_returns': annual_returns
         }
     
+    @profiled('PortfolioAnalyzer.calculate_asset_return')
     def calculate_asset_return(self) -> Dict:
         """
         计算每个资产的收益率
@@ -67,10 +107,63 @@ class PortfolioAnalyzer:
             'annulized_asset_returns': annulized_asset_returns
         }
 
-    def calculate_portfolio_max_drawdown(self) -> List[Dict]:
+    @profiled('PortfolioAnalyzer.compute_all_metrics')
+    def compute_all_metrics(self, risk_free_rate: float = 0.0, flat: bool = False) -> Dict:
+        """
+        一次性计算投资组合的全部绩效指标
+        
+        日收益率只计算一次，年化波动率、夏普/索提诺/卡玛比率、最好/最差月份和年份、
+        胜率、偏度/峰度以及各资产收益贡献都由它得到。
+        
+        Args:
+            risk_free_rate: 年化无风险利率，默认为0
+            flat: 是否返回展开后的一层字典，便于拼成比较表
+            
+        Returns:
+            Dict: 包含 compute_metrics_table 中的全部指标，以及：
+                - calendar_year_returns: 每个自然年的收益率，由日收益率复利得到，从上一年最后一个交易日的净值算起；
+                  与 calculate_portfolio_return 的 annual_returns（年内第一个到最后一个交易日）口径不同
+                - asset_contribution: 各资产对组合收益的贡献，按组合日收益率链接（见 compute_asset_contribution）
+                - rebalance_contribution: 总收益率减去各资产贡献之和，即再平衡日未计入组合收益的价格变动
+        """
+        values = self.portfolio_data[['total_value']]
+        returns = values.pct_change(fill_method=None)
+        
+        metrics = compute_metrics_table(values, risk_free_rate, returns=returns).iloc[0].to_dict()
+        metrics['calendar_year_returns'] = compute_period_returns(returns, 'Y')['total_value']
+        metrics['asset_contribution'] = compute_asset_contribution(
+            self.portfolio_data[[f"{symbol}_value" for symbol in self.portfolio]],
+            self.portfolio_data[[f"{symbol}_close" for symbol in self.portfolio]],
+            self.portfolio_data['total_value']
+        ).rename(lambda col: col[:-len('_value')])
+        metrics['rebalance_contribution'] = metrics['total_return'] - metrics['asset_contribution'].sum()
+        
+        return flatten_metrics(metrics) if flat else metrics
+
+    @profiled('PortfolioAnalyzer.calculate_rolling_metrics')
+    def calculate_rolling_metrics(self, window_years: int = 5) -> pd.DataFrame:
+        """
+        计算每个日期上过去N年的滚动年化收益率、波动率和最大回撤
+        
+        一次线性扫描得到所有窗口，不需要按窗口切片后重复分析。
+        
+        Args:
+            window_years: 窗口长度（年），默认为5
+            
+        Returns:
+            DataFrame: 与回测结果日期对齐的滚动指标，可直接用于绘图，
+                列为 window_start、rolling_annualized_return、rolling_volatility、rolling_max_drawdown
+        """
+        return calculate_rolling_metrics(self.portfolio_data['total_value'], window_years)
+
+    @profiled('PortfolioAnalyzer.calculate_portfolio_max_drawdown')
+    def calculate_portfolio_max_drawdown(self, top_n: int = 3) -> List[Dict]:
         """
         计算前三名的最大回撤，确保时间段不重叠
         
+        Args:
+            top_n: 返回的回撤数量，默认为3
+        
         Returns:
             List[Dict]: 包含前三名最大回撤信息的列表，每个字典包含：
                 - max_drawdown: 最大回撤百分比
@@ -81,64 +174,22 @@ class PortfolioAnalyzer:
                 - recovery_length: 恢复持续天数
         """
         # 获取总价值序列
-        series = self.portfolio_data['total_value'].copy()
+        series = self.portfolio_data['total_value']
+        dates = series.index
         
-        # 计算累积最大值
-        rolling_max = series.cummax()
+        # 一次扫描切分出所有回撤区间，取幅度最大的几个（区间之间天然不重叠）
+        episodes = top_drawdown_episodes(series.to_numpy(), k=top_n)
         
-        # 计算回撤百分比
-        drawdown = (series / rolling_max - 1) * 100
-        
-        # 找到所有局部最小值（回撤点）
-        local_minima = []
-        for i in range(1, len(drawdown)-1):
-            if drawdown.iloc[i] < drawdown.iloc[i-1] and drawdown.iloc[i] < drawdown.iloc[i+1]:
-                local_minima.append({
-                    'date': drawdown.index[i],
-                    'value': drawdown.iloc[i]
-                })
-        
-        # 按回撤值排序
-        local_minima.sort(key=lambda x: x['value'])
-        
-        # 获取前三名最大回撤，确保时间段不重叠
-        top_three_drawdowns = []
-        used_periods = []  # 记录已使用的时间段
-        
-        for minima in local_minima:
-            if len(top_three_drawdowns) >= 3:
-                break
-                
-            trough_date = minima['date']
-            peak_date = series[:trough_date].idxmax()
-            
-            # 计算恢复日期（如果存在）
-            recovery_series = series[trough_date:]
-            recovery_date = None
-            for date, value in recovery_series.items():
-                if value >= series[peak_date]:
-                    recovery_date = date
-                    break
-            
-            # 检查时间段是否与已有回撤重叠
-            current_period = (peak_date, recovery_date if recovery_date else series.index[-1])
-            is_overlapping = False
-            
-            for used_period in used_periods:
-                # 检查时间段是否重叠
-                if (current_period[0] <= used_period[1] and current_period[1] >= used_period[0]):
-                    is_overlapping = True
-                    break
-            
-            if not is_overlapping:
-                used_periods.append(current_period)
-                top_three_drawdowns.append({
-                    'max_drawdown': minima['value'],  # 最大回撤幅度(%)
-                    'peak_date': peak_date,  # 回撤起始日期(高点)
-                    'trough_date': trough_date,  # 回撤结束日期(低点)
-                    'recovery_date': recovery_date,  # 恢复到高点的日期
-                    'drawdown_length': len(series[peak_date:trough_date]),  # 回撤持续天数
-                    'recovery_length': len(series[trough_date:recovery_date]) if recovery_date else None  # 恢复持续天数
-                })
+        top_drawdowns = []
+        for episode in episodes.itertuples(index=False):
+            recovered = episode.recovery >= 0
+            top_drawdowns.append({
+                'max_drawdown': episode.depth * 100,  # 最大回撤幅度(%)
+                'peak_date': dates[episode.peak],  # 回撤起始日期(高点)
+                'trough_date': dates[episode.trough],  # 回撤结束日期(低点)
+                'recovery_date': dates[episode.recovery] if recovered else None,  # 恢复到高点的日期
+                'drawdown_length': int(episode.drawdown_length),  # 回撤持续天数
+                'recovery_length': int(episode.recovery_length) if recovered else None  # 恢复持续天数
+            })
         
-        return top_three_drawdowns 
\ No newline at end of file
+        return top_drawdowns 
@@ -4,29 +4,21 @@
 """
 import pandas as pd
 from datetime import datetime
-from typing import Dict, List
+from typing import Dict, List, Optional
 import logging
-from common.trading_products import TRADING_PRODUCTS
+from data_manager.universe_manager import get_product_info
+from data_manager.price_aggregate_manager import DAILY, FIRST_PRICE_SUFFIX, aggregate_close_panel
+from common.profiling import profiled, profile_span
 from portfolio.data_loader import DataLoader
 from portfolio.config_validator import check_portfolio_config
+from portfolio.valuation_allocation import get_valuation_percentile, build_target_weights, DEFAULT_LAG_DAYS
 
-# 配置日志记录器
+# 日志记录器，处理器和级别由调用方（如脚本入口中的 logging.basicConfig）配置，导入本模块不产生副作用
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.DEBUG)
-
-# 创建控制台处理器
-console_handler = logging.StreamHandler()
-console_handler.setLevel(logging.INFO)
-
-# 创建格式化器
-formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-console_handler.setFormatter(formatter)
-
-# 将处理器添加到日志记录器
-logger.addHandler(console_handler)
 
 class PortfolioBacktest:
-    def __init__(self, config: Dict):
+    def __init__(self, config: Dict, data_loader: Optional[DataLoader] = None,
+                 price_data: Optional[pd.DataFrame] = None):
         """
         初始化回测类
         
@@ -37,29 +29,69 @@ class PortfolioBacktest:
                 - end_date: str 回测结束日期，格式为 'YYYY-MM-DD'
                 - initial_total_value: float 初始投资金额
                 - show_plot: bool 是否显示图形化结果
+                - valuation_allocation: Dict 可选，按估值百分位调整目标持仓比例，包含：
+                    - signal_symbol: str 估值序列所属的产品代码，如 'SPY'
+                    - window_years: int 百分位的回看窗口（年），None 表示使用全部历史
+                    - tiers: List[Dict] 估值分档，每档包含 min_percentile 和 target_percentage，
+                      估值百分位不低于 min_percentile 时使用该档的目标持仓比例，
+                      没有匹配的档位时使用 target_percentage
+                    - lag_days: int 可选，日线模拟的执行延迟（自然日），默认为1：当天收盘再平衡只使用前一天及之前的估值，
+                      避免A股收盘时用到美股当天收盘后才有的估值；0 表示使用当天的估值
+                - frequency: str 可选，模拟周期，'D'（默认）逐个交易日模拟，'W'/'M' 按周/月模拟：
+                  在每个周期的第一个交易日再平衡、最后一个交易日估值，年度再平衡的结果与日线相同，
+                  偏离再平衡只在周期末检查，估值分档只在周期末切换
+            data_loader: 数据加载器，默认使用 DB_PATH 指向的数据库
+            price_data: 可选，已经加载好的价格数据（load_portfolio_data 的格式，可以包含更多产品和更长的区间），
+                提供时直接从中截取本次回测需要的产品和日期，不再查询数据库，便于多个回测共享一份数据
         """
         self.config = config
-        self.data_loader = DataLoader()
+        self.data_loader = data_loader or DataLoader()
+        self.price_data = price_data
         self.portfolio_data = None
+        self.target_weights = None
         self.portfolio = list(config['target_percentage'].keys())
+        self.frequency = config.get('frequency', DAILY)
+        # 低频模拟时每个周期第一个交易日的收盘价（再平衡价格），列顺序与 self.portfolio 相同
+        self.first_prices = None
         
+    @profiled('PortfolioBacktest.initialize_portfolio')
     def initialize_portfolio(self) -> None:
         """
         初始化投资组合数据
         包括：加载历史数据、计算初始持仓数量、设置初始持仓价值
         """
-        # 从数据库加载历史价格数据
-        self.portfolio_data = self.data_loader.load_portfolio_data(
-            self.portfolio,
-            self.config['start_date'],
-            self.config['end_date']
-        )
+        if self.price_data is not None:
+            # 从共享的价格数据中截取，结果与单独查询数据库相同：列按产品代码排序，只保留至少一个产品有数据的日期
+            columns = [f"{symbol}_close" for symbol in sorted(self.portfolio)]
+            missing = [col for col in columns if col not in self.price_data.columns]
+            if missing:
+                raise ValueError(f"共享的价格数据中缺少 {missing}")
+            self.portfolio_data = self.price_data.loc[self.config['start_date']:self.config['end_date'], columns]
+            self.portfolio_data = self.portfolio_data.dropna(how='all').copy()
+            if self.frequency != DAILY:
+                self.portfolio_data = aggregate_close_panel(self.portfolio_data, self.frequency)
+        else:
+            # 从数据库加载历史价格数据
+            self.portfolio_data = self.data_loader.load_portfolio_data(
+                self.portfolio,
+                self.config['start_date'],
+                self.config['end_date'],
+                frequency=self.frequency
+            )
         
         if self.portfolio_data is None or self.portfolio_data.empty:
             raise ValueError("无法加载投资组合数据，请检查产品代码和日期范围")
 
         # 使用新的方法填充缺失值
-        self.portfolio_data = self.portfolio_data.ffill().bfill()
+        with profile_span('fill'):
+            if self.frequency == DAILY:
+                self.portfolio_data = self.portfolio_data.ffill().bfill()
+            else:
+                self._fill_period_data()
+
+        # 计算每个交易日的目标持仓比例
+        with profile_span('target_weights'):
+            self.target_weights = self._build_target_weights()
 
         # 初始化持仓数量和价值
         initial_total_value = self.config['initial_total_value']
@@ -67,7 +99,7 @@ class PortfolioBacktest:
         for symbol in self.portfolio:
             # 计算初始持仓数量：根据目标比例和初始总价值计算
             initial_close = self.portfolio_data[f"{symbol}_close"].iloc[0]
-            initial_share_number = initial_total_value * self.config['target_percentage'][symbol] / initial_close
+            initial_share_number = initial_total_value * self.target_weights.at[self.portfolio_data.index[0], symbol] / initial_close
             
             # 添加持仓数量列，用于记录每日持仓数量
             self.portfolio_data.insert(
@@ -92,9 +124,54 @@ class PortfolioBacktest:
         self.portfolio_data['total_value'] = 0.0
         self.portfolio_data.at[self.portfolio_data.index[0], 'total_value'] = float(initial_total_value)
         
+        # 记录产品列表和数据周期，分析时不再依赖列名拆分
+        self.portfolio_data.attrs['symbols'] = list(self.portfolio)
+        self.portfolio_data.attrs['frequency'] = self.frequency
+        
         # 输出初始数据
         logger.debug("\n初始投资组合数据:\n" + str(self.portfolio_data))
         
+    def _fill_period_data(self) -> None:
+        """
+        填充周线/月线数据的缺失值，并把周期首个收盘价从结果中分离到 self.first_prices
+
+        与日线的 ffill().bfill() 对应：整个周期没有数据的产品沿用上一周期的收盘价（首个价格已由 combine_period_parts 填好）；
+        开始时还没有数据的产品，收盘价和首个价格都使用第一个有数据周期的首个价格。
+        """
+        close_columns = [f"{symbol}_close" for symbol in self.portfolio]
+        first_columns = [f"{symbol}{FIRST_PRICE_SUFFIX}" for symbol in self.portfolio]
+        first = self.portfolio_data[first_columns].set_axis(close_columns, axis=1).bfill()
+        close = self.portfolio_data[close_columns].ffill().fillna(first)
+
+        self.first_prices = first.to_numpy(dtype=float)
+        self.portfolio_data = self.portfolio_data.drop(columns=first_columns)
+        self.portfolio_data[close_columns] = close
+
+    def _build_target_weights(self) -> pd.DataFrame:
+        """
+        生成每个交易日的目标持仓比例
+        
+        未配置估值择时时每天都等于 target_percentage；配置了 valuation_allocation 时，
+        估值百分位只计算一次，再按分档规则向量化地映射到每个交易日
+        """
+        dates = self.portfolio_data.index
+        valuation_config = self.config.get('valuation_allocation')
+        if not valuation_config:
+            return pd.DataFrame([self.config['target_percentage']] * len(dates), index=dates, columns=self.portfolio)
+        
+        percentile = get_valuation_percentile(
+            valuation_config['signal_symbol'],
+            valuation_config.get('window_years'),
+            self.data_loader
+        )
+        if self.frequency == DAILY:
+            return build_target_weights(percentile, dates, self.portfolio, self.config['target_percentage'],
+                                        valuation_config['tiers'], valuation_config.get('lag_days', DEFAULT_LAG_DAYS))
+        weights = build_target_weights(percentile, dates, self.portfolio,
+                                       self.config['target_percentage'], valuation_config['tiers'])
+        # 低频模拟在周期初再平衡，只能使用上一周期末的估值，避免用到周期内之后的数据
+        return pd.concat([weights.iloc[:1], weights.shift(1).iloc[1:]])
+        
     def get_results(self) -> pd.DataFrame:
         """
         获取回测结果
@@ -106,15 +183,25 @@ class PortfolioBacktest:
             raise ValueError("请先运行回测")
         return self.portfolio_data 
         
+    @profiled('PortfolioBacktest.run_backtest')
     def run_backtest(self) -> None:
         """
-        根据再平衡策略运行回测        
+        根据再平衡策略运行回测
+        
+        开启性能剖析时，数据加载和初始化统计在 initialize_portfolio 区段中，本区段的自身耗时即逐日模拟的耗时
         """
         if self.portfolio_data is None:
             self.initialize_portfolio() 
             
         rebalance_strategy = self.config['rebalance_strategy']
 
+        # 目标持仓比例发生变化的交易日（估值分档切换），一次性计算
+        target_changed = self.target_weights.ne(self.target_weights.shift()).any(axis=1).to_numpy(copy=True)
+        target_changed[0] = False
+        target_weights = self.target_weights.to_numpy()
+        # 日志中使用的产品名称，全市场产品从 product_metadata 表中查询
+        names = {symbol: (get_product_info(symbol, self.data_loader.db_path) or {}).get('name', symbol)
+                 for symbol in self.portfolio}
             
         for i in range(1, len(self.portfolio_data)):
             current_date = self.portfolio_data.index[i]
@@ -122,7 +209,11 @@ class PortfolioBacktest:
             
             is_rebalance_day = False
             
-            if rebalance_strategy == 'NO_REBALANCE':
+            # 估值分档变化时，按新的目标持仓比例再平衡
+            if target_changed[i]:
+                is_rebalance_day = True
+                logger.debug(f"估值分档变化日: {current_date}，新的目标持仓比例: {dict(zip(self.portfolio, target_weights[i]))}")
+            elif rebalance_strategy == 'NO_REBALANCE':
                 pass
             elif rebalance_strategy == 'ANNUAL_REBALANCE':
                 # 判断是否是1月1日
@@ -130,28 +221,37 @@ class PortfolioBacktest:
                     is_rebalance_day = True
                     logger.debug(f"年度再平衡日: {current_date}")
             elif rebalance_strategy == 'DRIFT_REBALANCE':  # 当某个资产的持仓价值偏离预设值的20%时进行再平衡 
-                for symbol in self.portfolio:
+                for j, symbol in enumerate(self.portfolio):
                     previous_value = self.portfolio_data.at[previous_date, f"{symbol}_value"]
-                    target_value = self.config['target_percentage'][symbol] * self.portfolio_data.at[previous_date, 'total_value']
-                    if abs(previous_value - target_value) / target_value > self.config['drift_threshold']:
+                    target_value = target_weights[i-1, j] * self.portfolio_data.at[previous_date, 'total_value']
+                    if target_value == 0:
+                        # 目标比例为0的资产（估值分档清仓），只要仍有持仓即视为偏离
+                        if previous_value > 0:
+                            is_rebalance_day = True
+                            logger.debug(f"日期: {current_date} {symbol} {names[symbol]} 目标比例为0但仍有持仓，进行再平衡")
+                            break
+                    elif abs(previous_value - target_value) / target_value > self.config['drift_threshold']:
                         is_rebalance_day = True
-                        logger.debug(f"日期: {current_date} {symbol} {TRADING_PRODUCTS[symbol]['name']} 持仓价值偏离预设值的{self.config['drift_threshold']*100}%，当前百分比为: {previous_value/target_value*100:.2f}%，进行再平衡")
+                        logger.debug(f"日期: {current_date} {symbol} {names[symbol]} 持仓价值偏离预设值的{self.config['drift_threshold']*100}%，当前百分比为: {previous_value/target_value*100:.2f}%，进行再平衡")
                         break
                
 
             # 计算每个资产的持仓变化
-            for symbol in self.portfolio:
+            for j, symbol in enumerate(self.portfolio):
                 # 获取当前价格
                 current_price = self.portfolio_data.at[current_date, f"{symbol}_close"]
                 
                 if is_rebalance_day:
                     # 如果是再平衡日，根据目标比例重新计算持仓数量
                     previous_total_value = self.portfolio_data.at[previous_date, 'total_value']
-                    share_number = previous_total_value * self.config['target_percentage'][symbol] / current_price
+                    # 低频模拟在周期的第一个交易日按当天收盘价再平衡
+                    rebalance_price = current_price if self.first_prices is None else self.first_prices[i, j]
+                    share_number = previous_total_value * target_weights[i, j] / rebalance_price
                     # 打印再平衡日持仓数量比例的变化
                     previous_share_number = self.portfolio_data.at[previous_date, f"{symbol}_share_number"]
-                    change_percentage = (share_number - previous_share_number)/previous_share_number * 100
-                    logger.debug(f"{symbol} {TRADING_PRODUCTS[symbol]['name']} 持仓数量变化百分比: {change_percentage:.2f}%")
+                    if previous_share_number != 0:
+                        change_percentage = (share_number - previous_share_number)/previous_share_number * 100
+                        logger.debug(f"{symbol} {names[symbol]} 持仓数量变化百分比: {change_percentage:.2f}%")
 
                 else:
                     # 如果不是再平衡日，保持持仓数量不变
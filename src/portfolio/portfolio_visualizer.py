@@ -1,56 +1,158 @@
 """
 投资组合可视化模块
 负责处理投资组合回测结果的可视化展示
+
+matplotlib 在第一次绘图时才导入并设置中文字体；headless 模式使用非交互的 Agg 后端直接生成 Figure，
+不经过 pyplot 的全局状态，长序列可用 LTTB 算法降采样，批量图表可在进程池中并行生成。
 """
 import pandas as pd
-import matplotlib.pyplot as plt
 from datetime import datetime
 import os
-from typing import Dict
-from common.trading_products import TRADING_PRODUCTS
+from typing import Dict, List, Optional, Tuple
+from data_manager.universe_manager import get_product_info
 from common.constants import PROJECT_ROOT
+from common.profiling import profiled, profile_span
+from portfolio.portfolio_analyzer import get_portfolio_symbols
+from portfolio.lttb import lttb_indices
+
+# 批量生成图表时每条曲线默认保留的点数
+DEFAULT_MAX_POINTS = 2000
+
+_fonts_configured = False
+
+
+def _configure_fonts() -> None:
+    """设置matplotlib中文字体，只执行一次"""
+    global _fonts_configured
+    if _fonts_configured:
+        return
+    import matplotlib
+    matplotlib.rcParams['font.sans-serif'] = ['SimHei']  # 用来正常显示中文标签
+    matplotlib.rcParams['axes.unicode_minus'] = False  # 用来正常显示负号
+    _fonts_configured = True
+
+
+def downsample_series(series: pd.Series, max_points: Optional[int]) -> pd.Series:
+    """
+    用 LTTB 算法把序列降采样到不超过 max_points 个点
+
+    Args:
+        series: 以日期为索引的序列
+        max_points: 保留的最大点数，None 表示不降采样
+
+    Returns:
+        Series: 降采样后的序列
+    """
+    series = series.dropna()
+    if max_points is None or len(series) <= max_points:
+        return series
+    x = series.index.values.astype('datetime64[ns]').astype('int64').astype(float)
+    return series.iloc[lttb_indices(x, series.to_numpy(dtype=float), max_points)]
 
-# 设置matplotlib中文字体
-plt.rcParams['font.sans-serif'] = ['SimHei']  # 用来正常显示中文标签
-plt.rcParams['axes.unicode_minus'] = False  # 用来正常显示负号
 
 class PortfolioVisualizer:
-    def __init__(self):
-        """初始化可视化器"""
-        pass
-        
+    def __init__(self, headless: bool = False, max_points: Optional[int] = None):
+        """
+        初始化可视化器
+
+        Args:
+            headless: 是否使用非交互的 Agg 后端绘图，批量生成图表或在没有显示器的环境中运行时使用
+            max_points: 每条曲线保留的最大点数，超过时用 LTTB 算法降采样，None 表示绘制全部数据点
+        """
+        self.headless = headless
+        self.max_points = max_points
+
+    def _new_figure(self, figsize: Tuple[float, float]):
+        _configure_fonts()
+        if self.headless:
+            from matplotlib.figure import Figure
+            from matplotlib.backends.backend_agg import FigureCanvasAgg
+            fig = Figure(figsize=figsize)
+            FigureCanvasAgg(fig)
+            return fig
+        import matplotlib.pyplot as plt
+        return plt.figure(figsize=figsize)
+
+    def _close_figure(self, fig) -> None:
+        if not self.headless:
+            import matplotlib.pyplot as plt
+            plt.close(fig)
+
+    @profiled('PortfolioVisualizer.plot_portfolio_returns')
     def plot_portfolio_returns(self, portfolio_data: pd.DataFrame, save_path: str = 'portfolio_return_analysis.png') -> None:
         """
         绘制投资组合和各资产的相对收益率变化图
-        
+
         Args:
             portfolio_data: 包含回测结果的DataFrame
             save_path: 图表保存路径，默认为'portfolio_return_analysis.png'
         """
         if portfolio_data is None or portfolio_data.empty:
             raise ValueError("请提供有效的投资组合数据")
-            
-        plt.figure(figsize=(12, 6))
-        
+
+        fig = self._new_figure((12, 6))
+        ax = fig.add_subplot(1, 1, 1)
+
         # 绘制投资组合总价值的相对收益率
         initial_total_value = portfolio_data['total_value'].iloc[0]
-        normalized_total_value = portfolio_data['total_value'] / initial_total_value * 100
-        plt.plot(portfolio_data.index, normalized_total_value, label='投资组合总价值', linewidth=2)
-        
+        normalized_total_value = downsample_series(portfolio_data['total_value'] / initial_total_value * 100,
+                                                   self.max_points)
+        ax.plot(normalized_total_value.index, normalized_total_value, label='投资组合总价值', linewidth=2)
+
         # 绘制各个资产的相对收益率
-        for symbol in [col.split('_')[0] for col in portfolio_data.columns if col.endswith('_close')]:
+        for symbol in get_portfolio_symbols(portfolio_data):
             initial_price = portfolio_data[f"{symbol}_close"].iloc[0]
-            normalized_price = portfolio_data[f"{symbol}_close"] / initial_price * 100
-            plt.plot(portfolio_data.index, normalized_price, 
-                    label=f"{symbol} ({TRADING_PRODUCTS[symbol]['name']})")
-        
+            normalized_price = downsample_series(portfolio_data[f"{symbol}_close"] / initial_price * 100,
+                                                 self.max_points)
+            ax.plot(normalized_price.index, normalized_price,
+                    label=f"{symbol} ({(get_product_info(symbol) or {}).get('name', symbol)})")
+
         # 添加标题和时间戳
         current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        plt.title(f'投资组合及各资产相对收益率变化\n生成时间：{current_time}')
-        plt.xlabel('日期')
-        plt.ylabel('相对收益率(%)')
-        plt.grid(True)
-        plt.legend()
-        plt.tight_layout()
-        plt.savefig(save_path)
-        plt.close() 
\ No newline at end of file
+        ax.set_title(f'投资组合及各资产相对收益率变化\n生成时间：{current_time}')
+        ax.set_xlabel('日期')
+        ax.set_ylabel('相对收益率(%)')
+        ax.grid(True)
+        ax.legend()
+        with profile_span('savefig'):
+            fig.tight_layout()
+            fig.savefig(save_path)
+        self._close_figure(fig)
+
+
+def _chart_payload(portfolio_data: pd.DataFrame) -> pd.DataFrame:
+    """只保留绘图需要的列，减少传给子进程的数据量"""
+    symbols = get_portfolio_symbols(portfolio_data)
+    payload = portfolio_data[['total_value'] + [f"{symbol}_close" for symbol in symbols]].copy()
+    payload.attrs['symbols'] = symbols
+    return payload
+
+
+def _render_portfolio_chart(job: Tuple[pd.DataFrame, str, Optional[int]]) -> str:
+    portfolio_data, save_path, max_points = job
+    PortfolioVisualizer(headless=True, max_points=max_points).plot_portfolio_returns(portfolio_data, save_path)
+    return save_path
+
+
+def render_portfolio_charts(jobs: List[Tuple[pd.DataFrame, str]], max_workers: Optional[int] = None,
+                            max_points: Optional[int] = DEFAULT_MAX_POINTS) -> List[str]:
+    """
+    批量生成投资组合相对收益率图表
+
+    每张图表在 headless 模式下绘制，多张图表时在进程池中并行生成。
+
+    Args:
+        jobs: (回测结果DataFrame, 图表保存路径) 列表
+        max_workers: 进程数，默认为CPU核数；为1时在当前进程中依次生成
+        max_points: 每条曲线保留的最大点数，None 表示绘制全部数据点
+
+    Returns:
+        List[str]: 按 jobs 顺序返回的图表保存路径
+    """
+    payloads = [(_chart_payload(portfolio_data), save_path, max_points) for portfolio_data, save_path in jobs]
+    if max_workers == 1 or len(payloads) <= 1:
+        return [_render_portfolio_chart(payload) for payload in payloads]
+
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(_render_portfolio_chart, payloads))
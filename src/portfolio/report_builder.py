@@ -0,0 +1,254 @@
+"""
+回测报告生成模块
+把多个回测配置的配置、绩效指标、回撤表和收益率图表生成为静态HTML网站，首页为各组合的比较表
+
+每个组合的页面都记录一个输入指纹：配置内容、回测区间内所用数据的版本和报告版本的SHA-256。
+重新生成报告时只重新回测并生成指纹发生变化的页面，首页直接使用 manifest.json 中保存的指标汇总，
+因此每晚更新数据后，大量没有受到影响的组合几乎不需要额外开销。
+
+使用方法：
+    builder = ReportBuilder('reports')
+    builder.build({'股债平衡': config_a, '全天候': config_b})
+"""
+import hashlib
+import html
+import json
+import os
+import re
+import sqlite3
+from datetime import datetime
+from typing import Dict, List, Optional
+import pandas as pd
+from common.constants import DB_PATH, PROJECT_ROOT
+from common.trading_products import TRADING_PRODUCTS
+from portfolio.data_loader import DataLoader
+from portfolio.portfolio_backtest import PortfolioBacktest, check_portfolio_config
+from portfolio.portfolio_analyzer import PortfolioAnalyzer
+from portfolio.data_version import DataVersionCache
+from portfolio.portfolio_visualizer import render_portfolio_charts, DEFAULT_MAX_POINTS
+
+# 页面模板或指标口径变化时加1，使所有页面重新生成
+REPORT_VERSION = 1
+
+MANIFEST_FILE = 'manifest.json'
+
+# 首页比较表中的指标及显示格式
+SUMMARY_METRICS = [
+    ('total_return', '总收益率', '{:.2%}'),
+    ('annualized_return', '年化收益率', '{:.2%}'),
+    ('annualized_volatility', '年化波动率', '{:.2%}'),
+    ('sharpe_ratio', '夏普比率', '{:.2f}'),
+    ('max_drawdown', '最大回撤', '{:.2%}'),
+    ('calmar_ratio', '卡玛比率', '{:.2f}'),
+]
+
+PAGE_STYLE = """
+body { font-family: sans-serif; margin: 2em; }
+table { border-collapse: collapse; margin-bottom: 1.5em; }
+th, td { border: 1px solid #ccc; padding: 4px 10px; text-align: right; }
+th { background: #f0f0f0; }
+pre { background: #f7f7f7; padding: 1em; }
+"""
+
+
+def _canonical_json(value) -> str:
+    return json.dumps(value, sort_keys=True, ensure_ascii=False, default=str)
+
+
+def _page_name(run_name: str) -> str:
+    """由组合名称生成文件名，附加名称的哈希避免不同名称清洗后重名"""
+    digest = hashlib.sha256(run_name.encode('utf-8')).hexdigest()[:8]
+    return f"{re.sub(r'[^0-9A-Za-z_-]+', '_', run_name).strip('_') or 'run'}_{digest}"
+
+
+def _format(value, fmt: str) -> str:
+    if value is None or pd.isna(value):
+        return '-'
+    return fmt.format(value)
+
+
+def _html_page(title: str, body: str) -> str:
+    return (
+        '<!DOCTYPE html>\n<html lang="zh-CN">\n<head>\n<meta charset="utf-8">\n'
+        f'<title>{html.escape(title)}</title>\n<style>{PAGE_STYLE}</style>\n</head>\n'
+        f'<body>\n<h1>{html.escape(title)}</h1>\n{body}\n</body>\n</html>\n'
+    )
+
+
+class ReportBuilder:
+    def __init__(self, output_dir: str, db_path: str = DB_PATH, max_workers: Optional[int] = None,
+                 max_points: Optional[int] = DEFAULT_MAX_POINTS):
+        """
+        初始化报告生成器
+
+        Args:
+            output_dir: 报告输出目录
+            db_path: 数据库路径，用于计算数据版本
+            max_workers: 生成图表的进程数，默认为CPU核数
+            max_points: 图表中每条曲线保留的最大点数
+        """
+        self.output_dir = output_dir
+        self.db_path = db_path
+        self.max_workers = max_workers
+        self.max_points = max_points
+        self._data_versions = DataVersionCache()
+
+    def fingerprint(self, config: Dict, conn: Optional[sqlite3.Connection] = None) -> str:
+        """
+        计算一个回测配置的输入指纹
+
+        Args:
+            config: 回测配置字典
+            conn: 数据库连接，默认新建一个
+
+        Returns:
+            str: 配置、所用数据版本和报告版本的SHA-256
+        """
+        own_conn = conn is None
+        conn = conn or sqlite3.connect(self.db_path)
+        try:
+            data_versions = self._data_versions.config_versions(conn, config)
+        finally:
+            if own_conn:
+                conn.close()
+
+        payload = _canonical_json({'report_version': REPORT_VERSION, 'config': config, 'data': data_versions})
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _load_manifest(self) -> Dict:
+        path = os.path.join(self.output_dir, MANIFEST_FILE)
+        if not os.path.exists(path):
+            return {}
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _save_manifest(self, manifest: Dict) -> None:
+        path = os.path.join(self.output_dir, MANIFEST_FILE)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2, sort_keys=True)
+
+    def _render_run_page(self, run_name: str, config: Dict, analyzer: PortfolioAnalyzer,
+                         page: str, fingerprint: str) -> Dict:
+        """生成单个组合的页面，返回首页使用的指标汇总"""
+        metrics = analyzer.compute_all_metrics()
+        drawdowns = pd.DataFrame(analyzer.calculate_portfolio_max_drawdown())
+
+        summary_rows = ''.join(
+            f'<tr><th>{label}</th><td>{_format(metrics[key], fmt)}</td></tr>'
+            for key, label, fmt in SUMMARY_METRICS
+        )
+        annual_returns = metrics['calendar_year_returns'].to_frame('年度收益率').rename_axis('年份')
+        contribution = metrics['asset_contribution'].rename(
+            lambda symbol: f"{symbol} ({TRADING_PRODUCTS.get(symbol, {}).get('name', symbol)})"
+        )
+        contribution['再平衡日'] = metrics['rebalance_contribution']
+        contribution = contribution.to_frame('收益贡献').rename_axis('资产')
+
+        body = (
+            f'<p><a href="../index.html">返回比较页</a></p>\n'
+            f'<p>生成时间：{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}<br>输入指纹：{fingerprint}</p>\n'
+            f'<img src="{page}.png" alt="相对收益率变化">\n'
+            f'<h2>绩效指标</h2>\n<table>{summary_rows}</table>\n'
+            f'<h2>年度收益率</h2>\n{annual_returns.to_html(float_format=lambda v: f"{v:.2%}")}\n'
+            f'<h2>资产收益贡献</h2>\n{contribution.to_html(float_format=lambda v: f"{v:.2%}")}\n'
+            f'<h2>最大回撤</h2>\n{drawdowns.to_html(index=False, float_format=lambda v: f"{v:.2f}")}\n'
+            f'<h2>回测配置</h2>\n<pre>{html.escape(json.dumps(config, ensure_ascii=False, indent=2, default=str))}</pre>'
+        )
+        with open(os.path.join(self.output_dir, 'runs', f'{page}.html'), 'w', encoding='utf-8') as f:
+            f.write(_html_page(run_name, body))
+
+        return {key: (None if pd.isna(metrics[key]) else float(metrics[key])) for key, _, _ in SUMMARY_METRICS}
+
+    def _render_index(self, manifest: Dict) -> None:
+        header = ''.join(f'<th>{label}</th>' for _, label, _ in SUMMARY_METRICS)
+        rows = []
+        for run_name, entry in sorted(manifest.items()):
+            cells = ''.join(f'<td>{_format(entry["summary"].get(key), fmt)}</td>' for key, _, fmt in SUMMARY_METRICS)
+            rows.append(
+                f'<tr><th><a href="runs/{entry["page"]}.html">{html.escape(run_name)}</a></th>'
+                f'<td>{entry["start_date"]} ~ {entry["end_date"]}</td>{cells}</tr>'
+            )
+        body = (
+            f'<p>生成时间：{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}，共 {len(manifest)} 个组合</p>\n'
+            f'<table>\n<tr><th>组合</th><th>回测区间</th>{header}</tr>\n' + '\n'.join(rows) + '\n</table>'
+        )
+        with open(os.path.join(self.output_dir, 'index.html'), 'w', encoding='utf-8') as f:
+            f.write(_html_page('投资组合回测比较', body))
+
+    def build(self, runs: Dict[str, Dict], force: bool = False) -> List[str]:
+        """
+        生成或增量更新报告
+
+        Args:
+            runs: 组合名称到回测配置的映射
+            force: 是否忽略指纹重新生成所有页面
+
+        Returns:
+            List[str]: 本次重新生成页面的组合名称
+        """
+        for run_name, config in runs.items():
+            error_code, error_msg = check_portfolio_config(config, self.db_path)
+            if error_code != 0:
+                raise ValueError(f"{run_name} 的配置无效：{error_msg}")
+
+        os.makedirs(os.path.join(self.output_dir, 'runs'), exist_ok=True)
+        old_manifest = self._load_manifest()
+        manifest = {}
+        rebuilt = []
+        chart_jobs = []
+        data_loader = DataLoader(self.db_path)
+
+        conn = sqlite3.connect(self.db_path)
+        try:
+            fingerprints = {run_name: self.fingerprint(config, conn) for run_name, config in runs.items()}
+        finally:
+            conn.close()
+
+        for run_name, config in runs.items():
+            page = _page_name(run_name)
+            previous = old_manifest.get(run_name)
+            page_exists = os.path.exists(os.path.join(self.output_dir, 'runs', f'{page}.html'))
+            if not force and previous and previous['fingerprint'] == fingerprints[run_name] and page_exists:
+                manifest[run_name] = previous
+                continue
+
+            backtest = PortfolioBacktest(config, data_loader)
+            backtest.run_backtest()
+            results = backtest.get_results()
+            summary = self._render_run_page(run_name, config, PortfolioAnalyzer(results), page, fingerprints[run_name])
+            chart_jobs.append((results, os.path.join(self.output_dir, 'runs', f'{page}.png')))
+
+            manifest[run_name] = {
+                'page': page,
+                'fingerprint': fingerprints[run_name],
+                'start_date': config['start_date'],
+                'end_date': config['end_date'],
+                'summary': summary,
+            }
+            rebuilt.append(run_name)
+
+        if chart_jobs:
+            render_portfolio_charts(chart_jobs, max_workers=self.max_workers, max_points=self.max_points)
+
+        # 删除已不在配置中的组合的页面
+        for run_name, entry in old_manifest.items():
+            if run_name not in manifest:
+                for suffix in ('.html', '.png'):
+                    path = os.path.join(self.output_dir, 'runs', f"{entry['page']}{suffix}")
+                    if os.path.exists(path):
+                        os.remove(path)
+
+        if rebuilt or manifest.keys() != old_manifest.keys() or not os.path.exists(os.path.join(self.output_dir, 'index.html')):
+            self._render_index(manifest)
+        self._save_manifest(manifest)
+        print(f"报告已更新：重新生成 {len(rebuilt)} 个页面，{len(manifest) - len(rebuilt)} 个页面未变化")
+        return rebuilt
+
+
+if __name__ == "__main__":
+    from portfolio.experiment_runner import EXPERIMENTS_DIR, expand_experiments, load_experiment_file
+
+    definition = load_experiment_file(os.path.join(EXPERIMENTS_DIR, 'rebalance_strategies.yaml'))
+    runs = {run['run']: run['config'] for run in expand_experiments(definition)}
+
+    ReportBuilder(os.path.join(PROJECT_ROOT, 'reports')).build(runs)
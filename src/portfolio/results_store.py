@@ -0,0 +1,280 @@
+"""
+回测结果库模块
+把每次回测的配置哈希、数据版本、绩效指标和（可选的）压缩净值曲线保存到独立的 SQLite 数据库，
+之后可以直接查询和比较不同批次的结果，不需要重新回测
+
+- backtest_run 表：每次回测一行，常用指标单独成列并建索引，其余指标保存在 metrics_json 中
+- equity_curve 表：压缩的净值曲线，日期为相邻交易日相差天数的 int32 数组，净值为 float64 数组，整体 zlib 压缩
+
+写入先放入缓冲区，攒够 batch_size 条后在一个事务中批量写入，大批量回测可以边运行边写入，不需要把结果全部留在内存中。
+
+使用方法：
+    with ResultsStore() as store:
+        for record in run_experiments(runs, include_curve=True):
+            store.add(record, sweep_id='2025-06-30')
+    ResultsStore().query_runs(order_by='calmar_ratio', limit=20, start_date_from='2013-01-01', max_drawdown_limit=0.15)
+"""
+import hashlib
+import json
+import sqlite3
+import zlib
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+import numpy as np
+import pandas as pd
+from common.constants import DB_PATH, RESULTS_DB_PATH
+from portfolio.data_version import DataVersionCache
+
+# 单独成列、可以排序和筛选的指标
+METRIC_COLUMNS = [
+    'total_return', 'annualized_return', 'annualized_volatility', 'sharpe_ratio',
+    'sortino_ratio', 'max_drawdown', 'calmar_ratio',
+]
+
+_RUN_COLUMNS = [
+    'sweep_id', 'experiment', 'run_name', 'source', 'config_hash', 'data_version',
+    'start_date', 'end_date', 'rebalance_strategy', 'frequency', 'status', 'error', 'elapsed_seconds',
+    *METRIC_COLUMNS, 'metrics_json', 'config_json', 'created_at',
+]
+
+
+def _canonical_json(value) -> str:
+    return json.dumps(value, sort_keys=True, ensure_ascii=False, default=str)
+
+
+def config_hash(config: Dict) -> str:
+    """回测配置的SHA-256，键的顺序不影响结果"""
+    return hashlib.sha256(_canonical_json(config).encode('utf-8')).hexdigest()
+
+
+def encode_equity_curve(curve: pd.Series) -> bytes:
+    """把以日期为索引的净值曲线编码为压缩的二进制数据"""
+    days = curve.index.values.astype('datetime64[D]').astype('int64')
+    deltas = np.diff(days, prepend=0).astype('<i4')
+    return zlib.compress(deltas.tobytes() + curve.to_numpy(dtype='<f8').tobytes())
+
+
+def decode_equity_curve(blob: bytes, points: int) -> pd.Series:
+    """encode_equity_curve 的逆操作"""
+    raw = zlib.decompress(blob)
+    days = np.cumsum(np.frombuffer(raw[:points * 4], dtype='<i4').astype('int64'))
+    values = np.frombuffer(raw[points * 4:], dtype='<f8')
+    return pd.Series(values, index=pd.DatetimeIndex(days.astype('datetime64[D]'), name='date'), name='total_value')
+
+
+def init_results_tables(conn: sqlite3.Connection) -> None:
+    """创建结果库的表和索引（如不存在）"""
+    metric_columns = ',\n        '.join(f"{col} REAL" for col in METRIC_COLUMNS)
+    metric_indexes = '\n    '.join(
+        f"CREATE INDEX IF NOT EXISTS idx_backtest_run_{col} ON backtest_run(status, {col});"
+        for col in ('calmar_ratio', 'sharpe_ratio', 'annualized_return', 'max_drawdown')
+    )
+    conn.executescript(f'''
+    CREATE TABLE IF NOT EXISTS backtest_run (
+        run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        sweep_id VARCHAR(50),
+        experiment VARCHAR(100),
+        run_name VARCHAR(200),
+        source VARCHAR(200),
+        config_hash CHAR(64) NOT NULL,
+        data_version CHAR(64),
+        start_date DATE,
+        end_date DATE,
+        rebalance_strategy VARCHAR(30),
+        frequency CHAR(1),
+        status VARCHAR(10) NOT NULL,
+        error TEXT,
+        elapsed_seconds REAL,
+        {metric_columns},
+        metrics_json TEXT,
+        config_json TEXT NOT NULL,
+        created_at TIMESTAMP NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_backtest_run_config ON backtest_run(config_hash, data_version);
+    CREATE INDEX IF NOT EXISTS idx_backtest_run_sweep ON backtest_run(sweep_id);
+    CREATE INDEX IF NOT EXISTS idx_backtest_run_start_date ON backtest_run(start_date);
+    {metric_indexes}
+
+    CREATE TABLE IF NOT EXISTS equity_curve (
+        run_id INTEGER PRIMARY KEY REFERENCES backtest_run(run_id),
+        points INTEGER NOT NULL,
+        data BLOB NOT NULL
+    );
+    ''')
+
+
+class ResultsStore:
+    def __init__(self, db_path: str = RESULTS_DB_PATH, data_db_path: str = DB_PATH, batch_size: int = 100):
+        """
+        初始化结果库
+
+        Args:
+            db_path: 结果库路径
+            data_db_path: 行情数据库路径，用于计算数据版本
+            batch_size: 缓冲区中的记录数达到该值时批量写入
+        """
+        self.db_path = db_path
+        self.data_db_path = data_db_path
+        self.batch_size = batch_size
+        self._buffer: List[tuple] = []
+        self._data_versions = DataVersionCache()
+        self._conn = sqlite3.connect(db_path)
+        self._data_conn = None
+        init_results_tables(self._conn)
+
+    def __enter__(self) -> 'ResultsStore':
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    def data_version(self, config: Dict) -> Optional[str]:
+        """回测配置所用数据的版本哈希，配置不完整时返回 None"""
+        if not all(key in config for key in ('target_percentage', 'start_date', 'end_date')):
+            return None
+        if self._data_conn is None:
+            self._data_conn = sqlite3.connect(self.data_db_path)
+        versions = self._data_versions.config_versions(self._data_conn, config)
+        return hashlib.sha256(_canonical_json(versions).encode('utf-8')).hexdigest()
+
+    def add(self, record: Dict, sweep_id: Optional[str] = None) -> None:
+        """
+        把一次回测的结果放入缓冲区，缓冲区满时批量写入
+
+        Args:
+            record: experiment_runner.run_experiment 返回的结果，包含 equity_curve 时一并保存净值曲线
+            sweep_id: 批次标识，用于比较不同批次的结果
+        """
+        config = record['config']
+        metrics = record.get('metrics') or {}
+        curve = record.get('equity_curve')
+        row = {
+            'sweep_id': sweep_id,
+            'experiment': record.get('experiment'),
+            'run_name': record.get('run'),
+            'source': record.get('source'),
+            'config_hash': config_hash(config),
+            'data_version': self.data_version(config),
+            'start_date': config.get('start_date'),
+            'end_date': config.get('end_date'),
+            'rebalance_strategy': config.get('rebalance_strategy'),
+            'frequency': config.get('frequency', 'D'),
+            'status': record.get('status', 'ok'),
+            'error': record.get('error'),
+            'elapsed_seconds': record.get('elapsed_seconds'),
+            **{col: metrics.get(col) for col in METRIC_COLUMNS},
+            'metrics_json': _canonical_json({'metrics': metrics, 'max_drawdowns': record.get('max_drawdowns')}),
+            'config_json': _canonical_json(config),
+            'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        }
+        blob = None if curve is None else (len(curve), encode_equity_curve(curve))
+        self._buffer.append((tuple(row[col] for col in _RUN_COLUMNS), blob))
+        if len(self._buffer) >= self.batch_size:
+            self.flush()
+
+    def add_many(self, records: Iterable[Dict], sweep_id: Optional[str] = None) -> int:
+        """逐条写入结果（可以是生成器），返回写入的条数"""
+        count = 0
+        for record in records:
+            self.add(record, sweep_id)
+            count += 1
+        self.flush()
+        return count
+
+    def flush(self) -> None:
+        """在一个事务中写入缓冲区中的全部记录"""
+        if not self._buffer:
+            return
+        placeholders = ', '.join(['?'] * len(_RUN_COLUMNS))
+        with self._conn:
+            for values, blob in self._buffer:
+                cursor = self._conn.execute(
+                    f"INSERT INTO backtest_run ({', '.join(_RUN_COLUMNS)}) VALUES ({placeholders})", values)
+                if blob is not None:
+                    self._conn.execute('INSERT INTO equity_curve (run_id, points, data) VALUES (?, ?, ?)',
+                                       (cursor.lastrowid, *blob))
+        self._buffer.clear()
+
+    def close(self) -> None:
+        """写入缓冲区中剩余的记录并关闭数据库连接"""
+        self.flush()
+        self._conn.close()
+        if self._data_conn is not None:
+            self._data_conn.close()
+
+    def query_runs(self, order_by: str = 'calmar_ratio', limit: int = 20, descending: bool = True,
+                   start_date_from: Optional[str] = None, max_drawdown_limit: Optional[float] = None,
+                   sweep_id: Optional[str] = None, experiment: Optional[str] = None) -> pd.DataFrame:
+        """
+        按指标排序查询成功的回测，例如 2013 年以来回撤不超过15%、卡玛比率最高的20个组合：
+            query_runs('calmar_ratio', 20, start_date_from='2013-01-01', max_drawdown_limit=0.15)
+
+        Args:
+            order_by: 排序的指标，见 METRIC_COLUMNS
+            limit: 返回的条数
+            descending: 是否从高到低排序
+            start_date_from: 只包含回测开始日期不早于该日期的回测
+            max_drawdown_limit: 最大回撤幅度的上限（正数，如0.15表示回撤不超过15%）
+            sweep_id: 只包含该批次的回测
+            experiment: 只包含该实验的回测
+
+        Returns:
+            DataFrame: 每行一次回测，包含 run_id、批次、名称、区间、配置哈希、数据版本和 METRIC_COLUMNS
+        """
+        if order_by not in METRIC_COLUMNS:
+            raise ValueError(f"不支持按 {order_by} 排序，应为 {METRIC_COLUMNS} 之一")
+        self.flush()
+        query = f'''
+            SELECT run_id, sweep_id, experiment, run_name, start_date, end_date, rebalance_strategy, frequency,
+                   config_hash, data_version, {', '.join(METRIC_COLUMNS)}
+            FROM backtest_run
+            WHERE status = 'ok' AND {order_by} IS NOT NULL
+        '''
+        params = []
+        if start_date_from:
+            query += ' AND start_date >= ?'
+            params.append(start_date_from)
+        if max_drawdown_limit is not None:
+            query += ' AND max_drawdown >= ?'
+            params.append(-abs(max_drawdown_limit))
+        if sweep_id:
+            query += ' AND sweep_id = ?'
+            params.append(sweep_id)
+        if experiment:
+            query += ' AND experiment = ?'
+            params.append(experiment)
+        query += f" ORDER BY {order_by} {'DESC' if descending else 'ASC'} LIMIT ?"
+        params.append(limit)
+        return pd.read_sql_query(query, self._conn, params=params)
+
+    def load_config(self, run_id: int) -> Dict:
+        """读取某次回测的配置"""
+        row = self._conn.execute('SELECT config_json FROM backtest_run WHERE run_id = ?', (run_id,)).fetchone()
+        if row is None:
+            raise ValueError(f"结果库中没有 run_id 为 {run_id} 的回测")
+        return json.loads(row[0])
+
+    def load_equity_curve(self, run_id: int) -> Optional[pd.Series]:
+        """读取某次回测的净值曲线，没有保存时返回 None"""
+        self.flush()
+        row = self._conn.execute('SELECT points, data FROM equity_curve WHERE run_id = ?', (run_id,)).fetchone()
+        return None if row is None else decode_equity_curve(row[1], row[0])
+
+    def find_runs(self, config: Dict, current_data: bool = True) -> pd.DataFrame:
+        """
+        查找相同配置的历史回测
+
+        Args:
+            config: 回测配置
+            current_data: 是否只返回与当前数据版本相同的回测（即结果仍然有效）
+
+        Returns:
+            DataFrame: 匹配的回测，按写入时间从新到旧排列
+        """
+        self.flush()
+        query = 'SELECT run_id, sweep_id, run_name, data_version, status, created_at FROM backtest_run WHERE config_hash = ?'
+        params = [config_hash(config)]
+        if current_data:
+            query += ' AND data_version = ?'
+            params.append(self.data_version(config))
+        return pd.read_sql_query(query + ' ORDER BY run_id DESC', self._conn, params=params)
@@ -0,0 +1,117 @@
+"""
+滚动窗口指标模块
+在一次线性扫描中计算净值曲线每个日期上过去N年的年化收益率、波动率和最大回撤
+"""
+import numpy as np
+import pandas as pd
+from portfolio.performance_metrics import infer_periods_per_year
+
+
+def _combine(left: tuple, right: tuple) -> tuple:
+    """合并两个相邻区间的摘要 (最大值, 最小值, 最大回撤)，left 在前"""
+    return (
+        max(left[0], right[0]),
+        min(left[1], right[1]),
+        min(left[2], right[2], right[1] / left[0] - 1),
+    )
+
+
+class _SlidingDrawdownQueue:
+    """
+    滑动窗口最大回撤
+
+    区间摘要 (最大值, 最小值, 最大回撤) 的合并满足结合律但不可重叠，
+    因此用双栈队列维护：入队和出队均摊 O(1)，随时可以得到整个窗口的最大回撤。
+    """
+
+    def __init__(self):
+        self._front = []  # 出队栈，保存 (值, 该元素到出队栈底所有元素的摘要)
+        self._back = []  # 入队栈，只保存值
+        self._back_summary = None
+
+    def push(self, value: float) -> None:
+        single = (value, value, 0.0)
+        self._back.append(value)
+        self._back_summary = single if self._back_summary is None else _combine(self._back_summary, single)
+
+    def pop(self) -> None:
+        if not self._front:
+            # 把入队栈倒入出队栈，同时计算每个位置到窗口末尾（入队栈顶）的后缀摘要
+            summary = None
+            while self._back:
+                value = self._back.pop()
+                single = (value, value, 0.0)
+                summary = single if summary is None else _combine(single, summary)
+                self._front.append((value, summary))
+            self._back_summary = None
+        self._front.pop()
+
+    def max_drawdown(self) -> float:
+        if not self._front:
+            return self._back_summary[2]
+        if self._back_summary is None:
+            return self._front[-1][1][2]
+        return _combine(self._front[-1][1], self._back_summary)[2]
+
+
+def calculate_rolling_metrics(series: pd.Series, window_years: int = 5) -> pd.DataFrame:
+    """
+    计算净值曲线在每个日期上过去 window_years 年的滚动指标
+
+    收益率和波动率用前缀和在 O(1) 内得到，最大回撤用滑动窗口队列均摊 O(1) 得到，
+    整条曲线只扫描一次。
+
+    Args:
+        series: 以日期为索引的净值序列，如回测结果的 total_value
+        window_years: 窗口长度（年）
+
+    Returns:
+        DataFrame: 与 series 索引对齐，历史不足一个完整窗口的日期为NaN：
+            - window_start: 窗口起始日期
+            - rolling_annualized_return: 窗口年化收益率
+            - rolling_volatility: 窗口年化波动率
+            - rolling_max_drawdown: 窗口最大回撤（负数）
+    """
+    index = series.index
+    values = series.to_numpy(dtype=float)
+    n = len(values)
+
+    # 每个日期对应窗口的起点：不早于 window_years 年前的第一个日期
+    window_starts = index - pd.DateOffset(years=window_years)
+    complete = window_starts >= index[0]
+    starts = np.searchsorted(index.values, window_starts.values, side='left')
+
+    # 年化收益率
+    days = (index.values - index.values[starts]) / np.timedelta64(1, 'D')
+    with np.errstate(divide='ignore', invalid='ignore'):
+        annualized_return = (values / values[starts]) ** (365 / days) - 1
+
+    # 对数收益率的前缀和与平方前缀和，先去均值以减小相减时的精度损失
+    log_returns = np.diff(np.log(values))
+    centered = log_returns - log_returns.mean() if len(log_returns) else log_returns
+    prefix_sum = np.concatenate(([0.0], np.cumsum(centered)))
+    prefix_square_sum = np.concatenate(([0.0], np.cumsum(centered ** 2)))
+    count = np.arange(n) - starts
+    window_sum = prefix_sum - prefix_sum[starts]
+    window_square_sum = prefix_square_sum - prefix_square_sum[starts]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        variance = (window_square_sum - window_sum ** 2 / count) / (count - 1)
+    volatility = np.sqrt(np.maximum(variance, 0.0) * infer_periods_per_year(index))
+
+    # 滑动窗口最大回撤：窗口起点单调不减，每个元素只入队、出队各一次
+    max_drawdown = np.full(n, np.nan)
+    queue = _SlidingDrawdownQueue()
+    window_head = 0
+    for end in range(n):
+        queue.push(values[end])
+        while window_head < starts[end]:
+            queue.pop()
+            window_head += 1
+        max_drawdown[end] = queue.max_drawdown()
+
+    return pd.DataFrame({
+        'window_start': np.where(complete, index.values[starts], np.datetime64('NaT')),
+        'rolling_annualized_return': np.where(complete, annualized_return, np.nan),
+        'rolling_volatility': np.where(complete, volatility, np.nan),
+        'rolling_max_drawdown': np.where(complete, max_drawdown, np.nan),
+    }, index=index)
@@ -4,7 +4,7 @@
 这个脚本用于对投资组合进行多个时间段的回测分析，通过在不同起始时间点进行回测，
 来评估投资组合策略的稳定性和可靠性。
 
-主要功能：
+主要功能（配置和滚动窗口从 experiments/different_time.json 读取）：
 1. 从2013年8月1日开始，每月1日作为起始时间点进行回测
 2. 每个回测周期为5年
 3. 计算每个回测周期的年化收益率和最大回撤
@@ -25,66 +25,27 @@
 1. 所有回测时间段的年化收益率统计
 2. 所有回测时间段的最大回撤统计
 """
-from pprint import pprint
-from datetime import datetime, timedelta
-from dateutil.relativedelta import relativedelta
+import os
 import statistics
-from portfolio.portfolio_backtest import PortfolioBacktest, check_portfolio_config
-from portfolio.portfolio_analyzer import PortfolioAnalyzer
-from portfolio.portfolio_visualizer import PortfolioVisualizer
-from common.trading_products import TRADING_PRODUCTS
+from portfolio.experiment_runner import EXPERIMENTS_DIR, expand_experiments, load_experiment_file, run_experiments
 
-
-CONFIG = {
-    'target_percentage': {
-        'SPY': 0.2,  # 标普500ETF
-        '090010': 0.2,   # 大成中证红利
-        '518880': 0.2,  # 黄金ETF
-        '070009': 0.4,  # 嘉实超短债债券基金
-    },
-    'start_date': '2013-08-01',
-    'end_date': '2025-04-30',
-    'initial_total_value': 100000,
-    'rebalance_strategy': 'DRIFT_REBALANCE', # 可选参数为'DRIFT_REBALANCE'或'ANNUAL_REBALANCE'或者'NO_REBALANCE'
-    'drift_threshold': 0.2 # 当某个资产的持仓价值偏离预设值的20%时进行再平衡, 当rebalance_strategy为'DRIFT_REBALANCE'时有效
-}
+EXPERIMENT_FILE = os.path.join(EXPERIMENTS_DIR, 'different_time.json')
 
 
 if __name__ == "__main__":
+    # 从2013-08-01开始，每月1日，回测5年，最大为 2020-04-01，各窗口共享一次加载的价格数据
+    runs = expand_experiments(load_experiment_file(EXPERIMENT_FILE), source=os.path.basename(EXPERIMENT_FILE))
+
     anualized_return_list = []
     max_drawdown_list = []
-
-    # 从2013-08-01开始，每月1日，回测5年，最大为 2020-04-01
-    start_date_list = []
-    start_date = datetime.strptime('2013-08-01', '%Y-%m-%d')
-    end_date = datetime.strptime('2020-04-01', '%Y-%m-%d')
-
-    while start_date <= end_date:
-        start_date_list.append(start_date.strftime('%Y-%m-%d'))
-        start_date += relativedelta(months=1)    
-
-
-    for start_date in start_date_list:
-        CONFIG['start_date'] = start_date
-        #end_date 为start_date + 5年, 保持格式为'YYYY-MM-DD'
-        CONFIG['end_date'] = (datetime.strptime(start_date, '%Y-%m-%d') + timedelta(days=365*5)).strftime('%Y-%m-%d')
-        
-
-        # 创建回测实例  
-        backtest = PortfolioBacktest(CONFIG)
-            
-        # 运行回测
-        backtest.run_backtest()
-
-        # 创建分析器实例
-        analyzer = PortfolioAnalyzer(backtest.get_results())
-
-        # 分析结果
-        portfolio_return_analysis = analyzer.calculate_portfolio_return()
+    for record in run_experiments(runs):
+        if record['status'] != 'ok':
+            print(f"{record['run']}: {record['error']}")
+            exit(1)
 
         # 保留两位小数
-        anualized_return_list.append(round(portfolio_return_analysis['annualized_portfolio_return']*100, 2)) 
-        max_drawdown_list.append(round(analyzer.calculate_portfolio_max_drawdown()[0]['max_drawdown'], 2)) 
+        anualized_return_list.append(round(record['metrics']['annualized_return']*100, 2))
+        max_drawdown_list.append(round(record['max_drawdowns'][0]['max_drawdown'], 2))
 
     print("-"*100)
     print("年化收益率:", anualized_return_list)
@@ -2,12 +2,12 @@
 投资组合单次回测脚本
 
 本脚本用于执行单个投资组合配置的回测，并生成可视化分析结果。
-使用固定的投资组合配置：
+投资组合配置从 experiments/single_portfolio.yaml 读取：
 
 - 标普500ETF(SPY): 20%
 - 大成中证红利(090010): 20%
-- 黄金ETF(518880): 20%
-- 嘉实超短债债券基金(070009): 40%
+- 黄金ETF(518880): 15%
+- 嘉实超短债债券基金(070009): 45%
 
 回测参数：
 - 时间范围: 2013-08-01 至 2025-04-30
@@ -22,42 +22,28 @@
 2. 可视化图表：
    - 生成portfolio_return_analysis.png文件，展示投资组合收益走势
 """
-
-from pprint import pprint
+import os
+from portfolio.experiment_runner import EXPERIMENTS_DIR, expand_experiments, load_experiment_file
 from portfolio.portfolio_backtest import PortfolioBacktest, check_portfolio_config
 from portfolio.portfolio_analyzer import PortfolioAnalyzer
 from portfolio.portfolio_visualizer import PortfolioVisualizer
-from common.trading_products import TRADING_PRODUCTS
-
-CONFIG = {
-    'target_percentage': {
-        'SPY': 0.20,  # 标普500ETF
-        '090010': 0.2,   # 大成中证红利
-        '518880': 0.15,  # 黄金ETF
-        '070009': 0.45,  # 嘉实超短债债券基金
-    },
-    'start_date': '2013-08-01',
-    'end_date': '2025-04-30',
-    'initial_total_value': 100000,
-    'rebalance_strategy': 'DRIFT_REBALANCE', # 可选参数为'DRIFT_REBALANCE'或'ANNUAL_REBALANCE'或者'NO_REBALANCE'
-    'drift_threshold': 0.2 # 当某个资产的持仓价值偏离预设值的20%时进行再平衡, 当rebalance_strategy为'DRIFT_REBALANCE'时有效
-}
-
-
 
+EXPERIMENT_FILE = os.path.join(EXPERIMENTS_DIR, 'single_portfolio.yaml')
 
 
 if __name__ == "__main__":
 
+    # 读取配置，文件中只有一个组合
+    config = expand_experiments(load_experiment_file(EXPERIMENT_FILE))[0]['config']
+
     # 检查配置
-    error_code, error_msg = check_portfolio_config(CONFIG)
+    error_code, error_msg = check_portfolio_config(config)
     if error_code != 0:
         print(error_msg)
         exit(error_code)
 
-
     # 创建回测实例
-    backtest = PortfolioBacktest(CONFIG)
+    backtest = PortfolioBacktest(config)
         
     # 运行回测
     backtest.run_backtest()
@@ -119,4 +105,4 @@ if __name__ == "__main__":
 # 最大回撤分析:
 # 第1大回撤 - 回撤幅度: -11.68%, 持续时间: 22天，恢复时间: 76天
 # 第2大回撤 - 回撤幅度: -10.58%, 持续时间: 53天，恢复时间: 325天
-# 第3大回撤 - 回撤幅度: -6.09%, 持续时间: 237天，恢复时间: 45天
\ No newline at end of file
+# 第3大回撤 - 回撤幅度: -6.09%, 持续时间: 237天，恢复时间: 45天
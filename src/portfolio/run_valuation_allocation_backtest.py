@@ -0,0 +1,81 @@
+"""
+估值择时配置回测脚本
+
+本脚本根据标普500的PE-TTM历史百分位调整SPY的目标持仓比例，
+并扫描不同的高估阈值，比较其对组合表现的影响。
+
+基础配置：
+- 标普500ETF(SPY): 20%
+- 大成中证红利(090010): 20%
+- 黄金ETF(518880): 20%
+- 嘉实超短债债券基金(070009): 40%
+
+估值规则：
+- PE-TTM百分位不低于高估阈值时，SPY降至5%，多出的比例转入超短债
+- 其余时间使用基础配置
+
+PE-TTM百分位只计算一次并在进程内缓存，扫描阈值时每个变体只需要重新映射目标比例并回测。
+
+输出结果包括：
+- 每个阈值下的年化收益率
+- 每个阈值下的最大回撤
+"""
+import copy
+from portfolio.portfolio_backtest import PortfolioBacktest, check_portfolio_config
+from portfolio.portfolio_analyzer import PortfolioAnalyzer
+
+CONFIG = {
+    'target_percentage': {
+        'SPY': 0.2,  # 标普500ETF
+        '090010': 0.2,   # 大成中证红利
+        '518880': 0.2,  # 黄金ETF
+        '070009': 0.4,  # 嘉实超短债债券基金
+    },
+    'start_date': '2013-08-01',
+    'end_date': '2025-04-30',
+    'initial_total_value': 100000,
+    'rebalance_strategy': 'DRIFT_REBALANCE', # 可选参数为'DRIFT_REBALANCE'或'ANNUAL_REBALANCE'或者'NO_REBALANCE'
+    'drift_threshold': 0.2, # 当某个资产的持仓价值偏离预设值的20%时进行再平衡, 当rebalance_strategy为'DRIFT_REBALANCE'时有效
+    'valuation_allocation': {
+        'signal_symbol': 'SPY',  # 使用SPY的PE-TTM作为估值序列
+        'window_years': None,  # None表示与全部历史比较，如10表示与最近10年比较
+        'tiers': [
+            {
+                'min_percentile': 0.9,  # 估值处于历史最高的10%
+                'target_percentage': {
+                    'SPY': 0.05,
+                    '090010': 0.2,
+                    '518880': 0.2,
+                    '070009': 0.55,
+                },
+            },
+        ],
+    },
+}
+
+# 需要扫描的高估阈值
+THRESHOLDS = [0.7, 0.75, 0.8, 0.85, 0.9, 0.95]
+
+
+if __name__ == "__main__":
+    # 检查配置
+    error_code, error_msg = check_portfolio_config(CONFIG)
+    if error_code != 0:
+        print(error_msg)
+        exit(error_code)
+
+    print("高估阈值\t年化收益率\t最大回撤")
+    for threshold in THRESHOLDS:
+        config = copy.deepcopy(CONFIG)
+        config['valuation_allocation']['tiers'][0]['min_percentile'] = threshold
+
+        # 创建回测实例并运行回测
+        backtest = PortfolioBacktest(config)
+        backtest.run_backtest()
+
+        # 分析结果
+        analyzer = PortfolioAnalyzer(backtest.get_results())
+        portfolio_return_analysis = analyzer.calculate_portfolio_return()
+        max_drawdown = analyzer.calculate_portfolio_max_drawdown()[0]['max_drawdown']
+
+        print(f"{threshold:.2f}\t\t{portfolio_return_analysis['annualized_portfolio_return']*100:.2f}%\t\t{max_drawdown:.2f}%")
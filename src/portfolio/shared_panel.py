@@ -0,0 +1,116 @@
+"""
+共享内存价格面板模块
+把对齐好的价格数据（load_portfolio_data 的格式）放入一块 multiprocessing.shared_memory，
+多个工作进程按描述信息直接映射同一块内存，得到只读的 NumPy 视图和 DataFrame，不再各自加载和复制一份数据
+
+内存布局：前 rows 个 int64 为日期（纳秒时间戳），之后是 rows × len(columns) 的 float64 价格矩阵（行优先）。
+描述信息只包含共享内存名称、列名和行数，可以随任务参数传给子进程。
+
+使用方法：
+    with SharedPricePanel.publish(price_data) as panel:
+        executor = ProcessPoolExecutor(initializer=init, initargs=(panel.descriptor,))
+        ...
+    # 子进程中
+    panel = SharedPricePanel.attach(descriptor)
+    PortfolioBacktest(config, price_data=panel.to_frame())
+"""
+import sys
+from multiprocessing import shared_memory
+from typing import Dict, List
+import numpy as np
+import pandas as pd
+
+_DATE_SIZE = np.dtype('int64').itemsize
+_VALUE_SIZE = np.dtype('float64').itemsize
+
+
+class SharedPricePanel:
+    def __init__(self, shm: shared_memory.SharedMemory, columns: List[str], rows: int, index_name, owner: bool):
+        """
+        一般通过 publish 或 attach 创建
+
+        Args:
+            shm: 保存面板数据的共享内存
+            columns: 价格矩阵的列名
+            rows: 交易日数量
+            index_name: 日期索引的名称
+            owner: 是否由当前进程创建（close 时负责释放共享内存）
+        """
+        self.shm = shm
+        self.columns = list(columns)
+        self.rows = rows
+        self.index_name = index_name
+        self.owner = owner
+        self.dates = np.ndarray((rows,), dtype='int64', buffer=shm.buf)
+        self.values = np.ndarray((rows, len(self.columns)), dtype='float64', buffer=shm.buf,
+                                 offset=rows * _DATE_SIZE)
+        if not owner:
+            self.dates.flags.writeable = False
+            self.values.flags.writeable = False
+
+    @classmethod
+    def publish(cls, price_data: pd.DataFrame) -> 'SharedPricePanel':
+        """
+        把价格数据复制到新建的共享内存中
+
+        Args:
+            price_data: 以日期为索引、每列为一个价格序列的数据
+
+        Returns:
+            SharedPricePanel: 拥有共享内存的面板，用完后调用 close 释放
+        """
+        rows, cols = price_data.shape
+        size = max(1, rows * _DATE_SIZE + rows * cols * _VALUE_SIZE)
+        shm = shared_memory.SharedMemory(create=True, size=size)
+        panel = cls(shm, price_data.columns, rows, price_data.index.name, owner=True)
+        panel.dates[:] = pd.DatetimeIndex(price_data.index).as_unit('ns').asi8
+        panel.values[:] = price_data.to_numpy(dtype='float64')
+        panel.dates.flags.writeable = False
+        panel.values.flags.writeable = False
+        return panel
+
+    @classmethod
+    def attach(cls, descriptor: Dict) -> 'SharedPricePanel':
+        """
+        按描述信息映射已发布的面板，不复制数据
+
+        Args:
+            descriptor: 发布方 descriptor 属性的值
+
+        Returns:
+            SharedPricePanel: 只读的面板
+        """
+        if sys.version_info >= (3, 13):
+            # 由发布方负责释放，附加方不登记到 resource_tracker
+            shm = shared_memory.SharedMemory(name=descriptor['name'], track=False)
+        else:
+            shm = shared_memory.SharedMemory(name=descriptor['name'])
+        return cls(shm, descriptor['columns'], descriptor['rows'], descriptor['index_name'], owner=False)
+
+    @property
+    def descriptor(self) -> Dict:
+        """子进程附加时需要的描述信息"""
+        return {'name': self.shm.name, 'columns': self.columns, 'rows': self.rows, 'index_name': self.index_name}
+
+    def to_frame(self) -> pd.DataFrame:
+        """
+        以共享内存为底层数据的 DataFrame，只读，格式与发布时的价格数据相同
+
+        Returns:
+            DataFrame: 修改前需要先 copy
+        """
+        index = pd.DatetimeIndex(self.dates.view('datetime64[ns]'), name=self.index_name)
+        return pd.DataFrame(self.values, index=index, columns=self.columns, copy=False)
+
+    def close(self) -> None:
+        """断开映射，发布方同时释放共享内存；之后不能再使用 to_frame 返回的 DataFrame"""
+        self.dates = self.values = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+    def __enter__(self) -> 'SharedPricePanel':
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
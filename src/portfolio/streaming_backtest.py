@@ -0,0 +1,151 @@
+"""
+流式回测模块
+逐块读取 DataLoader.iter_portfolio_chunks 返回的价格数据，用 NumPy 向量保存持仓状态，
+内存只与一个数据块和产品数量有关，适合数千个产品、几十年历史的回测
+
+再平衡规则与 PortfolioBacktest 相同（NO_REBALANCE、ANNUAL_REBALANCE、DRIFT_REBALANCE 和估值分档），
+总价值与 PortfolioBacktest 的 total_value 一致；为控制内存，只保留每天的总价值和最后一天的持仓，
+不保留每个产品每天的持仓数量和持仓价值。
+
+使用方法：
+    backtest = StreamingBacktest(config, chunk_days=365)
+    backtest.run_backtest()
+    PortfolioAnalyzer(backtest.get_results()).compute_all_metrics()
+"""
+import logging
+from typing import Dict, Iterator, Optional
+import numpy as np
+import pandas as pd
+from common.profiling import profiled
+from data_manager.price_aggregate_manager import DAILY
+from portfolio.data_loader import DataLoader
+from portfolio.valuation_allocation import get_valuation_percentile, build_target_weights, DEFAULT_LAG_DAYS
+
+logger = logging.getLogger(__name__)
+
+
+class StreamingBacktest:
+    def __init__(self, config: Dict, data_loader: Optional[DataLoader] = None, chunk_days: int = 365,
+                 price_data: Optional[pd.DataFrame] = None):
+        """
+        初始化流式回测
+
+        Args:
+            config: 回测配置字典，字段同 PortfolioBacktest，只支持日线（frequency 为 'D'）
+            data_loader: 数据加载器，默认使用 DB_PATH 指向的数据库
+            chunk_days: 每个数据块覆盖的自然日天数
+            price_data: 可选，已经加载好的价格数据（同 PortfolioBacktest），提供时作为一个数据块直接使用，不查询数据库
+        """
+        if config.get('frequency', DAILY) != DAILY:
+            raise ValueError("流式回测只支持日线数据")
+        self.config = config
+        self.data_loader = data_loader or DataLoader()
+        self.chunk_days = chunk_days
+        self.price_data = price_data
+        # 数据块的列按产品代码排序，持仓向量使用相同的顺序
+        self.symbols = sorted(config['target_percentage'])
+        self.total_value = None
+        self.final_shares = None
+
+    def _target_weights(self, dates: pd.DatetimeIndex) -> np.ndarray:
+        """数据块内每个交易日的目标持仓比例，列顺序与 self.symbols 相同"""
+        valuation_config = self.config.get('valuation_allocation')
+        if not valuation_config:
+            weights = np.array([self.config['target_percentage'][symbol] for symbol in self.symbols], dtype=float)
+            return np.broadcast_to(weights, (len(dates), len(self.symbols)))
+        percentile = get_valuation_percentile(valuation_config['signal_symbol'],
+                                              valuation_config.get('window_years'), self.data_loader)
+        return build_target_weights(percentile, dates, self.symbols, self.config['target_percentage'],
+                                    valuation_config['tiers'],
+                                    valuation_config.get('lag_days', DEFAULT_LAG_DAYS)).to_numpy()
+
+    def _iter_chunks(self) -> Iterator[pd.DataFrame]:
+        if self.price_data is None:
+            yield from self.data_loader.iter_portfolio_chunks(self.symbols, self.config['start_date'],
+                                                              self.config['end_date'], self.chunk_days)
+            return
+        # 与 PortfolioBacktest 从共享价格数据截取的方式相同
+        columns = [f"{symbol}_close" for symbol in self.symbols]
+        missing = [col for col in columns if col not in self.price_data.columns]
+        if missing:
+            raise ValueError(f"共享的价格数据中缺少 {missing}")
+        chunk = self.price_data.loc[self.config['start_date']:self.config['end_date'], columns].dropna(how='all')
+        if not chunk.empty:
+            yield chunk.ffill().bfill()
+
+    @profiled('StreamingBacktest.run_backtest')
+    def run_backtest(self) -> None:
+        """逐块运行回测，结果保存在 self.total_value 和 self.final_shares 中"""
+        rebalance_strategy = self.config['rebalance_strategy']
+        drift_threshold = self.config.get('drift_threshold')
+
+        shares = None
+        previous_weights = None
+        previous_values = None
+        previous_total = None
+        previous_month = None
+        dates = []
+        totals = []
+
+        for chunk in self._iter_chunks():
+            prices = chunk.to_numpy(dtype=float)
+            if shares is None:
+                missing = [symbol for symbol, price in zip(self.symbols, prices[0]) if np.isnan(price)]
+                if missing:
+                    raise ValueError(f"{missing} 在回测区间内没有数据")
+            weights = self._target_weights(chunk.index)
+            months = chunk.index.month
+
+            for i in range(len(prices)):
+                price = prices[i]
+                if shares is None:
+                    # 第一天按目标比例建仓
+                    shares = self.config['initial_total_value'] * weights[i] / price
+                    previous_total = float(self.config['initial_total_value'])
+                    values = shares * price
+                else:
+                    if (weights[i] != previous_weights).any():
+                        # 估值分档变化时，按新的目标持仓比例再平衡
+                        is_rebalance_day = True
+                    elif rebalance_strategy == 'ANNUAL_REBALANCE':
+                        is_rebalance_day = months[i] == 1 and previous_month == 12
+                    elif rebalance_strategy == 'DRIFT_REBALANCE':
+                        target_values = previous_weights * previous_total
+                        with np.errstate(divide='ignore', invalid='ignore'):
+                            drift = np.abs(previous_values - target_values) / target_values
+                        is_rebalance_day = bool(np.any(np.where(target_values == 0, previous_values > 0,
+                                                                drift > drift_threshold)))
+                    else:
+                        is_rebalance_day = False
+
+                    if is_rebalance_day:
+                        # 与 PortfolioBacktest 相同，用前一天的总价值按当天价格计算持仓数量
+                        shares = previous_total * weights[i] / price
+                    values = shares * price
+                    previous_total = float(values.sum())
+
+                previous_values = values
+                previous_weights = weights[i]
+                previous_month = months[i]
+                totals.append(previous_total)
+            dates.append(chunk.index)
+            logger.debug(f"完成 {chunk.index[0].date()} 到 {chunk.index[-1].date()} 的回测")
+
+        if shares is None:
+            raise ValueError("无法加载投资组合数据，请检查产品代码和日期范围")
+        self.total_value = pd.Series(totals, index=dates[0].append(dates[1:]), name='total_value')
+        self.final_shares = pd.Series(shares, index=self.symbols, name='share_number')
+
+    def get_results(self) -> pd.DataFrame:
+        """
+        获取回测结果
+
+        Returns:
+            DataFrame: 只包含 total_value 列，可直接交给 PortfolioAnalyzer 计算组合层面的指标
+        """
+        if self.total_value is None:
+            raise ValueError("请先运行回测")
+        results = self.total_value.to_frame()
+        results.attrs['symbols'] = []
+        results.attrs['frequency'] = DAILY
+        return results
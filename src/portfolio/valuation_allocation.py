@@ -0,0 +1,103 @@
+"""
+估值择时配置模块
+根据估值序列（如SPY的PE-TTM）的历史百分位，按分档规则给出每个交易日的目标持仓比例
+"""
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Optional
+from portfolio.data_loader import DataLoader
+from data_manager.pe_ttm_rank_manager import compute_percentile_ranks, load_pe_ttm_ranks
+
+# 日线回测默认使用前一个自然日及之前的估值：估值序列（如美股收盘后的PE-TTM）在当天收盘时可能还不可得
+DEFAULT_LAG_DAYS = 1
+
+# 估值百分位缓存，键为 (数据库路径, 产品代码, 窗口年数)，同一进程内的多次回测只计算一次
+_percentile_cache: Dict[tuple, pd.Series] = {}
+
+
+def compute_valuation_percentile(values: pd.Series, window_years: Optional[int] = None) -> pd.Series:
+    """
+    计算估值序列每个日期在历史中的百分位
+
+    每个日期只使用当天及之前的数据，百分位为历史中不高于当天估值的数据占比，
+    由 pe_ttm_rank_manager 中的树状数组引擎在 O(n log n) 内算出。
+
+    Args:
+        values: 以日期为索引的估值序列
+        window_years: 回看窗口（年），None 表示使用全部历史
+
+    Returns:
+        Series: 与 values 对齐的百分位，取值范围 (0, 1]
+    """
+    return compute_percentile_ranks(values, window_years)
+
+
+def get_valuation_percentile(symbol: str, window_years: Optional[int] = None,
+                             data_loader: Optional[DataLoader] = None) -> pd.Series:
+    """
+    获取某个产品全部历史的估值百分位，结果在进程内缓存
+
+    优先读取数据库中已保存的百分位（pe_ttm_rank 表），尚未保存时才根据PE-TTM数据计算。
+
+    Args:
+        symbol: 估值序列所属的产品代码，如 'SPY'
+        window_years: 回看窗口（年），None 表示使用全部历史
+        data_loader: 数据加载器，默认新建一个
+
+    Returns:
+        Series: 以日期为索引的百分位
+    """
+    data_loader = data_loader or DataLoader()
+    key = (data_loader.db_path, symbol, window_years)
+    if key not in _percentile_cache:
+        percentile = load_pe_ttm_ranks(symbol, window_years, db_path=data_loader.db_path)
+        if percentile.empty:
+            values = data_loader.load_valuation_data(symbol)
+            if values.empty:
+                raise ValueError(f"{symbol} 没有可用的PE-TTM数据")
+            percentile = compute_valuation_percentile(values, window_years)
+        _percentile_cache[key] = percentile
+    return _percentile_cache[key]
+
+
+def clear_percentile_cache() -> None:
+    """清空估值百分位缓存，估值数据更新后调用"""
+    _percentile_cache.clear()
+
+
+def build_target_weights(percentile: pd.Series, dates: pd.DatetimeIndex, symbols: List[str],
+                         default_percentage: Dict[str, float], tiers: List[Dict], lag_days: int = 0) -> pd.DataFrame:
+    """
+    根据估值百分位为每个交易日生成目标持仓比例
+
+    每个交易日使用 lag_days 个自然日之前或更早的最近一个估值日期的百分位，选择 min_percentile 不高于该百分位的
+    最高一档；没有匹配的档位或尚无估值数据时使用默认比例。
+
+    Args:
+        percentile: 以日期为索引的估值百分位
+        dates: 回测的交易日
+        symbols: 投资组合中的产品代码列表
+        default_percentage: 默认目标持仓比例
+        tiers: 估值分档，每档包含：
+            - min_percentile: float 该档生效的最低百分位，如 0.9 表示估值处于历史最高的10%
+            - target_percentage: Dict[str, float] 该档的目标持仓比例，未列出的产品比例为0
+        lag_days: 估值的执行延迟（自然日），0 表示使用当天的估值，1 表示只使用前一天及之前的估值
+
+    Returns:
+        DataFrame: 索引为交易日，列为产品代码
+    """
+    tiers = sorted(tiers, key=lambda tier: tier['min_percentile'])
+    thresholds = np.array([tier['min_percentile'] for tier in tiers], dtype=float)
+
+    # 每一档（第0行为默认比例）的目标比例矩阵
+    weight_table = np.array(
+        [[default_percentage.get(symbol, 0.0) for symbol in symbols]] +
+        [[tier['target_percentage'].get(symbol, 0.0) for symbol in symbols] for tier in tiers],
+        dtype=float
+    )
+
+    current = percentile.reindex(dates - pd.Timedelta(days=lag_days), method='ffill').to_numpy(dtype=float)
+    tier_index = np.searchsorted(thresholds, current, side='right')
+    tier_index[np.isnan(current)] = 0
+
+    return pd.DataFrame(weight_table[tier_index], index=dates, columns=symbols)
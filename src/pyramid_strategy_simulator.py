@@ -1,9 +1,7 @@
-import matplotlib.pyplot as plt
-import matplotlib as mpl
-
-# 设置中文字体
-plt.rcParams['font.sans-serif'] = ['SimHei']  # 用来正常显示中文标签
-plt.rcParams['axes.unicode_minus'] = False  # 用来正常显示负号
+import sys
+from datetime import date
+import numpy as np
+import pandas as pd
 
 class PyramidTradingSimulator:
     def __init__(self, params):
@@ -99,6 +97,196 @@ class PyramidTradingSimulator:
                 
         return self.history
     
+class PyramidHistoricalReplay:
+    """
+    金字塔加仓策略的历史回放
+
+    以历史每日收盘价为基础，把每一个交易日都当作一次入场日期，一次性计算所有入场日期下
+    各加仓点位的触发日期、加仓深度、投入资金以及回本时间。
+    加仓点位以入场日收盘价为基准；一轮加仓在价格重新回到入场价时结束。
+    所有入场日期通过稀疏表（区间最小/最大值）和倍增查找并行计算，没有逐日循环。
+    """
+
+    def __init__(self, params, closes: pd.Series):
+        """
+        Args:
+            params: 策略参数，与 PyramidTradingSimulator 相同（initial_price 不使用）
+                - total_capital: 总资金
+                - drop_points: 加仓点位（下跌百分比，负值）
+                - position_weights: 与加仓点位一一对应的仓位权重
+            closes: 以日期为索引的每日收盘价序列
+        """
+        if len(params['drop_points']) != len(params['position_weights']):
+            raise ValueError("加仓点位与仓位权重数量不匹配")
+        if any(p >= 0 for p in params['drop_points']):
+            raise ValueError("加仓点位应为负值（下跌百分比）")
+
+        closes = closes.dropna().sort_index()
+        if closes.empty:
+            raise ValueError("没有可用于回放的收盘价数据")
+
+        # 加仓点位与权重一起按下跌幅度排序，保证逐级加深
+        ladder = sorted(zip(params['drop_points'], params['position_weights']), key=lambda x: abs(x[0]))
+        self.drop_points = np.array([p for p, _ in ladder], dtype=float)
+        self.position_weights = np.array([w for _, w in ladder], dtype=float)
+        self.total_capital = params['total_capital']
+        self.unit_value = self.total_capital / self.position_weights.sum()
+
+        self.dates = closes.index.values
+        self.closes = closes.to_numpy(dtype=float)
+        self._min_table = self._build_sparse_table(self.closes, np.minimum)
+        self._max_table = self._build_sparse_table(self.closes, np.maximum)
+
+    @staticmethod
+    def _build_sparse_table(values: np.ndarray, op) -> list:
+        """构建稀疏表，第k层第i个元素为 values[i:i+2^k] 的区间最值"""
+        table = [values]
+        k = 1
+        while (1 << k) <= len(values):
+            half = 1 << (k - 1)
+            table.append(op(table[-1][:-half], table[-1][half:]))
+            k += 1
+        return table
+
+    def _first_index(self, starts: np.ndarray, thresholds: np.ndarray, below: bool) -> np.ndarray:
+        """
+        对每个起点并行查找第一个满足条件的位置
+
+        below为True时查找 close <= threshold，否则查找 close >= threshold；
+        找不到时返回序列长度n。
+        """
+        n = len(self.closes)
+        table = self._min_table if below else self._max_table
+        pos = starts.copy()
+        # 倍增：从大到小跳过整段都不满足条件的区间
+        for k in range(len(table) - 1, -1, -1):
+            size = 1 << k
+            valid = pos + size <= n
+            block = table[k][np.where(valid, pos, 0)]
+            fails = block > thresholds if below else block < thresholds
+            pos = np.where(valid & fails, pos + size, pos)
+        return pos
+
+    def _range_min(self, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+        """区间 [start, end) 的最小收盘价，要求 end > start"""
+        k = np.floor(np.log2(ends - starts)).astype(int)
+        result = np.empty(len(starts))
+        for level in np.unique(k):
+            mask = k == level
+            table = self._min_table[level]
+            result[mask] = np.minimum(table[starts[mask]], table[ends[mask] - (1 << level)])
+        return result
+
+    def run(self) -> pd.DataFrame:
+        """
+        对所有入场日期回放加仓策略
+
+        Returns:
+            DataFrame: 以入场日期为索引，每行一个入场日期，包含：
+                - entry_price: 入场日收盘价
+                - levels_filled: 触发的加仓次数
+                - fill_depth_pct: 触发的最深加仓点位(%)，未触发为NaN
+                - max_drawdown_pct: 本轮（入场至回到入场价）期间相对入场价的最大跌幅(%)
+                - capital_deployed / capital_deployed_pct: 投入资金及其占总资金比例
+                - avg_cost: 平均持仓成本
+                - first_fill_date / last_fill_date: 首次与最后一次加仓日期
+                - breakeven_date: 最后一次加仓之后首次回到平均成本的日期
+                - days_to_breakeven: 首次加仓至回本的自然日天数
+                - days_to_recover_entry: 首次加仓至回到入场价的自然日天数
+        """
+        n = len(self.closes)
+        starts = np.arange(n)
+        entry_prices = self.closes
+
+        # 每个加仓点位的触发位置
+        triggers = np.stack([
+            self._first_index(starts, entry_prices * (1 + drop_pct / 100), below=True)
+            for drop_pct in self.drop_points
+        ])
+        first_fill = triggers[0]
+        has_fill = first_fill < n
+
+        # 首次加仓后价格回到入场价，本轮结束
+        episode_end = np.full(n, n)
+        episode_end[has_fill] = self._first_index(first_fill[has_fill], entry_prices[has_fill], below=False)
+
+        filled = triggers < episode_end
+        levels_filled = filled.sum(axis=0)
+
+        investments = (self.position_weights * self.unit_value)[:, None] * filled
+        fill_prices = self.closes[np.minimum(triggers, n - 1)]
+        shares = np.where(filled, investments / fill_prices, 0.0)
+        capital_deployed = investments.sum(axis=0)
+        total_shares = shares.sum(axis=0)
+        avg_cost = np.full(n, np.nan)
+        avg_cost[has_fill] = capital_deployed[has_fill] / total_shares[has_fill]
+
+        last_fill = np.where(filled, triggers, -1).max(axis=0)
+        breakeven = np.full(n, n)
+        breakeven[has_fill] = self._first_index(last_fill[has_fill] + 1, avg_cost[has_fill], below=False)
+
+        # 本轮期间（未触发加仓时为入场至数据结束）相对入场价的最大跌幅
+        max_drawdown_pct = (self._range_min(starts, episode_end) / entry_prices - 1) * 100
+
+        fill_depth_pct = np.full(n, np.nan)
+        fill_depth_pct[has_fill] = self.drop_points[levels_filled[has_fill] - 1]
+
+        def to_dates(positions):
+            found = positions < n
+            result = np.full(n, np.datetime64('NaT'), dtype='datetime64[ns]')
+            result[found] = self.dates[positions[found]]
+            return result
+
+        first_fill_dates = to_dates(first_fill)
+        breakeven_dates = to_dates(breakeven)
+        recover_dates = to_dates(episode_end)
+
+        return pd.DataFrame({
+            'entry_price': entry_prices,
+            'levels_filled': levels_filled,
+            'fill_depth_pct': fill_depth_pct,
+            'max_drawdown_pct': max_drawdown_pct,
+            'capital_deployed': capital_deployed,
+            'capital_deployed_pct': capital_deployed / self.total_capital,
+            'avg_cost': avg_cost,
+            'first_fill_date': first_fill_dates,
+            'last_fill_date': to_dates(np.where(last_fill >= 0, last_fill, n)),
+            'breakeven_date': breakeven_dates,
+            'days_to_breakeven': (breakeven_dates - first_fill_dates) / np.timedelta64(1, 'D'),
+            'days_to_recover_entry': (recover_dates - first_fill_dates) / np.timedelta64(1, 'D'),
+        }, index=pd.DatetimeIndex(self.dates, name='entry_date'))
+
+    @staticmethod
+    def summarize(results: pd.DataFrame) -> dict:
+        """
+        汇总所有入场日期的回放结果分布
+
+        Args:
+            results: run() 返回的DataFrame
+
+        Returns:
+            dict: 包含加仓次数分布、投入资金比例和回本天数的分布统计
+        """
+        filled = results[results['levels_filled'] > 0]
+        return {
+            'entry_count': len(results),
+            'levels_filled_distribution': results['levels_filled'].value_counts(normalize=True).sort_index(),
+            'capital_deployed_pct': filled['capital_deployed_pct'].describe(),
+            'days_to_breakeven': filled['days_to_breakeven'].describe(),
+            'unrecovered_ratio': filled['breakeven_date'].isna().mean() if len(filled) else float('nan'),
+        }
+
+
+def load_replay_closes(symbol: str) -> pd.Series:
+    """从数据库加载某个产品的全部历史收盘价"""
+    from common.trading_products import TRADING_PRODUCTS
+    from portfolio.data_loader import DataLoader
+
+    product_info = TRADING_PRODUCTS[symbol]
+    data = DataLoader().load_portfolio_data([symbol], product_info['earliest_date'], date.today().strftime('%Y-%m-%d'))
+    return data[f"{symbol}_close"]
+
+
 # 策略参数配置（示例）
 strategy_params = {
     'total_capital': 1000000,     # 总资金100万元
@@ -109,18 +297,51 @@ strategy_params = {
     # 'position_weights': [3, 5, 7, 4, 1]      # 仓位权重
 }
 
-# 执行策略
-simulator = PyramidTradingSimulator(strategy_params)
-history = simulator.execute()
-
-# 输出最终状态
-final_price = simulator.current_price
-final_value = simulator.total_shares * final_price
-total_invested = simulator.total_capital - simulator.remaining_capital
-
-print(f"\n{'='*40}\n策略执行结束:")
-print(f"🏦 剩余资金: {simulator.remaining_capital:.2f}")
-print(f"📈 持仓市值: {final_value:.2f}")
-print(f"💰 总投入资金: {total_invested:.2f}")
-print(f"📉 最终浮亏: {history[-1]['post_loss']:.2f} ({history[-1]['post_loss_pct']:.2%})")
-print(f"🔢 平均持仓成本: {simulator.avg_cost:.2f}")
\ No newline at end of file
+# 历史回放的产品列表
+REPLAY_SYMBOLS = ['SPY', 'QQQ', '510300']
+
+
+def run_hypothetical_simulation(params):
+    """按假设价格执行加仓策略并输出最终状态"""
+    # 执行策略
+    simulator = PyramidTradingSimulator(params)
+    history = simulator.execute()
+
+    # 输出最终状态
+    final_price = simulator.current_price
+    final_value = simulator.total_shares * final_price
+    total_invested = simulator.total_capital - simulator.remaining_capital
+
+    print(f"\n{'='*40}\n策略执行结束:")
+    print(f"🏦 剩余资金: {simulator.remaining_capital:.2f}")
+    print(f"📈 持仓市值: {final_value:.2f}")
+    print(f"💰 总投入资金: {total_invested:.2f}")
+    print(f"📉 最终浮亏: {history[-1]['post_loss']:.2f} ({history[-1]['post_loss_pct']:.2%})")
+    print(f"🔢 平均持仓成本: {simulator.avg_cost:.2f}")
+
+
+def run_historical_replay(params, symbols):
+    """按历史收盘价回放加仓策略并输出各入场日期结果的分布"""
+    for symbol in symbols:
+        replay = PyramidHistoricalReplay(params, load_replay_closes(symbol))
+        results = replay.run()
+        summary = PyramidHistoricalReplay.summarize(results)
+
+        print(f"{'='*40}\n{symbol} 历史回放: {results.index[0].date()} 至 {results.index[-1].date()}，共 {summary['entry_count']} 个入场日期")
+        print("\n加仓次数分布:")
+        for levels, ratio in summary['levels_filled_distribution'].items():
+            print(f"  {levels} 次: {ratio:.2%}")
+        print("\n投入资金比例（触发加仓的入场日期）:")
+        print(summary['capital_deployed_pct'].to_string())
+        print("\n首次加仓至回本天数:")
+        print(summary['days_to_breakeven'].to_string())
+        print(f"\n尚未回本比例: {summary['unrecovered_ratio']:.2%}")
+
+
+if __name__ == "__main__":
+    # python pyramid_strategy_simulator.py            按假设价格模拟
+    # python pyramid_strategy_simulator.py replay SPY  按历史收盘价回放
+    if len(sys.argv) > 1 and sys.argv[1] == 'replay':
+        run_historical_replay(strategy_params, sys.argv[2:] or REPLAY_SYMBOLS)
+    else:
+        run_hypothetical_simulation(strategy_params)
@@ -0,0 +1,81 @@
+"""
+导入耗时测试
+回测路径上的模块只应依赖 pandas/numpy，matplotlib、akshare、yaml 等重依赖在第一次使用时才导入，
+导入时也不应配置日志处理器等全局状态
+
+运行方法（在 src 目录下）：
+    python -m pytest test/test_import_time.py
+"""
+import json
+import os
+import subprocess
+import sys
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 回测路径上的模块，包括各个 run_* 脚本（只导入，不执行 __main__ 部分）
+BACKTEST_PATH_MODULES = [
+    'portfolio.portfolio_backtest',
+    'portfolio.portfolio_analyzer',
+    'portfolio.portfolio_visualizer',
+    'portfolio.batch_analyzer',
+    'portfolio.experiment_runner',
+    'portfolio.streaming_backtest',
+    'portfolio.backtest_service',
+    'portfolio.report_builder',
+    'portfolio.run_single_portfolio_backtest',
+    'portfolio.run_compare_a_share_index',
+    'portfolio.run_compare_rebalance_strategies',
+    'portfolio.run_different_time_backtest',
+    'portfolio.run_valuation_allocation_backtest',
+    'data_manager.market_data_manager',
+]
+
+# 只能在第一次使用时导入的重依赖
+LAZY_MODULES = ['matplotlib', 'akshare', 'yaml']
+
+# 在已经导入 pandas 和 numpy 的进程中，导入以上全部模块的耗时上限（秒）
+IMPORT_BUDGET_SECONDS = 0.25
+
+_MEASURE_SCRIPT = """
+import json, logging, sys, time
+import numpy, pandas
+start = time.perf_counter()
+for name in {modules!r}:
+    __import__(name)
+elapsed = time.perf_counter() - start
+print(json.dumps({{
+    'elapsed': elapsed,
+    'lazy_loaded': [name for name in {lazy!r} if name in sys.modules],
+    'backtest_handlers': len(logging.getLogger('portfolio.portfolio_backtest').handlers),
+}}))
+"""
+
+
+def _measure_import(repeat: int = 3) -> dict:
+    """在新的解释器中导入回测路径上的模块，取多次测量中耗时最短的一次"""
+    script = _MEASURE_SCRIPT.format(modules=BACKTEST_PATH_MODULES, lazy=LAZY_MODULES)
+    env = {**os.environ, 'PYTHONPATH': SRC_DIR}
+    env.pop('MY_TRADE_PROFILE', None)
+    results = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', script], cwd=SRC_DIR, env=env,
+                                capture_output=True, text=True, check=True).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    return min(results, key=lambda result: result['elapsed'])
+
+
+def test_heavy_modules_are_imported_lazily():
+    result = _measure_import(repeat=1)
+    assert result['lazy_loaded'] == []
+
+
+def test_import_has_no_logging_side_effects():
+    result = _measure_import(repeat=1)
+    assert result['backtest_handlers'] == 0
+
+
+def test_import_time_budget():
+    result = _measure_import()
+    assert result['elapsed'] < IMPORT_BUDGET_SECONDS, \
+        f"回测路径导入耗时 {result['elapsed']:.3f}s，超过 {IMPORT_BUDGET_SECONDS}s 的上限"